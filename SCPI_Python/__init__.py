@@ -0,0 +1,5 @@
+"""
+Helper modules and tools for the A1570 EMAT device, installed as the a1570 package.
+
+Run from the SCPI_Python folder, the package is provided by a1570.py instead.
+"""
@@ -0,0 +1,11 @@
+"""
+Makes the modules of this folder importable as the a1570 package without installing it.
+
+The example scripts and tests are run from this folder and import e.g.
+a1570.common_functions, the same names as with the installed package.
+"""
+
+import os
+
+# a module with __path__ is a package, the submodules are found in this folder
+__path__ = [os.path.dirname(os.path.abspath(__file__))]
@@ -0,0 +1,392 @@
+"""
+Config-driven command line interface for the A1570 EMAT device.
+
+The measurement examples hard-code IP addresses, probe types, velocities and loop
+counts. This CLI reads them from a JSON job file instead and runs all jobs in one
+process. Every device is connected once and the connection is reused by all jobs
+of the run.
+
+Job types:
+- measure: configure the device, apply a cached calibration, poll results and store them as CSV
+- capture: capture A-scans with fixed acquisition parameters into a sweep archive
+- sweep: grid or adaptive sweep of acquisition parameters into a sweep archive
+- calibrate: manual calibration in air and on the object, or calibration values from the job,
+  stored in the calibration cache
+- view: plot the blocks of a sweep archive (no device needed)
+
+See a1570_jobs.example.json for the job file format. Device settings are given by the
+names of scpi_commands.COMMANDS, e.g. {"gain": 15, "trigger_interval": [250, "MS"]}.
+Job types, devices and settings of the whole file are checked before the first job runs.
+
+Usage:
+    a1570 run jobs.json                  # all jobs in order
+    a1570 measure jobs.json              # only the measure jobs
+    a1570 run jobs.json --job pulse_s3850 --job sweep_coarse
+"""
+
+import argparse
+import json
+import logging
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+from a1570.calibration_cache import (CalibrationData, CalibrationStore, apply_calibration, read_calibration,
+                                     validate_calibration)
+from a1570.common_functions import (check_error_queue_and_assert, has_thickness, parse_idn,
+                                    parse_measurement_result, read_error_queue, set_strobe_parameters,
+                                    write_commands)
+from a1570.dead_zones import DeadZoneModel
+from a1570.reconnecting_session import ReconnectingSession
+from a1570.scpi_commands import COMMANDS
+from a1570.session_recording import open_session
+
+logger = logging.getLogger(__name__)
+
+JOB_TYPES = ('measure', 'capture', 'sweep', 'calibrate', 'view')
+# start and stop commands of the measurement modes
+MEASUREMENT_MODES = {
+    'MEAS': ('start_measurement', 'stop_measurement'),
+    'MAXStrobe': ('start_max_strobe', 'stop'),
+    'P2Peak': ('start_peak_to_peak', 'stop'),
+}
+# settings the device needs time to apply, the examples wait after each of them
+SETTLE_SETTINGS = ('probe_type', 'trigger_interval', 'transmitter_enable')
+
+class Device:
+    """Connection to one device, opened on first use and shared by all jobs.
+
+    Args:
+        name: Name of the device in the job file
+        resource: VISA resource name
+        timeout: VISA timeout in milliseconds
+        reconnect: Reconnect and restore the device state when the connection drops
+    """
+    def __init__(self, name: str, resource: str, timeout: int = 5000, reconnect: bool = False):
+        self.name = name
+        self.resource = resource
+        self.timeout = timeout
+        self.reconnect = reconnect
+        self.inst = None
+        self.idn = ''
+        self.connect_time = 0.0 # s
+
+    def connect(self):
+        if self.inst is None:
+            start = time.perf_counter()
+            inst = ReconnectingSession(self.resource) if self.reconnect else open_session(self.resource)
+            inst.encoding = 'iso-8859-1'
+            inst.timeout = self.timeout
+            inst.read_termination = '\r\n'
+            inst.write_termination = '\r\n'
+            # clear error queue before the first job
+            while read_error_queue(inst)[0] != 0:
+                pass
+            self.idn = inst.query(COMMANDS['idn'].query)
+            self.inst = inst
+            self.connect_time = time.perf_counter() - start
+            logger.info(f'{self.name}: {self.idn} connected in {self.connect_time * 1000:.0f} ms')
+        return self.inst
+
+    def close(self) -> None:
+        if self.inst is not None:
+            if self.reconnect:
+                logger.info(f'{self.name}: {self.inst.report()}')
+            self.inst.close()
+            self.inst = None
+
+def settings_commands(settings: Dict) -> List[bytes]:
+    """Encode device settings given by command names.
+
+    Args:
+        settings: Values by name of scpi_commands.COMMANDS, a value with unit is a list [value, unit]
+
+    Returns:
+        List[bytes]: Encoded commands for write_commands()
+
+    Raises:
+        ValueError: If a name is unknown or a value does not fit the command
+    """
+    commands = []
+    for name, value in settings.items():
+        if name not in COMMANDS:
+            raise ValueError(f'Unknown setting {name}')
+        if isinstance(value, list):
+            commands.append(COMMANDS[name].encode(*value))
+        else:
+            commands.append(COMMANDS[name].encode(value))
+    return commands
+
+def job_settings(job: Dict) -> Dict:
+    """Return the device settings of a job, the probe type first."""
+    settings = dict(job.get('settings', {}))
+    if 'probe_type' in job:
+        settings = {'probe_type': job['probe_type'], **settings}
+    return settings
+
+def cached_calibration(device: Device, job: Dict) -> Optional[CalibrationData]:
+    """Return the stored calibration of the probe of a job, None if not stored or disabled by the job."""
+    if not job.get('calibration_cache', True):
+        return None
+    store = CalibrationStore(job.get('calibration_directory', 'calibration_cache'))
+    calibration = store.load(device.idn, job['probe_type'])
+    if calibration is None:
+        logger.warning(f'No stored calibration of {job["probe_type"]}, run a calibrate job first')
+    return calibration
+
+def configure(inst, job: Dict, calibration: Optional[CalibrationData] = None) -> None:
+    """Apply probe type, settings, calibration and strobe of a job and check the error queue.
+
+    The settings are sent in as few transfers as possible. The device gets
+    settle_time_settings seconds (default 0.5 s) after each setting of SETTLE_SETTINGS.
+
+    Args:
+        inst: VISA instrument instance
+        job: Job of an a1570 job file
+        calibration: Calibration to apply after the settings, e.g. from cached_calibration()
+    """
+    settings = job_settings(job)
+    settle_time = job.get('settle_time_settings', 0.5)
+    batch = []
+    for name, command in zip(settings, settings_commands(settings)):
+        batch.append(command)
+        if name in SETTLE_SETTINGS:
+            write_commands(inst, batch)
+            batch = []
+            time.sleep(settle_time)
+    if batch:
+        write_commands(inst, batch)
+    check_error_queue_and_assert(inst)
+    if calibration is not None:
+        # replaces the dead zones of the device
+        apply_calibration(inst, calibration)
+    if 'strobe' in job:
+        strobe = job['strobe']
+        dead_zones = DeadZoneModel.from_string(calibration.dead_zones if calibration is not None
+                                               else inst.query(COMMANDS['dead_zones'].query))
+        set_strobe_parameters(inst, strobe['level'], strobe['begin'], strobe['width'], dead_zones)
+
+def run_measure(device: Device, job: Dict) -> None:
+    from a1570.result_sinks import AsyncSink, CsvSink
+
+    inst = device.connect()
+    configure(inst, job, cached_calibration(device, job))
+
+    start_command, stop_command = MEASUREMENT_MODES[job.get('mode', 'MEAS')]
+    sink = AsyncSink(CsvSink(job['output'])) if job.get('output') else None
+    inst.write(COMMANDS[start_command].format())
+    time.sleep(job.get('settle_time', 2))
+    last_counter = -1
+    try:
+        for _ in range(job.get('count', 10)):
+            result = parse_measurement_result(inst.query(COMMANDS['fetch_result'].query))
+            if result.counter != last_counter:
+                last_counter = result.counter
+                if not has_thickness(result):
+                    logger.info('no thickness found')
+                else:
+                    logger.info(f'thickness = {result.thickness}mm')
+                if sink is not None:
+                    sink.put(result)
+            time.sleep(job.get('interval', 1))
+    finally:
+        inst.write(COMMANDS[stop_command].format())
+        if sink is not None:
+            sink.close()
+            logger.info(f'results: {sink.statistics}')
+
+def run_capture(device: Device, job: Dict) -> None:
+    from a1570.parameter_search import capture_block
+    from a1570.sweep_archive import BlockParameters, SweepArchive
+
+    inst = device.connect()
+    configure(inst, job)
+    bp = BlockParameters(**job['parameters'])
+    _, _, serial, _ = parse_idn(device.idn)
+    with SweepArchive(job.get('output', 'data_blocks')) as archive:
+        for i in range(job.get('count', 1)):
+            archive.append(bp, capture_block(inst, bp, job.get('settle_time', 0.5), verify=i == 0), serial)
+
+def run_sweep(device: Device, job: Dict) -> None:
+    import numpy as np
+    from a1570.device_capabilities import check_values, get_capabilities
+    from a1570.parameter_search import capture_block, search_parameters
+    from a1570.sweep_archive import BlockParameters, SweepArchive
+
+    inst = device.connect()
+    configure(inst, job)
+    axes = {}
+    for name, values in job['axes'].items():
+        if isinstance(values, dict):
+            # range like {"start": 0.5, "stop": 8.0, "step": 0.5}, stop included
+            values = [float(v) for v in np.arange(values['start'], values['stop'] + values['step'] / 2, values['step'])]
+        axes[name] = values
+    averaging = job.get('averaging', 4)
+    probe_frequency = job.get('probe_frequency', 3)
+
+    # every value is validated before the first block, values the firmware rejects end the job
+    capabilities = get_capabilities(inst, device.idn)
+    check_values(capabilities, 'gain', axes['gain'])
+    check_values(capabilities, 'pulse_level', axes['pulse_level'])
+    check_values(capabilities, 'sampling_frequency', [rate * 1E6 for rate in axes['sampling_rate']])
+    check_values(capabilities, 'transmitter_duration', axes['duration'])
+    check_values(capabilities, 'average_count', [averaging])
+    write_commands(inst, [COMMANDS['average_count'].encode(averaging),
+                          COMMANDS['transmitter_frequency'].encode(probe_frequency, 'MHZ')])
+
+    _, _, serial, _ = parse_idn(device.idn)
+    with SweepArchive(job.get('output', 'data_blocks')) as archive:
+        def store_block(bp: BlockParameters, vector) -> None:
+            archive.append(bp, vector, serial)
+
+        if job.get('mode', 'grid') == 'grid':
+            for gain in axes['gain']:
+                for pulse_level in axes['pulse_level']:
+                    for sampling_rate in axes['sampling_rate']:
+                        for duration in axes['duration']:
+                            bp = BlockParameters(gain, pulse_level, sampling_rate, duration, averaging, probe_frequency)
+                            store_block(bp, capture_block(inst, bp, verify=False))
+        else:
+            best, result = search_parameters(inst, axes, job['strobe_begin'], job['strobe_width'],
+                                             averaging, probe_frequency, on_block=store_block)
+            logger.info(f'Best settings: {best}, SNR {result.best_score:.1f} dB')
+            logger.info(f'{result.acquisitions} of {result.grid_size} blocks captured, '
+                        f'{result.saved} acquisitions saved compared with the full grid')
+
+def run_calibrate(device: Device, job: Dict) -> None:
+    inst = device.connect()
+    configure(inst, job)
+    probe_type = job['probe_type']
+    if 'values' in job:
+        # calibration values from the job file, e.g. known values of a probe
+        values = job['values']
+        calibration = CalibrationData(values['dead_zones'], values['probe_delay'],
+                                      json.dumps(values['eddy_array']) if 'eddy_array' in values else None,
+                                      json.dumps(values['noise']) if 'noise' in values else None, time.time())
+        validate_calibration(calibration)
+        apply_calibration(inst, calibration)
+    else:
+        input(f'Calibration of {probe_type} in air. Take the probe in hand and press Enter to continue...')
+        inst.write(COMMANDS['start_calibration_air'].format())
+        time.sleep(job.get('air_time', 6))
+        input('Calibration on object. Put the probe on calibration object and press Enter to continue...')
+        inst.write(COMMANDS['start_calibration_object'].format())
+        time.sleep(job.get('object_time', 5))
+        calibration = read_calibration(inst, include_eddy_and_noise=job.get('include_eddy_and_noise', True))
+        if device.reconnect:
+            # restore the calibration of the device after a reconnect too
+            inst.remember_calibration(calibration)
+    store = CalibrationStore(job.get('calibration_directory', 'calibration_cache'))
+    store.save(device.idn, probe_type, calibration)
+
+def run_view(device: Optional[Device], job: Dict) -> None:
+    import matplotlib.pyplot as plt
+    from a1570.sweep_archive import SweepArchive
+
+    with SweepArchive(job.get('archive', 'data_blocks')) as archive:
+        fig = plt.figure()
+        for block, data in archive.query(order_by=job.get('order_by', '-capture_time'), limit=job.get('limit'),
+                                         **job.get('conditions', {})):
+            logger.info(block.parameters)
+            fig.clear()
+            plt.plot(data)
+            plt.title(f'block {block.id}')
+            plt.pause(job.get('pause', 0.1))
+
+RUNNERS: Dict[str, Callable[[Optional[Device], Dict], None]] = {
+    'measure': run_measure,
+    'capture': run_capture,
+    'sweep': run_sweep,
+    'calibrate': run_calibrate,
+    'view': run_view,
+}
+
+def check_job(job: Dict, devices: Dict[str, Device], default_device: Optional[str]) -> Optional[str]:
+    """Check type, device and settings of a job.
+
+    Returns:
+        Optional[str]: Error message or None if the job can run
+    """
+    if job.get('type') not in RUNNERS:
+        return f'Unknown job type {job.get("type")}, expected one of {JOB_TYPES}'
+    if job['type'] != 'view' and job.get('device', default_device) not in devices:
+        return f'Unknown device {job.get("device", default_device)}, expected one of {list(devices)}'
+    if job['type'] == 'measure' and job.get('mode', 'MEAS') not in MEASUREMENT_MODES:
+        return f'Unknown mode {job["mode"]}, expected one of {list(MEASUREMENT_MODES)}'
+    try:
+        settings_commands(job_settings(job))
+    except (TypeError, ValueError) as e:
+        return str(e)
+    return None
+
+def run_jobs(config: Dict, job_type: Optional[str] = None, names: Optional[List[str]] = None) -> bool:
+    """Run the jobs of a job file, one connection per device.
+
+    Args:
+        config: Parsed job file
+        job_type: Only run jobs of this type
+        names: Only run jobs with these names
+
+    Returns:
+        bool: True if all jobs succeeded
+    """
+    try:
+        devices = {name: Device(name, **settings) for name, settings in config.get('devices', {}).items()}
+    except TypeError as e:
+        logger.error(f'Invalid device in job file: {e}')
+        return False
+    default_device = config.get('default_device', next(iter(devices), None))
+
+    # check the whole job file before the first job touches a device
+    ok = True
+    jobs = []
+    for i, job in enumerate(config.get('jobs', [])):
+        name = job.get('name', f'job_{i}')
+        error = check_job(job, devices, default_device)
+        if error is not None:
+            ok = False
+            logger.error(f'Job {name} failed: {error}')
+        elif (job_type is None or job['type'] == job_type) and (not names or name in names):
+            jobs.append((name, job))
+    if not ok and not config.get('continue_on_error', False):
+        return False
+
+    try:
+        for name, job in jobs:
+            device = devices[job.get('device', default_device)] if job['type'] != 'view' else None
+            logger.info(f'Job {name} ({job["type"]})' + (f' on {device.name}' if device else ''))
+            start = time.perf_counter()
+            try:
+                RUNNERS[job['type']](device, job)
+            except Exception as e:
+                ok = False
+                logger.error(f'Job {name} failed: {e}')
+                if not config.get('continue_on_error', False):
+                    break
+            else:
+                logger.info(f'Job {name} done in {time.perf_counter() - start:.1f} s')
+    finally:
+        for device in devices.values():
+            device.close()
+    return ok
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog='a1570', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=('run',) + JOB_TYPES, help='run all jobs or only jobs of one type')
+    parser.add_argument('config', help='job file (JSON)')
+    parser.add_argument('--job', action='append', help='only run the job with this name, can be repeated')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout, format='%(message)s')
+
+    try:
+        with open(args.config, 'r') as f:
+            config = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.error(f'Cannot read job file {args.config}: {e}')
+        sys.exit(1)
+    ok = run_jobs(config, None if args.command == 'run' else args.command, args.job)
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
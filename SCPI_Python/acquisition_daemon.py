@@ -0,0 +1,307 @@
+"""
+Acquisition daemon serving results and A-scans of one A1570 to many local clients.
+
+The daemon keeps the only connection to the device, configures it with a measure job
+of an a1570 job file and polls results (and every n-th poll an A-scan) in a loop.
+The latest values are published to any number of clients, every value is read from
+the device once and each encoding is built at most once, so N clients cost the device
+the same as one. The JSON encoding of an A-scan is only built when a client asks for it.
+
+HTTP API (--http PORT, bound to localhost):
+    GET /result      latest result as JSON
+    GET /ascan       latest A-scan as raw little-endian int16 samples, headers X-Vector-Index and X-Sequence
+    GET /subscribe   new results as server-sent events (text/event-stream)
+    GET /status      poll and client statistics as JSON
+
+Unix socket API (--unix PATH), one request per line, answers are JSON lines:
+    result           latest result
+    ascan            latest A-scan with the samples as list
+    subscribe        new results, one line each, until the client sends the next request
+    unsubscribe      answer of a request ending a subscription
+    status           poll and client statistics
+
+Usage:
+    python acquisition_daemon.py jobs.json --job pulse_s3850 --http 8570 --unix /tmp/a1570.sock
+"""
+
+import argparse
+import json
+import logging
+import os
+import select
+import socketserver
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from a1570.a1570_cli import MEASUREMENT_MODES, Device, cached_calibration, configure
+from a1570.clock_correlation import ClockCorrelator
+from a1570.common_functions import get_frame_from_SCPI, parse_measurement_result
+from a1570.scpi_commands import COMMANDS
+
+logger = logging.getLogger(__name__)
+
+class Channel:
+    """Latest value of a data stream with its encodings, clients wait for new sequences.
+
+    Args:
+        encoders: Encodings built from the value on the first request of a sequence,
+            e.g. json=lambda value: ...; they are not built if no client asks for them
+    """
+    def __init__(self, **encoders: Callable[[Any], bytes]):
+        self._condition = threading.Condition()
+        self._encoders = encoders
+        self.sequence = 0
+        self.value: Any = None
+        self.encoded: Dict[str, bytes] = {}
+
+    def publish(self, value: Any = None, **encoded: bytes) -> None:
+        """Publish a new value with the encodings built already, e.g. json=b'{...}'."""
+        with self._condition:
+            self.sequence += 1
+            self.value = value
+            self.encoded = encoded
+            self._condition.notify_all()
+
+    def latest(self) -> Tuple[int, Dict[str, bytes]]:
+        with self._condition:
+            return self.sequence, self.encoded
+
+    def latest_encoded(self, name: str) -> Tuple[int, Optional[bytes]]:
+        """Return the latest sequence and its encoding name, built and cached on the first request."""
+        with self._condition:
+            sequence, value, encoded = self.sequence, self.value, self.encoded
+        data = encoded.get(name)
+        if data is None and sequence and name in self._encoders:
+            # outside the lock, publishing a new value replaces the dict instead of waiting
+            data = encoded[name] = self._encoders[name](value)
+        return sequence, data
+
+    def wait(self, after: int, timeout: Optional[float] = None) -> Tuple[int, Dict[str, bytes]]:
+        """Wait until a value newer than sequence after is published or the timeout expired."""
+        with self._condition:
+            self._condition.wait_for(lambda: self.sequence > after, timeout)
+            return self.sequence, self.encoded
+
+class AcquisitionDaemon:
+    """Measurement loop of one device publishing results and A-scans.
+
+    Args:
+        device: Device connection
+        job: Measure job of an a1570 job file
+        ascan_every: Fetch an A-scan every n-th poll, 0 disables A-scans
+    """
+    def __init__(self, device: Device, job: Dict, ascan_every: int = 4):
+        self.device = device
+        self.job = job
+        self.ascan_every = ascan_every
+        self.results = Channel()
+        self.ascans = Channel(json=lambda value: json.dumps(
+            {'vector_index': value[0], 'samples': value[1].tolist()}).encode())
+        self.polls = 0
+        self.clients = 0
+        self.clock = ClockCorrelator()
+        self.start_time = time.time()
+        self._clients_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        inst = self.device.connect()
+        configure(inst, self.job, cached_calibration(self.device, self.job))
+        if self.ascan_every:
+            inst.write(COMMANDS['send_vector'].format(True))
+        start_command, _ = MEASUREMENT_MODES[self.job.get('mode', 'MEAS')]
+        inst.write(COMMANDS[start_command].format())
+        self._thread = threading.Thread(target=self._run, name='AcquisitionDaemon', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+        _, stop_command = MEASUREMENT_MODES[self.job.get('mode', 'MEAS')]
+        self.device.inst.write(COMMANDS[stop_command].format())
+        self.device.close()
+
+    def client_connected(self, connected: bool) -> None:
+        with self._clients_lock:
+            self.clients += 1 if connected else -1
+
+    def status(self) -> bytes:
+        return json.dumps({
+            'device': self.device.idn,
+            'uptime': time.time() - self.start_time,
+            'polls': self.polls,
+            'results': self.results.sequence,
+            'ascans': self.ascans.sequence,
+            'clients': self.clients,
+            'outages': len(getattr(self.device.inst, 'outages', [])),
+            'downtime': getattr(self.device.inst, 'downtime', 0.0),
+            'lost_results': getattr(self.device.inst, 'lost_results', 0),
+            'result_period': self.clock.period,
+            'device_clock_offset': self.clock.device_clock_offset[0],
+            'device_clock_drift_ppm': self.clock.drift_ppm,
+            'device_clock_drift_error_ppm': self.clock.drift_error_ppm,
+        }).encode()
+
+    def _run(self) -> None:
+        inst = self.device.inst
+        interval = self.job.get('interval', 0.25)
+        while not self._stop_event.is_set():
+            try:
+                send_time = time.time()
+                answ = inst.query(COMMANDS['fetch_result'].query)
+                result = parse_measurement_result(answ)
+                if self.clock.observe(result, send_time, time.time()):
+                    self.results.publish(json=json.dumps(vars(result)).encode())
+                if self.ascan_every and self.polls % self.ascan_every == 0:
+                    header, vector = get_frame_from_SCPI(inst)
+                    vector_index = int(header['vector_index'])
+                    # the JSON encoding is built by the first client asking for it
+                    self.ascans.publish((vector_index, vector),
+                                        binary=vector.astype('<i2').tobytes(),
+                                        vector_index=str(vector_index).encode())
+                self.polls += 1
+            except Exception as e:
+                logger.error(f'Acquisition failed: {e}')
+            self._stop_event.wait(interval)
+
+def http_handler(daemon: AcquisitionDaemon):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+        def _send(self, body: bytes, content_type: str = 'application/json', headers: Dict[str, str] = {}) -> None:
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/result':
+                _, encoded = daemon.results.latest()
+                self._send(encoded.get('json', b'null'))
+            elif self.path == '/ascan':
+                sequence, encoded = daemon.ascans.latest()
+                if not encoded:
+                    self.send_error(404, 'No A-scan yet')
+                    return
+                self._send(encoded['binary'], 'application/octet-stream',
+                           {'X-Vector-Index': encoded['vector_index'].decode(), 'X-Sequence': str(sequence)})
+            elif self.path == '/status':
+                self._send(daemon.status())
+            elif self.path == '/subscribe':
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Cache-Control', 'no-cache')
+                self.end_headers()
+                daemon.client_connected(True)
+                try:
+                    sequence, _ = daemon.results.latest()
+                    while True:
+                        new_sequence, encoded = daemon.results.wait(sequence, timeout=15)
+                        if new_sequence == sequence:
+                            # keep the connection alive
+                            self.wfile.write(b': keepalive\n\n')
+                        else:
+                            sequence = new_sequence
+                            self.wfile.write(b'id: %d\ndata: %s\n\n' % (sequence, encoded['json']))
+                        self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    daemon.client_connected(False)
+            else:
+                self.send_error(404)
+    return Handler
+
+def unix_handler(daemon: AcquisitionDaemon):
+    class Handler(socketserver.StreamRequestHandler):
+        # unbuffered, a request line sent during a subscription is seen by select()
+        rbufsize = 0
+
+        def handle(self):
+            daemon.client_connected(True)
+            try:
+                for line in self.rfile:
+                    request = line.strip().decode()
+                    if request == 'result':
+                        self.wfile.write(daemon.results.latest()[1].get('json', b'null') + b'\n')
+                    elif request == 'ascan':
+                        self.wfile.write((daemon.ascans.latest_encoded('json')[1] or b'null') + b'\n')
+                    elif request == 'status':
+                        self.wfile.write(daemon.status() + b'\n')
+                    elif request == 'subscribe':
+                        # stream until the client sends the next request or disconnects
+                        sequence, _ = daemon.results.latest()
+                        while not select.select([self.connection], [], [], 0)[0]:
+                            new_sequence, encoded = daemon.results.wait(sequence, timeout=0.5)
+                            if new_sequence != sequence:
+                                sequence = new_sequence
+                                self.wfile.write(encoded['json'] + b'\n')
+                                self.wfile.flush()
+                    elif request == 'unsubscribe':
+                        self.wfile.write(json.dumps({'subscribed': False}).encode() + b'\n')
+                    else:
+                        self.wfile.write(json.dumps({'error': f'unknown request {request}'}).encode() + b'\n')
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            finally:
+                daemon.client_connected(False)
+    return Handler
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('config', help='a1570 job file (JSON)')
+    parser.add_argument('--job', required=True, help='name of the measure job to run')
+    parser.add_argument('--http', type=int, help='HTTP port on localhost')
+    parser.add_argument('--unix', help='Unix socket path')
+    parser.add_argument('--ascan-every', type=int, default=4, help='fetch an A-scan every n-th poll, 0 disables')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout, format='%(message)s')
+    if args.http is None and args.unix is None:
+        parser.error('give --http, --unix or both')
+
+    with open(args.config, 'r') as f:
+        config = json.load(f)
+    job = next(j for j in config['jobs'] if j.get('name') == args.job)
+    device_name = job.get('device', config.get('default_device', next(iter(config['devices']))))
+    daemon = AcquisitionDaemon(Device(device_name, **config['devices'][device_name]), job, args.ascan_every)
+    daemon.start()
+
+    servers = []
+    if args.http is not None:
+        servers.append(ThreadingHTTPServer(('127.0.0.1', args.http), http_handler(daemon)))
+        logger.info(f'Serving HTTP on http://127.0.0.1:{args.http}')
+    if args.unix is not None:
+        if os.path.exists(args.unix):
+            os.remove(args.unix)
+        servers.append(socketserver.ThreadingUnixStreamServer(args.unix, unix_handler(daemon)))
+        logger.info(f'Serving Unix socket {args.unix}')
+    for server in servers:
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+        if args.unix is not None and os.path.exists(args.unix):
+            os.remove(args.unix)
+        daemon.stop()
+        logger.info(f'Daemon stopped after {daemon.polls} polls')
+
+if __name__ == '__main__':
+    main()
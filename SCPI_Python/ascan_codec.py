@@ -0,0 +1,219 @@
+"""
+Lossless compression codec for archived int16 A-scan frames.
+
+A-scans returned by get_vector_from_SCPI() are 8192 samples of int16 (16 KB) per frame.
+Neighbouring samples of an ultrasonic signal are strongly correlated, so the codec
+stores the sample-to-sample difference instead of the sample itself:
+
+1. delta coding along each frame (int16 arithmetic with wrap-around, so it is exact)
+2. zigzag mapping of the signed differences to small unsigned numbers
+3. byte shuffle, all low bytes of the batch followed by all high bytes
+4. zlib (fast) or lzma (strong) compression from the standard library
+
+All steps are vectorized in NumPy over a whole batch of frames. Batches are written
+as self-describing records, so a capture can be encoded and decoded as a stream.
+
+Usage:
+    python ascan_codec.py [directory with JSON blocks]
+"""
+
+import io
+import json
+import lzma
+import os
+import struct
+import time
+import zlib
+from typing import BinaryIO, Iterator, Tuple
+
+import numpy as np
+
+# record header: magic, method, level, number of frames, frame length, payload size
+RECORD_HEADER = struct.Struct('<4sBBIII')
+RECORD_MAGIC = b'ASC1'
+METHOD_ZLIB = 0
+METHOD_LZMA = 1
+
+def encode_frames(frames: np.ndarray, method: int = METHOD_ZLIB, level: int = 1) -> bytes:
+    """Encode a batch of frames into one compressed record.
+
+    Args:
+        frames: Array of shape (N, L) or (L,) with int16 samples
+        method: METHOD_ZLIB or METHOD_LZMA
+        level: Compression level of the method
+
+    Returns:
+        bytes: Record with header and compressed payload
+    """
+    frames = np.ascontiguousarray(frames, dtype=np.int16)
+    if frames.ndim == 1:
+        frames = frames[np.newaxis, :]
+    n_frames, frame_length = frames.shape
+
+    # delta coding, the first sample of each frame is kept as is
+    delta = np.empty_like(frames)
+    delta[:, 0] = frames[:, 0]
+    np.subtract(frames[:, 1:], frames[:, :-1], out=delta[:, 1:])
+    # zigzag: 0, -1, 1, -2, 2 ... -> 0, 1, 2, 3, 4 ...
+    zigzag = (delta.view(np.uint16) << 1) ^ (delta >> 15).view(np.uint16)
+    # byte shuffle, low and high bytes compress better separately
+    shuffled = zigzag.view(np.uint8).reshape(-1, 2).T.tobytes()
+
+    if method == METHOD_ZLIB:
+        payload = zlib.compress(shuffled, level)
+    elif method == METHOD_LZMA:
+        payload = lzma.compress(shuffled, preset=level)
+    else:
+        raise ValueError(f'Unknown compression method {method}')
+    return RECORD_HEADER.pack(RECORD_MAGIC, method, level, n_frames, frame_length, len(payload)) + payload
+
+def decode_payload(header: Tuple, payload: bytes) -> np.ndarray:
+    """Decode the payload of a record into frames.
+
+    Args:
+        header: Unpacked RECORD_HEADER
+        payload: Compressed payload
+
+    Returns:
+        np.ndarray: Array of shape (N, L) with int16 samples
+    """
+    magic, method, level, n_frames, frame_length, size = header
+    if magic != RECORD_MAGIC:
+        raise ValueError(f'Invalid record magic {magic!r}')
+    if method == METHOD_ZLIB:
+        shuffled = zlib.decompress(payload)
+    elif method == METHOD_LZMA:
+        shuffled = lzma.decompress(payload)
+    else:
+        raise ValueError(f'Unknown compression method {method}')
+
+    planes = np.frombuffer(shuffled, dtype=np.uint8).reshape(2, -1)
+    zigzag = np.empty(planes.shape[1], dtype=np.uint16)
+    zigzag_bytes = zigzag.view(np.uint8)
+    zigzag_bytes[0::2] = planes[0]
+    zigzag_bytes[1::2] = planes[1]
+    zigzag = zigzag.reshape(n_frames, frame_length)
+    delta = ((zigzag >> 1) ^ (0 - (zigzag & 1))).view(np.int16)
+    # integrate the differences, int16 wrap-around reverses the delta coding exactly
+    return np.cumsum(delta, axis=1, dtype=np.int16)
+
+def decode_frames(record: bytes) -> np.ndarray:
+    """Decode one record created by encode_frames().
+
+    Args:
+        record: Record with header and compressed payload
+
+    Returns:
+        np.ndarray: Array of shape (N, L) with int16 samples
+    """
+    header = RECORD_HEADER.unpack_from(record)
+    return decode_payload(header, record[RECORD_HEADER.size:RECORD_HEADER.size + header[5]])
+
+class FrameWriter:
+    """Streaming encoder appending batches of frames to a binary file.
+
+    Args:
+        f: File opened in binary write or append mode
+        method: METHOD_ZLIB or METHOD_LZMA
+        level: Compression level of the method
+    """
+    def __init__(self, f: BinaryIO, method: int = METHOD_ZLIB, level: int = 1):
+        self.f = f
+        self.method = method
+        self.level = level
+        self.raw_bytes = 0
+        self.encoded_bytes = 0
+
+    def write(self, frames: np.ndarray) -> None:
+        """Encode a batch of frames and append it to the file."""
+        record = encode_frames(frames, self.method, self.level)
+        self.f.write(record)
+        self.raw_bytes += np.asarray(frames).size * 2
+        self.encoded_bytes += len(record)
+
+    @property
+    def ratio(self) -> float:
+        """Compression ratio of all frames written so far."""
+        return self.raw_bytes / self.encoded_bytes if self.encoded_bytes else 0.0
+
+def read_frames(f: BinaryIO) -> Iterator[np.ndarray]:
+    """Streaming decoder yielding the batches of frames stored in a binary file.
+
+    Args:
+        f: File opened in binary read mode
+
+    Yields:
+        np.ndarray: Array of shape (N, L) with int16 samples per stored batch
+    """
+    while True:
+        header_bytes = f.read(RECORD_HEADER.size)
+        if not header_bytes:
+            return
+        if len(header_bytes) < RECORD_HEADER.size:
+            raise EOFError('Truncated record header')
+        header = RECORD_HEADER.unpack(header_bytes)
+        payload = f.read(header[5])
+        if len(payload) < header[5]:
+            raise EOFError('Truncated record payload')
+        yield decode_payload(header, payload)
+
+def benchmark_codec(frames: np.ndarray, method: int = METHOD_ZLIB, level: int = 1,
+                    batch_size: int = 64) -> Tuple[float, float, float]:
+    """Measure compression ratio and throughput of the codec.
+
+    Args:
+        frames: Array of shape (N, L) with int16 samples
+        method: METHOD_ZLIB or METHOD_LZMA
+        level: Compression level of the method
+        batch_size: Number of frames per record
+
+    Returns:
+        Tuple[float, float, float]: Compression ratio, encoding and decoding speed in MB/s
+    """
+    buffer = io.BytesIO()
+    writer = FrameWriter(buffer, method, level)
+    start = time.perf_counter()
+    for i in range(0, len(frames), batch_size):
+        writer.write(frames[i:i + batch_size])
+    encode_time = time.perf_counter() - start
+
+    buffer.seek(0)
+    start = time.perf_counter()
+    decoded = np.concatenate(list(read_frames(buffer)))
+    decode_time = time.perf_counter() - start
+    assert np.array_equal(decoded, frames), 'Codec is not lossless'
+
+    mb = frames.nbytes / 1E6
+    return writer.ratio, mb / encode_time, mb / decode_time
+
+def synthetic_frames(n_frames: int = 256, frame_length: int = 8192, seed: int = 0) -> np.ndarray:
+    """Generate A-scan like frames (decaying echoes of a 3 MHz burst at 100 MHz plus noise)."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(frame_length) / 100E6
+    echoes = sum(np.exp(-((t - k * 5E-6) / 1.5E-6) ** 2) * 0.6 ** k for k in range(1, 8))
+    signal = 8000 * echoes * np.sin(2 * np.pi * 3E6 * t)
+    noise = rng.normal(0, 20, (n_frames, frame_length))
+    return (signal + noise).astype(np.int16)
+
+def load_json_frames(directory: str) -> np.ndarray:
+    """Load the A-scans of all JSON blocks in a directory saved by receive_data_all_parameters.py."""
+    frames = []
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith('.json'):
+            with open(os.path.join(directory, filename), 'r') as f:
+                frames.append(json.load(f)['data'])
+    return np.array(frames, dtype=np.int16)
+
+def main() -> None:
+    """Benchmark the codec on JSON blocks of a directory or on synthetic frames."""
+    import sys
+    frames = load_json_frames(sys.argv[1]) if len(sys.argv) > 1 else synthetic_frames()
+    print(f'{len(frames)} frames of {frames.shape[1]} samples')
+    for name, method, level in (('zlib-1', METHOD_ZLIB, 1), ('zlib-6', METHOD_ZLIB, 6), ('lzma-0', METHOD_LZMA, 0)):
+        ratio, encode_speed, decode_speed = benchmark_codec(frames, method, level)
+        frame_rate = encode_speed * 1E6 / (frames.shape[1] * 2)
+        print(f'{name}: ratio {ratio:.2f}, encode {encode_speed:.1f} MB/s ({frame_rate:.0f} frames/s), '
+              f'decode {decode_speed:.1f} MB/s')
+
+if __name__ == '__main__':
+    main()
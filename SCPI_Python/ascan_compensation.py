@@ -0,0 +1,104 @@
+"""
+Host-side eddy-current compensation and dead-zone masking of raw A-scans.
+
+The device subtracts the eddy array of the calibration in air and ignores the dead
+zone of the current gain only internally. AScanCompensator applies the same steps to
+raw vectors from FETCh:ARRay? (N, L) batches at once:
+
+- the eddy array is subtracted at its offset eddy_start
+- the samples before the dead zone of the gain of each frame are set to 0, the dead
+  zone is interpolated between the calibrated gains (see dead_zones)
+
+The lookup tables (eddy correction per vector length, dead zone per gain) are built
+from the calibration once and only rebuilt when the calibration changes.
+
+Example:
+    >>> compensator = AScanCompensator(read_calibration(inst))
+    >>> compensated = compensator.process(vectors, gains)    # vectors (N, L), gains (N,) in dB
+"""
+
+import json
+from typing import Dict, Optional, Tuple, Union
+
+import numpy as np
+
+from a1570.calibration_cache import CalibrationData
+from a1570.dead_zones import DeadZoneModel
+
+def eddy_correction(eddy_array: Optional[str], length: int) -> np.ndarray:
+    """Build the eddy correction of a vector length from calibration_eddy_array.
+
+    Args:
+        eddy_array: JSON string {"eddy": [...], "eddy_start": n} or None for no correction
+        length: Samples per vector
+
+    Returns:
+        np.ndarray: float32 correction of shape (L,), 0 outside the eddy array
+    """
+    correction = np.zeros(length, dtype=np.float32)
+    if eddy_array is None:
+        return correction
+    eddy = json.loads(eddy_array.strip("'\""))
+    start = eddy['eddy_start']
+    values = np.asarray(eddy['eddy'], dtype=np.float32)[:max(length - start, 0)]
+    correction[start:start + len(values)] = values
+    return correction
+
+class AScanCompensator:
+    """Eddy compensation and dead-zone masking with precomputed lookup tables.
+
+    Args:
+        calibration: Calibration parameters of the device, e.g. from read_calibration()
+    """
+    def __init__(self, calibration: CalibrationData):
+        self._key: Optional[Tuple[str, Optional[str]]] = None
+        self.update(calibration)
+
+    def update(self, calibration: CalibrationData) -> bool:
+        """Use a new calibration, the tables are only rebuilt if it changed.
+
+        Returns:
+            bool: True if the tables were rebuilt
+        """
+        key = (calibration.dead_zones, calibration.eddy_array)
+        if key == self._key:
+            return False
+        self._key = key
+        self.calibration = calibration
+        self.dead_zones = DeadZoneModel.from_string(calibration.dead_zones)
+        self._eddy: Dict[int, np.ndarray] = {} # correction per vector length
+        self._positions: Dict[int, np.ndarray] = {}
+        return True
+
+    def dead_zone(self, gains: Union[int, np.ndarray]) -> np.ndarray:
+        """Dead zone in whole samples for gains in dB."""
+        return self.dead_zones.samples(gains)
+
+    def _tables(self, length: int) -> Tuple[np.ndarray, np.ndarray]:
+        if length not in self._eddy:
+            self._eddy[length] = eddy_correction(self.calibration.eddy_array, length)
+            self._positions[length] = np.arange(length)
+        return self._eddy[length], self._positions[length]
+
+    def process(self, vectors: np.ndarray, gains: Union[int, np.ndarray],
+                out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Subtract the eddy array and mask the dead zone.
+
+        Args:
+            vectors: Raw A-scans of shape (N, L) or (L,)
+            gains: Gain of each frame in dB, shape (N,) or one gain for all frames
+            out: float32 array of the shape of vectors for the result, may be vectors itself
+
+        Returns:
+            np.ndarray: Compensated vectors as float32
+        """
+        vectors = np.asarray(vectors)
+        if out is None:
+            out = np.empty(vectors.shape, dtype=np.float32)
+        eddy, positions = self._tables(vectors.shape[-1])
+        np.subtract(vectors, eddy, out=out)
+        dead_zone = self.dead_zone(gains)
+        if vectors.ndim > 1:
+            dead_zone = np.broadcast_to(dead_zone, vectors.shape[:-1])[..., np.newaxis]
+        out[positions < dead_zone] = 0
+        return out
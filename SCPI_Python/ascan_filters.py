@@ -0,0 +1,190 @@
+"""
+FFT band-pass filter and envelope detection of A-scan batches.
+
+A-scans of shape (N, L) are filtered around the probe frequency (TRANsmitter:FREQuency,
+e.g. 3 MHz) at the sampling rate of the device (25, 50 or 100 MHz) and their Hilbert
+envelope is detected in the same pass:
+
+- The frequency response (Gaussian band-pass times the analytic signal weights) is
+  computed once per (L, sampling rate, probe frequency, bandwidth) and kept in an LRU cache.
+- One real FFT, one multiplication and one inverse complex FFT give both the filtered
+  signal (real part) and the envelope (magnitude).
+- BandpassEnvelope works in float32 and reuses its buffers for batches of the same shape.
+  With NumPy 2 the FFTs write into these buffers as well.
+
+Example:
+    >>> stage = BandpassEnvelope(sampling_rate=100E6, probe_frequency=3E6)
+    >>> filtered, envelope = stage.process(frames)    # frames: (N, L) int16
+
+Usage:
+    python ascan_filters.py [directory]    # benchmark on JSON blocks or synthetic frames
+"""
+
+import math
+import time
+from functools import lru_cache
+from typing import Optional, Tuple
+
+import numpy as np
+
+# NumPy 2 computes float32 FFTs in single precision and accepts output arrays
+_FFT_OUT = np.lib.NumpyVersion(np.__version__) >= '2.0.0'
+
+def fft_length(length: int) -> int:
+    """Return the smallest FFT length >= length with only the factors 2, 3 and 5."""
+    best = 2 ** math.ceil(math.log2(max(length, 1)))
+    power5 = 1
+    while power5 < best:
+        power3 = power5
+        while power3 < best:
+            n = power3
+            while n < length:
+                n *= 2
+            best = min(best, n)
+            power3 *= 3
+        power5 *= 5
+    return best
+
+@lru_cache(maxsize=32)
+def filter_response(length: int, sampling_rate: float, probe_frequency: float,
+                    bandwidth: float = 0.8) -> np.ndarray:
+    """Frequency response of the band-pass filter with the analytic signal weights.
+
+    The vectors are zero padded by a few filter lengths to keep the circular FFT
+    convolution from wrapping the end of a vector onto its start.
+
+    Args:
+        length: Samples per vector L
+        sampling_rate: Sampling rate in Hz
+        probe_frequency: Center frequency in Hz
+        bandwidth: -6 dB bandwidth relative to the probe frequency
+
+    Returns:
+        np.ndarray: Read-only complex64 weights of the rfft bins, the FFT length is 2 * (size - 1)
+    """
+    half_width = bandwidth * probe_frequency / 2
+    padding = math.ceil(2 * sampling_rate / half_width)
+    n = fft_length(length + padding)
+    n += n % 2 # even length, the last rfft bin is the Nyquist frequency
+    frequencies = np.fft.rfftfreq(n, 1 / sampling_rate)
+    weights = np.exp(-math.log(2) * ((frequencies - probe_frequency) / half_width) ** 2)
+    # analytic signal: positive frequencies twice, DC and Nyquist once
+    weights[1:-1] *= 2
+    weights[0] = 0
+    response = weights.astype(np.complex64)
+    response.flags.writeable = False
+    return response
+
+class BandpassEnvelope:
+    """Batched band-pass filter and envelope detector.
+
+    Args:
+        sampling_rate: Sampling rate in Hz
+        probe_frequency: Center frequency in Hz, usually the transmitter frequency
+        bandwidth: -6 dB bandwidth relative to the probe frequency
+    """
+    def __init__(self, sampling_rate: float, probe_frequency: float, bandwidth: float = 0.8):
+        self.sampling_rate = sampling_rate
+        self.probe_frequency = probe_frequency
+        self.bandwidth = bandwidth
+        self._shape: Optional[Tuple[int, int]] = None
+
+    def _allocate(self, count: int, length: int) -> None:
+        self.response = filter_response(length, self.sampling_rate, self.probe_frequency, self.bandwidth)
+        bins = len(self.response)
+        n = 2 * (bins - 1)
+        self._input = np.zeros((count, n), dtype=np.float32) # zero padding stays untouched
+        self._analytic = np.zeros((count, n), dtype=np.complex64) # negative frequencies stay 0
+        self._filtered = np.empty((count, length), dtype=np.float32)
+        self._envelope = np.empty((count, length), dtype=np.float32)
+        self._shape = (count, length)
+
+    def process(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Filter vectors and detect their envelope.
+
+        Args:
+            vectors: A-scans of shape (N, L) or (L,)
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Filtered signal and envelope as float32 arrays of
+            the input shape. Both are views of buffers reused by the next call.
+        """
+        vectors = np.asarray(vectors)
+        batch = np.atleast_2d(vectors)
+        count, length = batch.shape
+        if self._shape != (count, length):
+            self._allocate(count, length)
+        bins = len(self.response)
+        self._input[:, :length] = batch
+        spectrum = self._analytic[:, :bins]
+        if _FFT_OUT:
+            np.fft.rfft(self._input, axis=-1, out=spectrum)
+            spectrum *= self.response
+            np.fft.ifft(self._analytic, axis=-1, out=self._analytic)
+        else:
+            spectrum[...] = np.fft.rfft(self._input, axis=-1)
+            spectrum *= self.response
+            self._analytic[...] = np.fft.ifft(self._analytic, axis=-1)
+        analytic = self._analytic[:, :length]
+        np.abs(analytic, out=self._envelope)
+        np.copyto(self._filtered, analytic.real)
+        # the analytic buffer holds the result now, clear its negative frequencies for the next call
+        self._analytic[:, bins:] = 0
+        if vectors.ndim == 1:
+            return self._filtered[0], self._envelope[0]
+        return self._filtered, self._envelope
+
+def reference_bandpass_envelope(vectors: np.ndarray, sampling_rate: float, probe_frequency: float,
+                                bandwidth: float = 0.8) -> Tuple[np.ndarray, np.ndarray]:
+    """Filtered signal and envelope computed in float64 without reused buffers, to check BandpassEnvelope."""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float64))
+    length = vectors.shape[-1]
+    response = filter_response(length, sampling_rate, probe_frequency, bandwidth).astype(np.complex128)
+    n = 2 * (len(response) - 1)
+    spectrum = np.zeros((len(vectors), n), dtype=np.complex128)
+    spectrum[:, :len(response)] = np.fft.rfft(vectors, n=n, axis=-1) * response
+    analytic = np.fft.ifft(spectrum, axis=-1)[:, :length]
+    return analytic.real, np.abs(analytic)
+
+def benchmark_filter(frames: np.ndarray, sampling_rate: float, probe_frequency: float,
+                     batch_size: int = 64, repeat: int = 5) -> float:
+    """Measure the throughput of band-pass filter and envelope detection.
+
+    Args:
+        frames: Array of shape (N, L) with int16 samples
+        sampling_rate: Sampling rate in Hz
+        probe_frequency: Center frequency in Hz
+        batch_size: Number of frames per batch
+        repeat: Number of passes over all frames
+
+    Returns:
+        float: Frames per second on one core
+    """
+    stage = BandpassEnvelope(sampling_rate, probe_frequency)
+    batches = [frames[i:i + batch_size] for i in range(0, len(frames) - batch_size + 1, batch_size)]
+    filtered, envelope = stage.process(batches[0]) # allocate the buffers
+    reference_filtered, reference_envelope = reference_bandpass_envelope(batches[0], sampling_rate, probe_frequency)
+    tolerance = 1E-4 * np.abs(reference_envelope).max()
+    assert np.allclose(filtered, reference_filtered, atol=tolerance), 'Filtered signal differs from the reference'
+    assert np.allclose(envelope, reference_envelope, atol=tolerance), 'Envelope differs from the reference'
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for batch in batches:
+            stage.process(batch)
+    elapsed = time.perf_counter() - start
+    return repeat * len(batches) * batch_size / elapsed
+
+def main() -> None:
+    """Benchmark the filter on JSON blocks of a directory or on synthetic frames."""
+    import sys
+    from a1570.ascan_codec import load_json_frames, synthetic_frames
+    frames = load_json_frames(sys.argv[1]) if len(sys.argv) > 1 else synthetic_frames()
+    print(f'{len(frames)} frames of {frames.shape[1]} samples, {"float32" if _FFT_OUT else "float64"} FFT')
+    for length in (frames.shape[1], frames.shape[1] // 4):
+        for sampling_rate in (25E6, 50E6, 100E6):
+            frame_rate = benchmark_filter(frames[:, :length], sampling_rate, 3E6)
+            print(f'L = {length}, {sampling_rate / 1E6:.0f} MHz: {frame_rate:.0f} frames/s per core')
+    print(f'Filter responses: {filter_response.cache_info()}')
+
+if __name__ == '__main__':
+    main()
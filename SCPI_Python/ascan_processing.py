@@ -0,0 +1,112 @@
+"""
+Host-side analysis of raw A-scan vectors.
+
+The device evaluates the strobe window internally. These helpers apply the same kind
+of evaluation to vectors fetched with get_vector_from_SCPI() or loaded from an archive,
+e.g. to reprocess a sweep offline or to score acquisition settings.
+
+This module provides helpers for:
+- Echo peak positions inside the strobe window
+- Thickness from the time of flight between two echoes
+- Signal-to-noise ratio of the strobe window
+- Saturation (clipping) checks
+"""
+
+from typing import Optional
+
+import numpy as np
+
+# full scale of the 16 bit signed samples
+FULL_SCALE = 32767
+
+def peak_positions(vector: np.ndarray, strobe_begin: int, strobe_width: int,
+                   strobe_level: float, max_peaks: int = 2, min_distance: int = 10) -> np.ndarray:
+    """Find echo peaks inside the strobe window.
+
+    A peak is a local maximum of the rectified signal above the strobe level.
+    Peaks closer than min_distance to a stronger peak are discarded.
+
+    Args:
+        vector: A-scan samples
+        strobe_begin: Start of the strobe window in samples
+        strobe_width: Width of the strobe window in samples
+        strobe_level: Threshold in percent of full scale (0-100%)
+        max_peaks: Maximum number of peaks to return
+        min_distance: Minimum distance between two peaks in samples
+
+    Returns:
+        np.ndarray: Sample positions of the peaks in ascending order
+    """
+    window = np.abs(np.asarray(vector[strobe_begin:strobe_begin + strobe_width], dtype=np.int32))
+    if window.size < 3:
+        return np.empty(0, dtype=np.int64)
+    threshold = strobe_level / 100 * FULL_SCALE
+    middle = window[1:-1]
+    candidates = np.flatnonzero((middle >= threshold) & (middle >= window[:-2]) & (middle > window[2:])) + 1
+
+    # keep the strongest peaks that are far enough apart
+    peaks = []
+    for position in candidates[np.argsort(window[candidates])[::-1]]:
+        if all(abs(position - p) >= min_distance for p in peaks):
+            peaks.append(position)
+            if len(peaks) == max_peaks:
+                break
+    return np.sort(np.array(peaks, dtype=np.int64)) + strobe_begin
+
+def thickness_from_peaks(positions: np.ndarray, sampling_rate: float, velocity: float) -> Optional[float]:
+    """Compute thickness from the time of flight between the first two echoes.
+
+    Args:
+        positions: Echo positions in samples
+        sampling_rate: Sampling rate in MHz
+        velocity: Sound velocity in m/s
+
+    Returns:
+        Optional[float]: Thickness in mm or None if less than two echoes were found
+    """
+    if len(positions) < 2:
+        return None
+    time_of_flight = (positions[1] - positions[0]) / (sampling_rate * 1E6) # s
+    # sound travels through the object twice between two echoes
+    return time_of_flight * velocity / 2 * 1000
+
+def strobe_snr(vectors: np.ndarray, strobe_begin: int, strobe_width: int,
+               noise_begin: Optional[int] = None, noise_width: Optional[int] = None) -> np.ndarray:
+    """Compute the signal-to-noise ratio of the strobe window.
+
+    Signal is the peak amplitude inside the strobe window, noise is the RMS of the
+    noise window (by default the samples after the strobe window to the end of the vector).
+
+    Args:
+        vectors: A-scan samples of shape (L,) or (N, L)
+        strobe_begin: Start of the strobe window in samples
+        strobe_width: Width of the strobe window in samples
+        noise_begin: Start of the noise window in samples
+        noise_width: Width of the noise window in samples
+
+    Returns:
+        np.ndarray: SNR in dB, one value per vector
+    """
+    vectors = np.asarray(vectors)
+    if noise_begin is None:
+        noise_begin = strobe_begin + strobe_width
+    noise_end = vectors.shape[-1] if noise_width is None else noise_begin + noise_width
+    signal = np.abs(vectors[..., strobe_begin:strobe_begin + strobe_width]).max(axis=-1).astype(np.float64)
+    noise_window = vectors[..., noise_begin:noise_end].astype(np.float64)
+    noise = np.sqrt(np.mean(noise_window ** 2, axis=-1))
+    return 20 * np.log10(np.maximum(signal, 1) / np.maximum(noise, 1))
+
+def is_saturated(vectors: np.ndarray, margin: int = 16, min_samples: int = 1) -> np.ndarray:
+    """Check whether the signal is clipped at full scale.
+
+    Args:
+        vectors: A-scan samples of shape (L,) or (N, L)
+        margin: Samples closer than margin to full scale count as clipped
+        min_samples: Number of clipped samples needed to report saturation
+
+    Returns:
+        np.ndarray: True per vector if it is saturated
+    """
+    vectors = np.asarray(vectors)
+    clipped = (vectors >= FULL_SCALE - margin) | (vectors <= -FULL_SCALE - 1 + margin)
+    return np.count_nonzero(clipped, axis=-1) >= min_samples
@@ -0,0 +1,147 @@
+"""
+Rolling B-scan of A-scan vectors in bounded memory.
+
+BScanBuffer keeps the latest rows of a B-scan (one row per A-scan, one column per depth
+sample) in a fixed-size ring buffer:
+
+- Every row is written twice, at its ring position and one capacity further, so the
+  latest rows are always one contiguous view (oldest row first) without copying.
+- Optional downsampling combines time_decimation vectors into one row and
+  depth_decimation samples into one column, by peak amplitude or mean.
+- All buffers are allocated once, appending a vector costs O(samples).
+
+BScanPlot draws the view with matplotlib and only updates the image data per frame.
+
+Example:
+    >>> bscan = BScanBuffer(capacity=200, samples=2048, depth_decimation=4)
+    >>> header, vector = get_frame_from_SCPI(inst)
+    >>> bscan.append(vector)
+    >>> bscan.view      # (rows, 512) int16, oldest row first
+"""
+
+from typing import Optional
+
+import numpy as np
+
+REDUCTIONS = ('peak', 'mean')
+
+class BScanBuffer:
+    """Fixed-capacity ring buffer of downsampled A-scan rows.
+
+    Args:
+        capacity: Number of rows kept
+        samples: Samples per vector, longer vectors are cut and shorter ones padded with 0
+        time_decimation: Vectors combined into one row
+        depth_decimation: Samples combined into one column
+        reduction: 'peak' for the peak amplitude (rectified) or 'mean' for the mean (signed)
+    """
+    def __init__(self, capacity: int, samples: int, time_decimation: int = 1, depth_decimation: int = 1,
+                 reduction: str = 'peak'):
+        if reduction not in REDUCTIONS:
+            raise ValueError(f'Unknown reduction {reduction}, use one of {REDUCTIONS}')
+        self.capacity = capacity
+        self.samples = samples
+        self.time_decimation = time_decimation
+        self.depth_decimation = depth_decimation
+        self.reduction = reduction
+        self.columns = samples // depth_decimation
+        # every row is stored twice: view() is data[head:head + capacity]
+        self._data = np.zeros((2 * capacity, self.columns), dtype=np.int16)
+        self._input = np.zeros(self.columns * depth_decimation, dtype=np.int32)
+        self._row = np.zeros(self.columns, dtype=np.int32)
+        self._accumulator = np.zeros(self.columns, dtype=np.int32)
+        self._pending = 0 # vectors in the accumulator
+        self._head = 0 # index of the oldest row
+        self.rows = 0 # rows stored, up to capacity
+        self.appended = 0 # vectors appended
+
+    def append(self, vector: np.ndarray) -> bool:
+        """Append an A-scan vector.
+
+        Returns:
+            bool: True if a new row was completed
+        """
+        length = min(len(vector), len(self._input))
+        self._input[:length] = vector[:length]
+        self._input[length:] = 0
+        blocks = self._input.reshape(self.columns, self.depth_decimation)
+        if self.reduction == 'peak':
+            np.abs(self._input, out=self._input)
+            blocks.max(axis=1, out=self._row)
+        else:
+            blocks.sum(axis=1, out=self._row)
+            self._row //= self.depth_decimation
+
+        if self.reduction == 'peak':
+            np.maximum(self._accumulator, self._row, out=self._accumulator)
+        else:
+            self._accumulator += self._row
+        self._pending += 1
+        self.appended += 1
+        if self._pending < self.time_decimation:
+            return False
+
+        if self.reduction == 'mean':
+            self._accumulator //= self._pending
+        np.clip(self._accumulator, -32768, 32767, out=self._accumulator)
+        if self.rows < self.capacity:
+            index = self.rows
+            self.rows += 1
+        else:
+            index = self._head
+            self._head = (self._head + 1) % self.capacity
+        self._data[index] = self._accumulator
+        self._data[index + self.capacity] = self._accumulator
+        self._accumulator.fill(0)
+        self._pending = 0
+        return True
+
+    @property
+    def view(self) -> np.ndarray:
+        """Contiguous view of the stored rows, oldest first. It is overwritten by later appends."""
+        if self.rows < self.capacity:
+            return self._data[:self.rows]
+        return self._data[self._head:self._head + self.capacity]
+
+    def clear(self) -> None:
+        """Forget all rows and counters, e.g. after the acquisition parameters changed."""
+        self._accumulator.fill(0)
+        self._pending = 0
+        self._head = 0
+        self.rows = 0
+        self.appended = 0
+
+class BScanPlot:
+    """Image of a B-scan buffer updated in place.
+
+    Args:
+        bscan: B-scan buffer to draw
+        ax: matplotlib axes, a new figure by default
+        vmax: Upper limit of the color scale, full scale by default
+    """
+    def __init__(self, bscan: BScanBuffer, ax=None, vmax: Optional[float] = None):
+        import matplotlib.pyplot as plt
+        self.bscan = bscan
+        if ax is None:
+            _, ax = plt.subplots()
+        self.ax = ax
+        peak = bscan.reduction == 'peak'
+        vmax = 32767 if vmax is None else vmax
+        # depth downwards, time to the right, the latest row at the right edge
+        self.image = ax.imshow(np.zeros((bscan.columns, bscan.capacity), dtype=np.int16), aspect='auto',
+                               interpolation='nearest', cmap='viridis' if peak else 'seismic',
+                               vmin=0 if peak else -vmax, vmax=vmax,
+                               extent=(-bscan.capacity, 0, bscan.samples, 0))
+        ax.set_xlabel(f'Row (x{bscan.time_decimation} vectors)')
+        ax.set_ylabel('Sample')
+
+    def update(self) -> None:
+        """Draw the current rows, call e.g. plt.pause() afterwards to process GUI events."""
+        view = self.bscan.view
+        rows = len(view)
+        if rows == 0:
+            return
+        self.image.set_data(view.T)
+        self.image.set_extent((-rows, 0, self.bscan.samples, 0))
+        self.ax.set_xlim(-self.bscan.capacity, 0)
+        self.ax.figure.canvas.draw_idle()
@@ -0,0 +1,190 @@
+"""
+Persistent per-probe calibration cache for A1570 EMAT device.
+
+Calibration in air and on the calibration object takes tens of seconds and needs
+user interaction. The results (dead zones, eddy array, noise parameters and probe
+delay) only depend on the device, the probe type and the firmware, so they can be
+stored once and re-applied on the next start.
+
+This module provides helpers for:
+- Reading calibration parameters from the device
+- Storing them on disk keyed by device serial number, probe type and firmware
+- Re-applying a stored calibration in one batched transfer
+"""
+
+import json
+import logging
+import math
+import os
+import re
+import time
+from dataclasses import asdict, dataclass
+from typing import List, Optional
+
+from a1570.common_functions import (check_error_queue_and_assert, parse_dead_zones,
+                                    parse_idn, write_commands)
+
+logger = logging.getLogger(__name__)
+
+# gains for which the device reports a dead zone
+DEAD_ZONE_GAINS = list(range(0, 45, 5))
+
+@dataclass
+class CalibrationData:
+    dead_zones: str # raw dead zones string "0:345;5:269;..."
+    probe_delay: float # us
+    eddy_array: Optional[str] = None # JSON string of calibration_eddy_array
+    noise: Optional[str] = None # JSON string of noise_function
+    created: float = 0.0 # unix time of the calibration
+
+def read_calibration(inst, include_eddy_and_noise: bool = True) -> CalibrationData:
+    """Read calibration parameters of the current probe from the device.
+
+    Args:
+        inst: VISA instrument instance
+        include_eddy_and_noise: Read eddy array and noise parameters too
+            (computed by the calibration in air of pulse magnet probes)
+
+    Returns:
+        CalibrationData: Calibration parameters stamped with the current time
+    """
+    dead_zones = inst.query('SENSe:DEZones?')
+    # read from the node the delay is applied to, see calibration_commands()
+    probe_delay = float(inst.query('SENSe:PROBe:DELay:PROCessing?'))
+    eddy_array = None
+    noise = None
+    if include_eddy_and_noise:
+        eddy_array = inst.query('SENSe:CALibration:EDARray?')
+        noise = inst.query('SENSe:CALibration:NOISe?')
+    return CalibrationData(dead_zones, probe_delay, eddy_array, noise, time.time())
+
+def validate_calibration(calibration: CalibrationData) -> None:
+    """Check that calibration parameters are complete and plausible.
+
+    Args:
+        calibration: Calibration parameters to check
+
+    Raises:
+        ValueError: If any parameter is missing or malformed
+    """
+    try:
+        dead_zones = parse_dead_zones(calibration.dead_zones.strip("'\""))
+    except ValueError as e:
+        raise ValueError(f'Malformed dead zones {calibration.dead_zones!r}') from e
+    gains = [dz[0] for dz in dead_zones]
+    if gains != DEAD_ZONE_GAINS:
+        raise ValueError(f'Dead zones do not cover gains {DEAD_ZONE_GAINS}. Received {gains}')
+    if any(dz[1] < 0 for dz in dead_zones):
+        raise ValueError(f'Negative dead zone in {calibration.dead_zones!r}')
+
+    if not math.isfinite(calibration.probe_delay) or calibration.probe_delay < 0:
+        raise ValueError(f'Invalid probe delay {calibration.probe_delay}')
+
+    if calibration.eddy_array is not None:
+        eddy = json.loads(calibration.eddy_array)
+        if (not isinstance(eddy, dict) or not isinstance(eddy.get('eddy'), list)
+                or not isinstance(eddy.get('eddy_start'), int)):
+            raise ValueError(f'Malformed eddy array {calibration.eddy_array!r}')
+
+    if calibration.noise is not None:
+        noise = json.loads(calibration.noise)
+        if not isinstance(noise, dict):
+            raise ValueError(f'Malformed noise parameters {calibration.noise!r}')
+        for key in ('noise_start', 'noise_end', 'noise_level'):
+            if not isinstance(noise.get(key), int):
+                raise ValueError(f'Missing {key} in noise parameters {calibration.noise!r}')
+
+def calibration_commands(calibration: CalibrationData) -> List[str]:
+    """Build the SCPI commands that set the calibration parameters.
+
+    Args:
+        calibration: Calibration parameters
+
+    Returns:
+        List[str]: SCPI commands in the order they have to be applied
+    """
+    dz = calibration.dead_zones.strip("'\"")
+    commands = [f"SENSe:DEZones '{dz}'"]
+    if calibration.noise is not None:
+        commands.append(f'SENSe:CALibration:NOISe {calibration.noise}')
+    if calibration.eddy_array is not None:
+        commands.append(f"SENSe:CALibration:EDARray '{calibration.eddy_array}'")
+    commands.append(f'SENSe:PROBe:DELay:PROCessing {calibration.probe_delay}')
+    return commands
+
+def apply_calibration(inst, calibration: CalibrationData, verify: bool = True) -> None:
+    """Re-apply stored calibration parameters in one batched transfer.
+
+    Args:
+        inst: VISA instrument instance
+        calibration: Calibration parameters to apply
+        verify: Read back dead zones and check the error queue afterwards
+
+    Raises:
+        AssertionError: If the device did not accept the calibration
+    """
+    write_commands(inst, calibration_commands(calibration))
+    if verify:
+        answ = inst.query('SENSe:DEZones?')
+        expected = calibration.dead_zones.strip("'\"")
+        assert answ.strip("'\"") == expected, f'Failed on applying dead zones {expected}. Received {answ}'
+        check_error_queue_and_assert(inst)
+
+class CalibrationStore:
+    """Calibration parameters stored as JSON files, one per device, probe and firmware.
+
+    Args:
+        directory: Folder holding the calibration files
+        max_age: Age in seconds after which a stored calibration is considered stale
+    """
+    def __init__(self, directory: str = 'calibration_cache', max_age: float = 30 * 24 * 3600):
+        self.directory = directory
+        self.max_age = max_age
+
+    def path(self, serial: str, probe_type: str, firmware: str) -> str:
+        """Return file path of the calibration for the given key."""
+        key = '_'.join(re.sub(r'[^A-Za-z0-9.-]+', '-', k) for k in (serial, probe_type, firmware))
+        return os.path.join(self.directory, f'{key}.json')
+
+    def path_for_idn(self, idn: str, probe_type: str) -> str:
+        """Return file path of the calibration for the device identified by its IDN string."""
+        _, _, serial, firmware = parse_idn(idn)
+        return self.path(serial, probe_type, firmware)
+
+    def save(self, idn: str, probe_type: str, calibration: CalibrationData) -> None:
+        """Store a calibration for the device identified by its IDN string.
+
+        Raises:
+            ValueError: If the calibration is not valid
+        """
+        validate_calibration(calibration)
+        os.makedirs(self.directory, exist_ok=True)
+        filename = self.path_for_idn(idn, probe_type)
+        # write to a temporary file first, so an interrupted save never leaves a broken cache
+        tmp_filename = f'{filename}.tmp'
+        with open(tmp_filename, 'w') as f:
+            json.dump(asdict(calibration), f, indent=4)
+        os.replace(tmp_filename, filename)
+        logger.info(f'Calibration saved to {filename}')
+
+    def load(self, idn: str, probe_type: str) -> Optional[CalibrationData]:
+        """Load a stored calibration for the device identified by its IDN string.
+
+        Returns:
+            Optional[CalibrationData]: Calibration or None if it is missing, stale or invalid
+        """
+        filename = self.path_for_idn(idn, probe_type)
+        if not os.path.exists(filename):
+            return None
+        try:
+            with open(filename, 'r') as f:
+                calibration = CalibrationData(**json.load(f))
+            validate_calibration(calibration)
+        except (ValueError, TypeError) as e:
+            logger.warning(f'Ignoring invalid calibration {filename}: {e}')
+            return None
+        age = time.time() - calibration.created
+        if age > self.max_age:
+            logger.info(f'Ignoring stale calibration {filename} ({age / 3600:.1f} h old)')
+            return None
+        return calibration
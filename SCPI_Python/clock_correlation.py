@@ -0,0 +1,209 @@
+"""
+Host/device clock correlation for measurement results.
+
+A result only carries the device time of day with one second resolution ("12:10:49")
+and a counter incremented with every measurement. ClockCorrelator assigns each new
+result a host timestamp with an error bound from the timing of the polls:
+
+- When a poll returns a new counter c, the result was produced after the previous poll
+  was sent, at most one period before this poll was sent and before this answer arrived.
+  This window is a hard bound of its host time.
+- Counters and window midpoints are fitted to a line host_time = t0 + period * counter
+  with exponential forgetting. The fit interpolates between polls and follows changes
+  of the result period. host_time_error is three standard errors of the fit, never
+  wider than the hard bound.
+- The one second device timestamps are intersected to bound the offset of the device
+  clock of day against the host clock, separately in windows of offset_window seconds.
+  The drift of the device clock (drift_ppm) is the slope of the offset from the first
+  to the current window, drift_error_ppm its bound from the widths of both windows.
+  It needs minutes to hours of results, depending on the accuracy needed.
+
+Every update is O(1) on a few running sums.
+
+Example:
+    >>> correlator = ClockCorrelator(nominal_period=0.25)
+    >>> send_time = time.time()
+    >>> answ = inst.query('FETCh:RESult:MEASure?')
+    >>> result = parse_measurement_result(answ)
+    >>> if correlator.observe(result, send_time, time.time()):
+    ...     print(result.host_time, result.host_time_error)
+"""
+
+import math
+import time
+from typing import Optional, Tuple
+
+from a1570.common_functions import Result
+
+SECONDS_PER_DAY = 24 * 3600
+
+def parse_device_time(timestamp: str) -> Optional[int]:
+    """Return the device time of day "HH:MM:SS" in seconds or None if it is malformed."""
+    try:
+        hours, minutes, seconds = (int(v) for v in timestamp.split(':'))
+    except (AttributeError, ValueError):
+        return None
+    return hours * 3600 + minutes * 60 + seconds
+
+class ClockCorrelator:
+    """Incremental estimate of the host time of every result counter.
+
+    Args:
+        nominal_period: Trigger interval of the device in seconds, used as period until the
+            fit has enough points
+        forgetting: Weight of older points per new point, closer to 1 averages longer
+        offset_window: Host seconds over which the device clock offset is intersected
+    """
+    def __init__(self, nominal_period: Optional[float] = None, forgetting: float = 0.995,
+                 offset_window: float = 60.0):
+        self.nominal_period = nominal_period
+        self.forgetting = forgetting
+        self.offset_window = offset_window
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget all points, e.g. after the device restarted the counter."""
+        self._last_counter: Optional[int] = None
+        self._last_send: float = 0.0
+        self._reference: Optional[Tuple[int, float]] = None # (counter, host time) of the origin of the fit
+        # weighted sums of the fit: weight, x, y, x*x, x*y, y*y
+        self._sums = [0.0] * 6
+        self.points = 0
+        self._reset_offset()
+
+    def _reset_offset(self) -> None:
+        self._offset_low = -math.inf # device clock offset bounds of the current window, host - device in s
+        self._offset_high = math.inf
+        self._window: Optional[Tuple[float, float]] = None # host time of the first and last result of the window
+        self._first_window: Optional[Tuple[float, float, float]] = None # (center host time, low, high)
+
+    @property
+    def period(self) -> Optional[float]:
+        """Host seconds between two counter increments."""
+        w, sx, sy, sxx, sxy, _ = self._sums
+        denominator = w * sxx - sx * sx
+        if self.points < 2 or denominator <= 0:
+            return self.nominal_period
+        return (w * sxy - sx * sy) / denominator
+
+    def _drift(self) -> Optional[Tuple[float, float]]:
+        """Return the drift and its error bound in ppm, None before the second window."""
+        if self._first_window is None or self._window is None:
+            return None
+        center, low, high = self._first_window
+        elapsed = sum(self._window) / 2 - center
+        if elapsed <= 0:
+            return None
+        # a device clock running fast makes the offset host - device smaller
+        change = (self._offset_low + self._offset_high) / 2 - (low + high) / 2
+        error = (self._offset_high - self._offset_low + high - low) / 2
+        return -change / elapsed * 1E6, error / elapsed * 1E6
+
+    @property
+    def drift_ppm(self) -> Optional[float]:
+        """Drift of the device clock against the host clock, positive if the device clock runs fast."""
+        drift = self._drift()
+        return drift[0] if drift is not None else None
+
+    @property
+    def drift_error_ppm(self) -> Optional[float]:
+        """Bound of the error of drift_ppm."""
+        drift = self._drift()
+        return drift[1] if drift is not None else None
+
+    @property
+    def device_clock_offset(self) -> Tuple[Optional[float], Optional[float]]:
+        """Offset of the device time of day against the host time of day in seconds and its error bound."""
+        if not math.isfinite(self._offset_low):
+            return None, None
+        return (self._offset_low + self._offset_high) / 2, (self._offset_high - self._offset_low) / 2
+
+    def _fit(self, x: float) -> Optional[Tuple[float, float]]:
+        """Return the fitted host time (relative to the reference) at x and its standard error."""
+        w, sx, sy, sxx, sxy, syy = self._sums
+        period = self.period
+        if period is None or w == 0:
+            return None
+        intercept = (sy - period * sx) / w
+        residual = max(0.0, syy - 2 * intercept * sy - 2 * period * sxy
+                       + intercept * intercept * w + 2 * intercept * period * sx + period * period * sxx)
+        mean_x = sx / w
+        spread = max(sxx - sx * mean_x, 1E-12)
+        return intercept + period * x, math.sqrt(residual / w * (1 / w + (x - mean_x) ** 2 / spread))
+
+    def observe(self, result: Result, send_time: float, receive_time: float) -> bool:
+        """Correlate a polled result and set result.host_time and result.host_time_error.
+
+        Args:
+            result: Parsed result of the poll
+            send_time: Host time (time.time()) the query was sent
+            receive_time: Host time the answer was received
+
+        Returns:
+            bool: True if the result is new, False if the counter did not change. The first
+            result has no error bound (host_time_error None) without a nominal period.
+        """
+        counter = result.counter
+        last_counter, last_send = self._last_counter, self._last_send
+        self._last_counter, self._last_send = counter, send_time
+        if last_counter is not None and counter < last_counter:
+            # counter restarted, e.g. after a device restart
+            self.reset()
+            self._last_counter, self._last_send = counter, send_time
+            last_counter = None
+        elif counter == last_counter:
+            return False
+
+        # hard bound: not there when the last poll was sent, there when this answer arrived
+        # and the next result not there when this poll was sent
+        low = last_send if last_counter is not None else -math.inf
+        period = self.period
+        if period is not None:
+            low = max(low, send_time - period)
+        high = receive_time
+        if self._reference is None:
+            self._reference = (counter, receive_time)
+        x = counter - self._reference[0]
+        if math.isfinite(low):
+            y = (low + high) / 2 - self._reference[1]
+            f = self.forgetting
+            self._sums = [f * s for s in self._sums]
+            for i, value in enumerate((1.0, x, y, x * x, x * y, y * y)):
+                self._sums[i] += value
+            self.points += 1
+
+        estimate = None
+        fit = self._fit(x) if self.points >= 3 else None
+        if fit is not None:
+            estimate = fit[0] + self._reference[1]
+        if not math.isfinite(low):
+            # first result without a period, only known to be older than this answer
+            estimate, error = high, None
+        elif estimate is None or not low <= estimate <= high:
+            # not enough points or fit outside the hard bound, use the bound itself
+            estimate, error = (low + high) / 2, (high - low) / 2
+        else:
+            error = min(max(estimate - low, high - estimate), 3 * fit[1] + 1E-6)
+        result.host_time = estimate
+        result.host_time_error = error
+
+        device_seconds = parse_device_time(result.timestamp)
+        if device_seconds is not None and error is not None:
+            local = time.localtime(estimate)
+            host_seconds = local.tm_hour * 3600 + local.tm_min * 60 + local.tm_sec + estimate % 1
+            # device time is truncated to seconds: device_seconds <= device time < device_seconds + 1
+            offset = (host_seconds - device_seconds + SECONDS_PER_DAY / 2) % SECONDS_PER_DAY - SECONDS_PER_DAY / 2
+            low_offset, high_offset = offset - 1 - error, offset + error
+            if low_offset > self._offset_high or high_offset < self._offset_low:
+                # clocks were set, start over, also with the drift
+                self._reset_offset()
+            elif self._window is not None and estimate - self._window[0] > self.offset_window:
+                # next window, the first one stays the reference of the drift
+                if self._first_window is None:
+                    self._first_window = (sum(self._window) / 2, self._offset_low, self._offset_high)
+                self._offset_low, self._offset_high = -math.inf, math.inf
+                self._window = None
+            self._offset_low = max(self._offset_low, low_offset)
+            self._offset_high = min(self._offset_high, high_offset)
+            self._window = (self._window[0] if self._window is not None else estimate, estimate)
+        return True
@@ -5,13 +5,21 @@ This module provides helper functions for:
 - Error queue handling and parsing
 - Dead zone parameter parsing
 - Measurement result parsing from JSON
+- Device identification parsing and batched command transfer
+- A-scan header decoding and frame gap detection
+- Region-of-interest data length and fetch timing
 """
 
 import json
-from typing import Tuple, List
-import pyvisa as visa
+import time
+from typing import TYPE_CHECKING, Optional, Tuple, List, Union
 import numpy as np
 
+# pyvisa is only needed for type hints, importing it would slow down the startup of headless tools
+if TYPE_CHECKING:
+    import pyvisa as visa
+    from a1570.dead_zones import DeadZoneModel
+
 def check_error_queue_and_assert(inst) -> None:
     """Assert that error queue is empty.
     
@@ -63,6 +71,40 @@ def parse_error(error_msg: str) -> Tuple[int, str]:
     msg = msg_spl[1] if len(msg_spl) == 2 else ''
     return num, msg
 
+def parse_idn(idn: str) -> Tuple[str, str, str, str]:
+    """Parse IDN string into its fields.
+    
+    Args:
+        idn: String like 'ACS-Solutions GmbH,A1570,123456789,ESP 1.25 MCU 6.01.244'
+        
+    Returns:
+        Tuple[str, str, str, str]: Manufacturer, model, serial number and firmware version
+    """
+    fields = [f.strip() for f in idn.split(',', 3)]
+    fields += [''] * (4 - len(fields))
+    manufacturer, model, serial, firmware = fields
+    return manufacturer, model, serial, firmware
+
+def write_commands(inst, commands: List[Union[str, bytes]]) -> None:
+    """Write several commands to the device in one transfer.
+    
+    Every command is terminated with the write termination of the instrument
+    and the whole batch is sent with a single write, so the device receives
+    all commands without waiting for a round-trip per command.
+    
+    Args:
+        inst: VISA instrument instance
+        commands: List of SCPI commands without termination, as strings or
+            already encoded bytes (see scpi_commands)
+    """
+    if not commands:
+        return
+    term = inst.write_termination.encode(inst.encoding)
+    message = b''.join(
+        (cmd if isinstance(cmd, bytes) else cmd.encode(inst.encoding)) + term
+        for cmd in commands)
+    inst.write_raw(message)
+
 def parse_dead_zones(answ: str) -> List[Tuple[int, int]]:
     """Parse dead zone string into list of gain/zone tuples.
     
@@ -79,8 +121,14 @@ def parse_dead_zones(answ: str) -> List[Tuple[int, int]]:
     dead_zones = [tuple(map(int, dz.split(':'))) for dz in answ.split(';')]
     return dead_zones
 
+# thickness reported by the device without a valid measurement, in um
+INVALID_THICKNESS_UM = (65535, -1)
+# the same in mm, the unit of Result.thickness
+INVALID_THICKNESS = tuple(t / 1000 for t in INVALID_THICKNESS_UM)
+
 class Result:
-    def __init__(self, command, contact, contact_quality, counter, gain, thickness, timestamp):
+    def __init__(self, command, contact, contact_quality, counter, gain, thickness, timestamp,
+                 host_time=None, host_time_error=None):
         self.command = command
         self.contact = contact
         self.contact_quality = contact_quality
@@ -88,6 +136,8 @@ class Result:
         self.gain = gain
         self.thickness = thickness # in mm
         self.timestamp = timestamp
+        self.host_time = host_time # unix time of the measurement, set by clock_correlation
+        self.host_time_error = host_time_error # error bound of host_time in s
 
 def parse_measurement_result(answ: str) -> Result:
     """Parse JSON measurement result into Result object.
@@ -124,35 +174,172 @@ def parse_measurement_result(answ: str) -> Result:
 
     return result_obj
 
-def get_vector_from_SCPI(inst:visa.Resource) -> np.ndarray:
+def has_thickness(result: Result) -> bool:
+    """Return True if the result has contact and a valid thickness."""
+    return bool(result.contact) and result.thickness not in INVALID_THICKNESS
+
+# number of 16 bit words of the header in front of every A-scan vector
+ASCAN_HEADER_WORDS = 14
+
+# layout of the A-scan header, only the vector index (bytes 16-17) is documented,
+# the other words are kept as raw values
+ASCAN_HEADER_DTYPE = np.dtype(
+    [(f'word_{i}', '<i2') for i in range(8)]
+    + [('vector_index', '<u2')]
+    + [(f'word_{i}', '<i2') for i in range(9, ASCAN_HEADER_WORDS)])
+
+def decode_header(arr: np.ndarray) -> np.void:
+    """Decode the A-scan header as a structured view, no data is copied.
+    
+    Args:
+        arr: Raw int16 array with header and vector data
+        
+    Returns:
+        np.void: Header record, e.g. header['vector_index']
     """
-    Fetch A-scan vector data from device using SCPI protocol.
+    return arr[:ASCAN_HEADER_WORDS].view(ASCAN_HEADER_DTYPE)[0]
+
+def get_frame_from_SCPI(inst:'visa.Resource') -> Tuple[np.void, np.ndarray]:
+    """
+    Fetch A-scan header and vector data from device using SCPI protocol.
+    
+    Both are views over the received binary block, the header can be checked
+    (e.g. with FrameTracker) before any processing cost is paid for the vector.
     
     Returns:
-        np.ndarray: Array containing A-scan amplitude values.
-        Data is returned as 16-bit signed integers.
-        
-    Note:
-        First 14 bytes in raw sigmal contain header information including:
-        - Bytes 16-17: Vector index counter
-        Actual vector data starts at index 14. Returned vector is 8192 samples long containing the ascan data without header.
+        Tuple[np.void, np.ndarray]: Header record with ASCAN_HEADER_DTYPE and
+        A-scan amplitude values as 16-bit signed integers.
     """
     arr = inst.query_binary_values(f'FETCh:ARRay?', 
                                         datatype='h',
                                         is_big_endian=False,
                                     expect_termination=True,
                                     header_fmt='ieee',
+                                    container=np.array,
                                     )
-    #bytes 16, 17 is vector index
-    header = arr[:14]
-    vector_index = header[8]
-
+    header = decode_header(arr)
     # cut header of 28 bytes, plot data as 16 bit signed integer
-    arr_vector = arr[14:]
+    arr_vector = arr[ASCAN_HEADER_WORDS:]
+    return header, arr_vector
+
+def get_vector_from_SCPI(inst:'visa.Resource') -> np.ndarray:
+    """
+    Fetch A-scan vector data from device using SCPI protocol.
     
+    Returns:
+        np.ndarray: Array containing A-scan amplitude values.
+        Data is returned as 16-bit signed integers.
+        
+    Note:
+        First 14 words in raw sigmal contain header information including:
+        - Bytes 16-17: Vector index counter
+        Actual vector data starts at index 14. Returned vector is 8192 samples long containing the ascan data without header.
+    """
+    header, arr_vector = get_frame_from_SCPI(inst)
     return arr_vector
 
-def set_strobe_parameters(inst:visa.Resource,strobe_level: int, strobe_begin: int, strobe_width: int):
+# full length of an A-scan vector in samples
+DATA_LENGTH_MAX = 8192
+
+def roi_data_length(strobe_begin: int, strobe_width: int, margin: int = 64, granularity: int = 128) -> int:
+    """Compute the smallest data length covering the strobe window.
+    
+    The vector always starts at sample 0, so it has to reach the end of the
+    strobe window plus a margin for echoes at the window border.
+    
+    Args:
+        strobe_begin: Start of strobe window (0-8191 samples)
+        strobe_width: Width of strobe window (0-8191 samples)
+        margin: Samples added after the strobe window
+        granularity: Data length is rounded up to a multiple of this value
+        
+    Returns:
+        int: Data length in samples, at most DATA_LENGTH_MAX
+    """
+    length = strobe_begin + strobe_width + margin
+    length = -(-length // granularity) * granularity
+    return min(length, DATA_LENGTH_MAX)
+
+def set_data_length(inst:'visa.Resource', length: int) -> int:
+    """Set the number of samples per A-scan vector.
+    
+    Args:
+        length: Data length in samples (up to 8192)
+        
+    Returns:
+        int: Data length reported back by the device
+    """
+    inst.write(f'SOURce:DATA:LENGth {length}')
+    answ = int(inst.query('SOURce:DATA:LENGth?'))
+    assert answ >= length, f'Failed on setting the data length to {length}. Received {answ}'
+    return answ
+
+def measure_fetch_rate(inst:'visa.Resource', count: int = 20) -> Tuple[float, float]:
+    """Measure the latency of fetching A-scan vectors.
+    
+    Args:
+        count: Number of vectors to fetch
+        
+    Returns:
+        Tuple[float, float]: Mean fetch latency in ms and vectors per second
+    """
+    start = time.perf_counter()
+    for _ in range(count):
+        get_frame_from_SCPI(inst)
+    elapsed = time.perf_counter() - start
+    return elapsed / count * 1000, count / elapsed
+
+class FrameTracker:
+    """Detect missed, repeated and out-of-order frames by their vector index.
+    
+    The vector index is a 16 bit counter incremented by the device for every
+    vector, so differences are evaluated modulo 65536.
+    """
+    def __init__(self, modulo: int = 65536):
+        self.modulo = modulo
+        self.last_index = None
+        self.received = 0 # new frames
+        self.missed = 0 # frames skipped by the counter
+        self.repeated = 0 # same frame fetched again
+        self.out_of_order = 0 # frames older than the last new frame
+
+    def update(self, vector_index: int) -> bool:
+        """Account a fetched frame.
+        
+        Args:
+            vector_index: Vector index from the frame header
+            
+        Returns:
+            bool: True if the frame is new and should be processed
+        """
+        vector_index = int(vector_index)
+        if self.last_index is None:
+            self.last_index = vector_index
+            self.received += 1
+            return True
+        step = (vector_index - self.last_index) % self.modulo
+        if step == 0:
+            self.repeated += 1
+            return False
+        if step > self.modulo // 2:
+            self.out_of_order += 1
+            return False
+        self.missed += step - 1
+        self.last_index = vector_index
+        self.received += 1
+        return True
+
+    @property
+    def fetched(self) -> int:
+        """Number of all accounted frames."""
+        return self.received + self.repeated + self.out_of_order
+
+    def __str__(self) -> str:
+        return (f'received {self.received}, missed {self.missed}, '
+                f'repeated {self.repeated}, out of order {self.out_of_order}')
+
+def set_strobe_parameters(inst:'visa.Resource',strobe_level: int, strobe_begin: int, strobe_width: int,
+                          dead_zones: Optional['DeadZoneModel'] = None):
     """
     Configure signal processing strobe window parameters
     
@@ -160,10 +347,19 @@ def set_strobe_parameters(inst:visa.Resource,strobe_level: int, strobe_begin: in
         strobe_level (int): Signal amplitude threshold (0-100%)
         strobe_begin (int): Start position of strobe window (0-8191 samples)
         strobe_width (int): Width of strobe window (0-8191 samples)
+        dead_zones (DeadZoneModel): Dead zones of the probe, if given the strobe begin is
+            checked against the dead zone at the gain of the device before anything is sent
+        
+    Raises:
+        ValueError: If the strobe window begins inside the dead zone
         
     Note: The strobe window defines where the algorithm looks for ultrasonic echoes.
     Proper configuration is critical for reliable thickness measurements.
     """
+    if dead_zones is not None:
+        # a strobe window inside the dead zone of the gain never sees an echo
+        dead_zones.validate_strobe_begin(strobe_begin, float(inst.query('GAIN:LEVel?')))
+
     inst.write(f'SENSe:STROBE:LEVel {strobe_level}')
     answ = inst.query('SENSe:STROBE:LEVel?')
     assert strobe_level == int(answ), f'Failed on setting the strobe level to {strobe_level}. Received {answ}'
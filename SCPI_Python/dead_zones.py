@@ -0,0 +1,79 @@
+"""
+Gain-indexed dead-zone model of the A1570 EMAT device.
+
+The device reports the dead zone (in samples) for the gains 0, 5, ..., 40 dB
+("0:345;5:269;..."). DeadZoneModel interpolates linearly between these steps for any
+gain from 0 to 40 dB:
+
+- The model is built once per calibration into a table over every integer dB and the
+  slope to the next dB, a lookup is two array reads and needs no search.
+- Lookups are vectorized, a batch of frames gets the dead zone of its gain each.
+- Strobe begin values are checked against the dead zone before they are sent.
+
+Example:
+    >>> model = DeadZoneModel.from_string(inst.query('SENSe:DEZones?'))
+    >>> model(17.5)                        # dead zone at 17.5 dB in samples
+    >>> model.samples(gains)               # rounded up, one per frame
+    >>> model.validate_strobe_begin(140, 15)
+"""
+
+from typing import Sequence, Tuple, Union
+
+import numpy as np
+
+from a1570.common_functions import parse_dead_zones
+
+# gain range of the device
+GAIN_MIN = 0 # dB
+GAIN_MAX = 40 # dB
+
+class DeadZoneModel:
+    """Dead zone as a piecewise linear function of the gain.
+
+    Args:
+        pairs: (gain, dead_zone) pairs, e.g. from parse_dead_zones()
+
+    Raises:
+        ValueError: If there are no pairs or a dead zone is negative
+    """
+    def __init__(self, pairs: Sequence[Tuple[int, int]]):
+        if len(pairs) == 0:
+            raise ValueError('No dead zones')
+        pairs = np.array(sorted(pairs), dtype=float)
+        if (pairs[:, 1] < 0).any():
+            raise ValueError(f'Negative dead zone in {pairs.tolist()}')
+        self.gains = pairs[:, 0]
+        self.dead_zones = pairs[:, 1]
+        # values at every integer dB and the slope to the next one, exact for calibrated steps at integer gains
+        self._table = np.interp(np.arange(GAIN_MIN, GAIN_MAX + 1), self.gains, self.dead_zones)
+        self._slopes = np.diff(self._table, append=self._table[-1])
+
+    @classmethod
+    def from_string(cls, dead_zones: str) -> 'DeadZoneModel':
+        """Build the model from the dead zones string "0:345;5:269;..." (quotes are ignored)."""
+        return cls(parse_dead_zones(dead_zones.strip("'\"")))
+
+    def __call__(self, gains: Union[float, np.ndarray]) -> np.ndarray:
+        """Dead zone in samples for gains in dB, gains outside 0-40 dB are clipped."""
+        gains = np.clip(gains, GAIN_MIN, GAIN_MAX) - GAIN_MIN
+        index = gains.astype(np.intp)
+        return self._table[index] + (gains - index) * self._slopes[index]
+
+    def samples(self, gains: Union[float, np.ndarray]) -> np.ndarray:
+        """Dead zone in whole samples (rounded up) for gains in dB."""
+        return np.ceil(self(gains)).astype(np.intp)
+
+    def check_strobe_begin(self, strobe_begin: Union[int, np.ndarray],
+                           gains: Union[float, np.ndarray]) -> np.ndarray:
+        """Return True where the strobe window begins after the dead zone of the gain."""
+        return np.asarray(strobe_begin) >= self.samples(gains)
+
+    def validate_strobe_begin(self, strobe_begin: int, gain: float) -> None:
+        """Check a strobe begin before it is sent to the device.
+
+        Raises:
+            ValueError: If the strobe window begins inside the dead zone
+        """
+        if not self.check_strobe_begin(strobe_begin, gain):
+            raise ValueError(f'Strobe begin {strobe_begin} is inside the dead zone of '
+                             f'{int(self.samples(gain))} samples at {gain} dB')
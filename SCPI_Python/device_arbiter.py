@@ -0,0 +1,194 @@
+"""
+Thread-safe priority arbiter sharing one A1570 connection between threads.
+
+A pyvisa resource must not be used from several threads at once. The arbiter owns
+the connection and executes requests of all threads one after another in a worker
+thread. Requests are ordered by priority (results before vectors before telemetry)
+and combined where possible:
+
+- identical queries waiting at the same time are answered by one exchange
+- writes waiting at the same time are sent in one batched transfer
+
+Writes are always sent before the next exchange, so a thread that writes and then
+queries sees its own writes applied regardless of the priorities.
+
+Example:
+    >>> arbiter = DeviceArbiter(inst)
+    >>> answ = arbiter.query('FETCh:RESult:MEASure?', PRIORITY_RESULT)
+    >>> header, vector = arbiter.fetch_frame()
+    >>> arbiter.close()
+"""
+
+import itertools
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from a1570.common_functions import get_frame_from_SCPI, write_commands
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_RESULT = 0 # measurement results
+PRIORITY_VECTOR = 1 # A-scan vectors
+PRIORITY_TELEMETRY = 2 # temperature, battery, status
+PRIORITY_NAMES = {PRIORITY_RESULT: 'result', PRIORITY_VECTOR: 'vector', PRIORITY_TELEMETRY: 'telemetry'}
+
+@dataclass
+class Request:
+    kind: str # 'query' or 'frame'
+    command: str
+    futures: List[Future] = field(default_factory=list)
+    enqueued: List[Tuple[int, float]] = field(default_factory=list) # (priority, time) per caller
+
+@dataclass
+class WaitStatistics:
+    count: int = 0
+    total: float = 0.0 # s
+    maximum: float = 0.0 # s
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+class DeviceArbiter:
+    """Owner of one device connection serving requests of many threads.
+
+    Args:
+        inst: VISA instrument instance, only used by the arbiter from now on
+    """
+    def __init__(self, inst):
+        self.inst = inst
+        self._queue: queue.PriorityQueue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[str, str], Request] = {}
+        self._writes: List[Tuple[str, Future]] = []
+        self.wait_statistics: Dict[int, WaitStatistics] = {p: WaitStatistics() for p in PRIORITY_NAMES}
+        self.exchanges = 0 # exchanges with the device
+        self.combined = 0 # requests answered by an exchange of another request
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='DeviceArbiter', daemon=True)
+        self._thread.start()
+
+    def submit(self, kind: str, command: str, priority: int) -> Future:
+        """Queue a request and return a future of its answer.
+
+        Args:
+            kind: 'query' for a text answer, 'frame' for an A-scan header and vector
+            command: SCPI query
+            priority: PRIORITY_RESULT, PRIORITY_VECTOR or PRIORITY_TELEMETRY
+
+        Returns:
+            Future: Resolves to the answer of the device
+        """
+        future: Future = Future()
+        now = time.perf_counter()
+        with self._lock:
+            if not self._running:
+                raise RuntimeError('Device arbiter is closed')
+            request = self._pending.get((kind, command))
+            if request is None:
+                request = Request(kind, command)
+                self._pending[(kind, command)] = request
+            request.futures.append(future)
+            request.enqueued.append((priority, now))
+        # a request may be queued several times with different priorities, the first one wins
+        self._queue.put((priority, next(self._sequence), request))
+        return future
+
+    def query(self, command: str, priority: int = PRIORITY_TELEMETRY, timeout: float = None) -> str:
+        """Query the device and wait for the answer."""
+        return self.submit('query', command, priority).result(timeout)
+
+    def fetch_frame(self, priority: int = PRIORITY_VECTOR, timeout: float = None) -> Tuple[np.void, np.ndarray]:
+        """Fetch an A-scan header and vector and wait for them."""
+        return self.submit('frame', 'FETCh:ARRay?', priority).result(timeout)
+
+    def write(self, command: str) -> Future:
+        """Queue a command, it is sent before the next exchange with the device.
+
+        Returns:
+            Future: Resolves to None once the command was sent
+        """
+        future: Future = Future()
+        with self._lock:
+            if not self._running:
+                raise RuntimeError('Device arbiter is closed')
+            self._writes.append((command, future))
+        # wake up the worker with the highest priority
+        self._queue.put((-1, next(self._sequence), None))
+        return future
+
+    def close(self) -> None:
+        """Serve the queued requests and stop the worker thread, the connection stays open."""
+        with self._lock:
+            self._running = False
+        self._queue.put((float('inf'), next(self._sequence), None))
+        self._thread.join()
+
+    def _flush_writes(self) -> None:
+        with self._lock:
+            writes, self._writes = self._writes, []
+        if not writes:
+            return
+        try:
+            write_commands(self.inst, [command for command, _ in writes])
+            for _, future in writes:
+                future.set_result(None)
+        except Exception as e:
+            # writes are often not awaited, so report the failure here as well
+            logger.error(f'Failed to write {len(writes)} commands: {e}')
+            for _, future in writes:
+                future.set_exception(e)
+
+    def _run(self) -> None:
+        while True:
+            priority, _, request = self._queue.get()
+            self._flush_writes()
+            if request is None:
+                if priority == float('inf'):
+                    return
+                continue
+            with self._lock:
+                if self._pending.get((request.kind, request.command)) is not request:
+                    # already answered by an exchange at a higher priority
+                    continue
+                del self._pending[(request.kind, request.command)]
+                futures = request.futures
+                enqueued = request.enqueued
+
+            now = time.perf_counter()
+            for caller_priority, enqueue_time in enqueued:
+                stats = self.wait_statistics[caller_priority]
+                wait = now - enqueue_time
+                stats.count += 1
+                stats.total += wait
+                stats.maximum = max(stats.maximum, wait)
+            self.exchanges += 1
+            self.combined += len(futures) - 1
+
+            try:
+                if request.kind == 'frame':
+                    answer = get_frame_from_SCPI(self.inst)
+                else:
+                    answer = self.inst.query(request.command)
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+            else:
+                for future in futures:
+                    future.set_result(answer)
+
+    def statistics(self) -> str:
+        """Describe queue wait times per priority and combined requests."""
+        lines = [f'{self.exchanges} exchanges, {self.combined} requests combined']
+        for priority, stats in self.wait_statistics.items():
+            lines.append(f'{PRIORITY_NAMES[priority]}: {stats.count} requests, wait mean '
+                         f'{stats.mean * 1000:.1f} ms, max {stats.maximum * 1000:.1f} ms')
+        return '\n'.join(lines)
@@ -0,0 +1,246 @@
+"""
+Firmware capability cache for A1570 EMAT device.
+
+The valid range of a parameter is only known to the firmware. It is reported through
+the MINimum, MAXimum, DEFault and UP keywords, and invalid values are only noticed
+later through the error queue. This module learns the ranges once per firmware
+version, stores them on disk and validates or clamps values locally, before any
+command is sent to the device.
+
+This module provides helpers for:
+- Learning minimum, maximum, default and step of the numeric parameters, and the
+  value set of enumerated parameters like the sampling frequency
+- Storing the ranges per model and firmware version
+- Validating, clamping and formatting parameter values
+"""
+
+import json
+import logging
+import os
+import re
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+
+from a1570.common_functions import parse_idn, read_error_queue
+from a1570.scpi_commands import COMMANDS, Command
+
+logger = logging.getLogger(__name__)
+
+# numeric parameters with firmware defined ranges, values in the base unit of the command
+PARAMETERS: Dict[str, Command] = {name: COMMANDS[name] for name in (
+    'gain',
+    'trigger_interval',
+    'sampling_frequency',
+    'pulse_level',
+    'transmitter_frequency',
+    'transmitter_period',
+    'transmitter_duration',
+    'average_count',
+    'magnet_voltage',
+    'magnet_delay',
+)}
+# UP steps walked from the minimum, a parameter reaching its maximum within them is enumerated
+MAX_ENUMERATED_VALUES = 16
+
+@dataclass
+class ParameterRange:
+    minimum: float
+    maximum: float
+    default: float
+    step: float # 0 if the parameter is continuous
+    values: Optional[List[float]] = None # every accepted value, None if the grid is too fine
+
+def learn_parameter_range(inst, command: Command, max_values: int = MAX_ENUMERATED_VALUES) -> ParameterRange:
+    """Learn the range of a parameter from the device.
+
+    The parameter is set to MINimum, MAXimum and DEFault and read back. Then it is
+    stepped UP from the minimum: if the maximum is reached within max_values steps,
+    every value is stored, so uneven sets like 25, 50, 100 MHz are validated exactly.
+    Otherwise the step is the difference after the first UP. The original value is
+    restored afterwards.
+
+    Args:
+        inst: VISA instrument instance
+        command: Command of the parameter, see scpi_commands.COMMANDS
+        max_values: Number of UP steps before the parameter is taken as a uniform grid
+
+    Returns:
+        ParameterRange: Range reported by the firmware
+    """
+    saved = inst.query(command.query)
+
+    values = []
+    for keyword in ('MIN', 'MAX', 'DEF'):
+        inst.write(command.format(keyword))
+        values.append(float(inst.query(command.query)))
+    minimum, maximum, default = values
+
+    inst.write(command.format('MIN'))
+    values = [minimum]
+    while len(values) <= max_values and values[-1] < maximum:
+        inst.write(command.format('UP'))
+        value = float(inst.query(command.query))
+        if value <= values[-1]:
+            break
+        values.append(value)
+    step = values[1] - values[0] if len(values) > 1 else 0.0
+
+    inst.write(command.restore(saved).decode('iso-8859-1'))
+    enumerated = values[-1] >= maximum
+    return ParameterRange(minimum, maximum, default, round(step, 12), values if enumerated else None)
+
+def learn_capabilities(inst, parameters: Dict[str, Command] = PARAMETERS) -> Dict[str, ParameterRange]:
+    """Learn the ranges of all parameters from the device.
+
+    Args:
+        inst: VISA instrument instance
+        parameters: Parameters to learn
+
+    Returns:
+        Dict[str, ParameterRange]: Range per parameter name
+
+    Raises:
+        AssertionError: If the device reported an error while learning
+    """
+    ranges = {name: learn_parameter_range(inst, parameter) for name, parameter in parameters.items()}
+    err_num, err_msg = read_error_queue(inst)
+    assert err_num == 0, f'Found error in queue while learning capabilities: {err_msg}'
+    return ranges
+
+class DeviceCapabilities:
+    """Parameter ranges of one firmware version with local validation.
+
+    Args:
+        firmware: Firmware version string from the IDN
+        ranges: Range per parameter name
+    """
+    def __init__(self, firmware: str, ranges: Dict[str, ParameterRange]):
+        self.firmware = firmware
+        self.ranges = ranges
+
+    def validate(self, name: str, value: float) -> None:
+        """Check that a value is inside the range and on the step grid of a parameter.
+
+        Raises:
+            ValueError: If the value would be rejected by the device
+        """
+        r = self.ranges[name]
+        unit = PARAMETERS[name].base_unit
+        if not r.minimum <= value <= r.maximum:
+            raise ValueError(f'{name} {value} {unit} is out of range [{r.minimum}, {r.maximum}]')
+        if r.values is not None:
+            if abs(self.clamp(name, value) - value) > 1E-9 * max(abs(value), 1):
+                raise ValueError(f'{name} {value} {unit} is not one of {r.values}')
+        elif r.step and abs(self.clamp(name, value) - value) > r.step * 1E-6:
+            raise ValueError(f'{name} {value} {unit} is not a multiple of {r.step} from {r.minimum}')
+
+    def clamp(self, name: str, value: float) -> float:
+        """Return the nearest value the device accepts for a parameter."""
+        r = self.ranges[name]
+        if r.values is not None:
+            return min(r.values, key=lambda v: abs(v - value))
+        value = min(max(value, r.minimum), r.maximum)
+        if r.step:
+            value = r.minimum + round((value - r.minimum) / r.step) * r.step
+            value = min(round(value, 12), r.maximum)
+        return value
+
+    def command(self, name: str, value: float, clamp: bool = False) -> str:
+        """Format the command setting a parameter after local validation.
+
+        Args:
+            name: Parameter name
+            value: Value in base units
+            clamp: Clamp the value instead of raising on invalid values
+
+        Returns:
+            str: SCPI command
+
+        Raises:
+            ValueError: If clamp is False and the value is invalid
+        """
+        if clamp:
+            value = self.clamp(name, value)
+        else:
+            self.validate(name, value)
+        return PARAMETERS[name].format(value)
+
+class CapabilityStore:
+    """Parameter ranges stored as JSON files, one per model and firmware version.
+
+    Args:
+        directory: Folder holding the capability files
+    """
+    def __init__(self, directory: str = 'capability_cache'):
+        self.directory = directory
+
+    def path(self, model: str, firmware: str) -> str:
+        """Return file path of the capabilities for the given model and firmware."""
+        key = '_'.join(re.sub(r'[^A-Za-z0-9.-]+', '-', k) for k in (model, firmware))
+        return os.path.join(self.directory, f'{key}.json')
+
+    def load(self, idn: str) -> Optional[DeviceCapabilities]:
+        """Load stored capabilities of the firmware identified by the IDN string.
+
+        Returns:
+            Optional[DeviceCapabilities]: Capabilities or None if not stored, incomplete or invalid
+        """
+        _, model, _, firmware = parse_idn(idn)
+        filename = self.path(model, firmware)
+        if not os.path.exists(filename):
+            return None
+        try:
+            with open(filename, 'r') as f:
+                stored = json.load(f)
+            ranges = {name: ParameterRange(**r) for name, r in stored.items()}
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.warning(f'Ignoring invalid capabilities {filename}: {e}')
+            return None
+        # files of older versions have no value sets, a uniform step may be wrong
+        if set(ranges) != set(PARAMETERS) or any('values' not in r for r in stored.values()):
+            logger.info(f'Capabilities {filename} do not cover all parameters, learning again')
+            return None
+        return DeviceCapabilities(firmware, ranges)
+
+    def save(self, idn: str, ranges: Dict[str, ParameterRange]) -> None:
+        """Store capabilities of the firmware identified by the IDN string."""
+        _, model, _, firmware = parse_idn(idn)
+        os.makedirs(self.directory, exist_ok=True)
+        filename = self.path(model, firmware)
+        tmp_filename = f'{filename}.tmp'
+        with open(tmp_filename, 'w') as f:
+            json.dump({name: asdict(r) for name, r in ranges.items()}, f, indent=4)
+        os.replace(tmp_filename, filename)
+        logger.info(f'Capabilities saved to {filename}')
+
+def get_capabilities(inst, idn: str, store: Optional[CapabilityStore] = None) -> DeviceCapabilities:
+    """Return capabilities of the connected firmware, learning them on first use.
+
+    Note: Learning changes each parameter on the device for a moment and restores it
+    afterwards, so call it before configuring the measurement.
+
+    Args:
+        inst: VISA instrument instance
+        idn: IDN string of the device
+        store: Capability store, default folder 'capability_cache'
+
+    Returns:
+        DeviceCapabilities: Parameter ranges of the firmware
+    """
+    store = store or CapabilityStore()
+    capabilities = store.load(idn)
+    if capabilities is None:
+        logger.info('Learning parameter ranges of the firmware...')
+        ranges = learn_capabilities(inst)
+        store.save(idn, ranges)
+        capabilities = DeviceCapabilities(parse_idn(idn)[3], ranges)
+    return capabilities
+
+def check_values(capabilities: DeviceCapabilities, name: str, values: List[float]) -> None:
+    """Validate a list of values of one parameter, e.g. the axis of a sweep.
+
+    Raises:
+        ValueError: If any value would be rejected by the device
+    """
+    for value in values:
+        capabilities.validate(name, value)
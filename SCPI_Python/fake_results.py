@@ -0,0 +1,14 @@
+"""
+Measurement results for the offline tests, as the device answers FETCh:RESult:MEASure?.
+"""
+
+import json
+
+from a1570.common_functions import Result, parse_measurement_result
+
+def device_result(thickness_um: int = 10000, contact: bool = True, quality: int = 100, counter: int = 0,
+                  timestamp: str = '12:10:49') -> Result:
+    """Result as parsed from the JSON answer of FETCh:RESult:MEASure?."""
+    return parse_measurement_result(json.dumps({
+        'command': 'measurement_result', 'contact': contact, 'contact_quality': quality,
+        'counter': counter, 'gain': 15, 'thickness': thickness_um, 'timestamp': timestamp}))
@@ -0,0 +1,204 @@
+"""
+Background health telemetry of the A1570 EMAT device.
+
+Probe temperature, battery and channel status change slowly, so querying them in the
+measurement loop only costs round-trips. HealthSampler polls each of them on its own
+interval in a background thread through a DeviceArbiter (lowest priority) and keeps
+the latest readings with timestamps. The measurement loop reads the cached values.
+
+Every reading is classified as 'ok', 'warning' or 'error'. When the level of a channel
+changes, a TelemetryEvent is logged and passed to the optional event callback.
+
+Example:
+    >>> arbiter = DeviceArbiter(inst)
+    >>> sampler = HealthSampler(arbiter)
+    >>> sampler.start()
+    >>> temperature = sampler.value('probe_temperature')
+    >>> sampler.stop()
+"""
+
+import logging
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from a1570.device_arbiter import PRIORITY_TELEMETRY, DeviceArbiter
+from a1570.scpi_commands import COMMANDS
+
+logger = logging.getLogger(__name__)
+
+LEVEL_OK = 'ok'
+LEVEL_WARNING = 'warning'
+LEVEL_ERROR = 'error'
+
+# probe temperature thresholds in Celsius degrees
+TEMPERATURE_DISCONNECTED = -60 # below, the pulse magnet probe is probably not connected
+TEMPERATURE_WARNING = 50 # above, the measurement is slowed down by the device
+TEMPERATURE_ERROR = 75 # above, the measurement is stopped by the device until the probe cooled down
+
+@dataclass
+class Reading:
+    value: Any # parsed value
+    raw: str # answer of the device
+    timestamp: float # s, time.time() of the reading
+    level: str # LEVEL_OK, LEVEL_WARNING or LEVEL_ERROR
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.timestamp
+
+@dataclass
+class TelemetryEvent:
+    channel: str
+    level: str
+    message: str
+    reading: Reading
+
+@dataclass
+class TelemetryChannel:
+    name: str
+    query: str # SCPI query
+    interval: float # s between two readings
+    parse: Callable[[str], Any]
+    check: Callable[[Any], Tuple[str, str]] # returns level and message
+
+def parse_number(answ: str) -> Optional[float]:
+    """Return the first number of an answer or None if it has none."""
+    match = re.search(r'[-+]?\d+(\.\d*)?([eE][-+]?\d+)?', answ)
+    return float(match.group()) if match else None
+
+def check_temperature(temperature: Optional[float]) -> Tuple[str, str]:
+    if temperature is None:
+        return LEVEL_ERROR, 'Probe temperature not available.'
+    if temperature < TEMPERATURE_DISCONNECTED:
+        return LEVEL_ERROR, f'Probe temperature = {temperature}°C. Check probe connection.'
+    if temperature > TEMPERATURE_ERROR:
+        return LEVEL_ERROR, f'Probe temperature = {temperature}°C. No measurements possible until the probe cooled down.'
+    if temperature > TEMPERATURE_WARNING:
+        return LEVEL_WARNING, f'Probe temperature = {temperature}°C. Measurements will be slowed down.'
+    return LEVEL_OK, f'Probe temperature = {temperature}°C.'
+
+def battery_check(warning_level: float) -> Callable[[Optional[float]], Tuple[str, str]]:
+    """Create a battery check warning below the level, in the unit reported by the firmware."""
+    def check(battery: Optional[float]) -> Tuple[str, str]:
+        if battery is None:
+            return LEVEL_WARNING, 'Battery state not available.'
+        if battery < warning_level:
+            return LEVEL_WARNING, f'Battery = {battery}. Charge or replace the batteries.'
+        return LEVEL_OK, f'Battery = {battery}.'
+    return check
+
+def check_channel_status(status: str) -> Tuple[str, str]:
+    return LEVEL_OK, f'Channel status = {status}.'
+
+def default_channels(temperature_interval: float = 60, battery_interval: float = 300,
+                     status_interval: float = 10, battery_warning: float = 20) -> List[TelemetryChannel]:
+    """Return the channels of probe temperature, battery and channel status.
+
+    Args:
+        temperature_interval: Seconds between temperature readings
+        battery_interval: Seconds between battery readings
+        status_interval: Seconds between channel status readings
+        battery_warning: Battery value below which a warning is raised
+    """
+    return [
+        TelemetryChannel('probe_temperature', COMMANDS['probe_temperature'].query, temperature_interval,
+                         parse_number, check_temperature),
+        TelemetryChannel('battery', COMMANDS['battery'].query, battery_interval,
+                         parse_number, battery_check(battery_warning)),
+        TelemetryChannel('channel_status', COMMANDS['channel_status'].query, status_interval,
+                         str.strip, check_channel_status),
+    ]
+
+class HealthSampler:
+    """Background sampler of health telemetry with cached readings.
+
+    Args:
+        arbiter: Device arbiter sharing the connection with the measurement
+        channels: Telemetry channels, see default_channels()
+        on_event: Called from the sampler thread when the level of a channel changed
+    """
+    def __init__(self, arbiter: DeviceArbiter, channels: Optional[List[TelemetryChannel]] = None,
+                 on_event: Optional[Callable[[TelemetryEvent], None]] = None):
+        self.arbiter = arbiter
+        self.channels = {c.name: c for c in (channels if channels is not None else default_channels())}
+        self.on_event = on_event
+        self.events: List[TelemetryEvent] = []
+        self._readings: Dict[str, Reading] = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Read all channels once and start the background thread."""
+        for channel in self.channels.values():
+            self.sample(channel.name)
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='HealthSampler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background thread, the cached readings stay available."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def sample(self, name: str) -> Reading:
+        """Read a channel from the device now and update the cache."""
+        channel = self.channels[name]
+        raw = self.arbiter.query(channel.query, PRIORITY_TELEMETRY)
+        value = channel.parse(raw)
+        level, message = channel.check(value)
+        reading = Reading(value, raw, time.time(), level)
+        with self._lock:
+            previous = self._readings.get(name)
+            self._readings[name] = reading
+        if previous is None or previous.level != level:
+            self._raise_event(TelemetryEvent(name, level, message, reading))
+        return reading
+
+    def latest(self, name: str) -> Optional[Reading]:
+        """Return the cached reading of a channel without a device round-trip."""
+        with self._lock:
+            return self._readings.get(name)
+
+    def value(self, name: str) -> Any:
+        """Return the cached value of a channel or None if it was not read yet."""
+        reading = self.latest(name)
+        return reading.value if reading is not None else None
+
+    def readings(self) -> Dict[str, Reading]:
+        """Return a copy of all cached readings."""
+        with self._lock:
+            return dict(self._readings)
+
+    def _raise_event(self, event: TelemetryEvent) -> None:
+        self.events.append(event)
+        if event.level == LEVEL_OK:
+            logger.info(event.message)
+        else:
+            logger.warning(event.message)
+        if self.on_event is not None:
+            self.on_event(event)
+
+    def _run(self) -> None:
+        next_time = {name: time.monotonic() + c.interval for name, c in self.channels.items()}
+        while True:
+            name = min(next_time, key=next_time.get)
+            if self._stop_event.wait(max(0.0, next_time[name] - time.monotonic())):
+                return
+            try:
+                self.sample(name)
+            except Exception as e:
+                logger.error(f'Failed to read {name}: {e}')
+            next_time[name] = time.monotonic() + self.channels[name].interval
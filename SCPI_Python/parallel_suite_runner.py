@@ -0,0 +1,112 @@
+"""
+Run the SCPI interface test suite in parallel on several A1570 devices.
+
+The tests of test_scpi_interface_a1570.py are distributed round-robin over the
+given VISA resources (real devices or local stand-in servers). Every shard runs
+in its own interpreter with one shared connection per device, and the wall time
+of each shard and of the whole run is reported.
+
+Usage:
+    python parallel_suite_runner.py tcpip::192.168.0.11::5025::SOCKET tcpip::192.168.0.12::5025::SOCKET
+    A1570_RESOURCES=tcpip::192.168.0.11::5025::SOCKET,tcpip::127.0.0.1::5026::SOCKET python parallel_suite_runner.py
+"""
+
+import argparse
+import logging
+import os
+import subprocess
+import sys
+import time
+import unittest
+from typing import List
+
+logger = logging.getLogger()
+logger.level = logging.INFO
+stream_handler = logging.StreamHandler(sys.stdout)
+logger.addHandler(stream_handler)
+
+test_module = 'test_scpi_interface_a1570'
+
+def list_tests(module: str = test_module) -> List[str]:
+    """Return the dotted names of all tests in the module.
+
+    Args:
+        module: Name of the test module
+
+    Returns:
+        List[str]: Names like 'module.class.test_name'
+    """
+    suite = unittest.defaultTestLoader.loadTestsFromName(module)
+    names = []
+    for case_suite in suite:
+        for test in case_suite:
+            names.append(test.id())
+    return names
+
+def shard_tests(tests: List[str], shards: int) -> List[List[str]]:
+    """Distribute tests round-robin over a number of shards.
+
+    Args:
+        tests: Test names
+        shards: Number of shards
+
+    Returns:
+        List[List[str]]: Test names per shard
+    """
+    return [tests[i::shards] for i in range(shards)]
+
+def run_parallel(resources: List[str], tests: List[str]) -> bool:
+    """Run the tests on all resources in parallel and report the wall times.
+
+    Args:
+        resources: VISA resource names, one shard per resource
+        tests: Test names to distribute
+
+    Returns:
+        bool: True if all shards passed
+    """
+    start = time.perf_counter()
+    processes = []
+    for resource, shard in zip(resources, shard_tests(tests, len(resources))):
+        if not shard:
+            continue
+        env = dict(os.environ, A1570_RESOURCE=resource)
+        cmd = [sys.executable, '-m', 'unittest', *shard]
+        # the test module is found next to this script, also when started from another folder
+        process = subprocess.Popen(cmd, env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+        processes.append((resource, len(shard), time.perf_counter(), process))
+
+    # poll the shards and report each one when it exits, in the order they finish
+    passed = True
+    running = processes
+    while running:
+        time.sleep(0.1)
+        still_running = []
+        for resource, count, shard_start, process in running:
+            returncode = process.poll()
+            if returncode is None:
+                still_running.append((resource, count, shard_start, process))
+                continue
+            passed = passed and returncode == 0
+            state = 'passed' if returncode == 0 else f'failed ({returncode})'
+            logger.info(f'{resource}: {count} tests {state} in {time.perf_counter() - shard_start:.1f} s')
+        running = still_running
+
+    logger.info(f'Total suite wall time: {time.perf_counter() - start:.1f} s '
+                f'for {len(tests)} tests on {len(processes)} devices')
+    return passed
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('resources', nargs='*', help='VISA resource names of the devices')
+    parser.add_argument('-k', '--filter', default='', help='only run tests containing this text')
+    args = parser.parse_args()
+
+    resources = args.resources or [r for r in os.environ.get('A1570_RESOURCES', '').split(',') if r]
+    if not resources:
+        parser.error('no resources given, pass them as arguments or in A1570_RESOURCES')
+
+    tests = [t for t in list_tests() if args.filter in t]
+    ok = run_parallel(resources, tests)
+    logger.removeHandler(stream_handler)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,181 @@
+"""
+Adaptive coarse-to-fine search for the best acquisition parameters.
+
+The exhaustive sweep of receive_data_all_parameters.py captures every combination of
+gain, pulse level, sampling rate and duration. This module scores each captured block
+on-line and only refines around promising settings:
+
+1. capture a coarse grid with every n-th value of each axis
+2. from the best points, probe the neighbours one axis at a time (pattern search)
+3. halve the stride and repeat until neighbouring values are reached
+
+Every setting is captured at most once. The result reports the best settings and how
+many acquisitions were saved compared with the full grid.
+"""
+
+import logging
+import time
+from dataclasses import dataclass
+from itertools import product
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from a1570.ascan_processing import is_saturated, strobe_snr
+from a1570.common_functions import ASCAN_HEADER_WORDS, decode_header, write_commands
+from a1570.scpi_commands import COMMANDS
+from a1570.sweep_archive import BlockParameters
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class SearchResult:
+    best: Tuple[int, ...] # index of the best value on each axis
+    best_score: float
+    scores: Dict[Tuple[int, ...], float] # score of every captured setting
+    grid_size: int # number of settings of the full grid
+
+    @property
+    def acquisitions(self) -> int:
+        return len(self.scores)
+
+    @property
+    def saved(self) -> int:
+        return self.grid_size - self.acquisitions
+
+def capture_block(inst, bp: BlockParameters, settle_time: float = 0.5, verify: bool = True) -> np.ndarray:
+    """Configure the acquisition parameters, start a measurement and fetch one A-scan.
+
+    Args:
+        inst: VISA instrument instance
+        bp: Acquisition parameters
+        settle_time: Time to wait after start in seconds
+        verify: Read back and log the parameters
+
+    Returns:
+        np.ndarray: A-scan samples without header
+    """
+    # set parameters in one transfer
+    write_commands(inst, [
+        COMMANDS['gain'].encode(bp.gain),
+        COMMANDS['pulse_level'].encode(bp.pulse_level),
+        COMMANDS['sampling_frequency'].encode(bp.sampling_rate, 'MHZ'),
+        COMMANDS['transmitter_duration'].encode(bp.duration),
+    ])
+    if verify:
+        logger.info(f'Gain: {inst.query(COMMANDS["gain"].query)}')
+        logger.info(f'Pulse level: {inst.query(COMMANDS["pulse_level"].query)}')
+        logger.info(f'Sampling rate: {inst.query(COMMANDS["sampling_frequency"].query)}')
+        logger.info(f'Duration: {inst.query(COMMANDS["transmitter_duration"].query)}')
+
+    # start measurement
+    inst.write('STAR')
+    time.sleep(settle_time)
+
+    # read data
+    arr = inst.query_binary_values('FETC?',
+                                   datatype='h',
+                                   is_big_endian=False,
+                                   expect_termination=True,
+                                   header_fmt='ieee',
+                                   container=np.array,
+                                   )
+    # stop measurement
+    inst.write('STOP')
+
+    # bytes 16, 17 is vector index
+    logger.info(f'Vector index: {decode_header(arr)["vector_index"]}')
+    # cut header of 14 words
+    return arr[ASCAN_HEADER_WORDS:]
+
+def score_block(vector: np.ndarray, strobe_begin: int, strobe_width: int) -> float:
+    """Score a block by the echo SNR inside the strobe window, clipped blocks score -inf."""
+    if is_saturated(vector):
+        return float('-inf')
+    return float(strobe_snr(vector, strobe_begin, strobe_width))
+
+def coarse_to_fine_search(evaluate: Callable[[Tuple[int, ...]], float], axis_sizes: Sequence[int],
+                          initial_stride: int = 4, top_k: int = 2) -> SearchResult:
+    """Maximize a score over a grid with coarse sampling and local refinement.
+
+    Args:
+        evaluate: Function returning the score of a grid point given by one index per axis
+        axis_sizes: Number of values on each axis
+        initial_stride: Largest stride of the coarse grid
+        top_k: Number of best points refined on each level
+
+    Returns:
+        SearchResult: Best point, all evaluated scores and the full grid size
+    """
+    scores: Dict[Tuple[int, ...], float] = {}
+
+    def score(point: Tuple[int, ...]) -> float:
+        if point not in scores:
+            scores[point] = evaluate(point)
+        return scores[point]
+
+    # coarse grid, the stride of short axes is limited so both ends are covered
+    strides = [max(1, min(initial_stride, (size - 1) // 2)) for size in axis_sizes]
+    coarse_axes = [sorted(set(range(0, size, stride)) | {size - 1}) for size, stride in zip(axis_sizes, strides)]
+    for point in product(*coarse_axes):
+        score(point)
+
+    while True:
+        # pattern search around the best points at the current stride
+        for start in sorted(scores, key=scores.get, reverse=True)[:top_k]:
+            current = start
+            improved = True
+            while improved:
+                improved = False
+                for axis, stride in enumerate(strides):
+                    for direction in (-stride, stride):
+                        index = current[axis] + direction
+                        if not 0 <= index < axis_sizes[axis]:
+                            continue
+                        neighbour = current[:axis] + (index,) + current[axis + 1:]
+                        if score(neighbour) > scores[current]:
+                            current = neighbour
+                            improved = True
+        if max(strides) == 1:
+            break
+        strides = [max(1, stride // 2) for stride in strides]
+
+    best = max(scores, key=scores.get)
+    return SearchResult(best, scores[best], scores, int(np.prod(axis_sizes)))
+
+def search_parameters(inst, axes: Dict[str, List], strobe_begin: int, strobe_width: int,
+                      averaging: int = 4, probe_frequency: float = 3,
+                      on_block: Optional[Callable[[BlockParameters, np.ndarray], None]] = None,
+                      **search_args) -> Tuple[BlockParameters, SearchResult]:
+    """Find the acquisition parameters with the best echo SNR on the device.
+
+    Args:
+        inst: VISA instrument instance
+        axes: Values of 'gain', 'pulse_level', 'sampling_rate' and 'duration'
+        strobe_begin: Start of the strobe window in samples
+        strobe_width: Width of the strobe window in samples
+        averaging: Averaging of all blocks (2^averaging)
+        probe_frequency: Probe frequency of all blocks in MHz
+        on_block: Called with every captured block, e.g. to archive it
+        **search_args: Arguments of coarse_to_fine_search()
+
+    Returns:
+        Tuple[BlockParameters, SearchResult]: Best parameters and search statistics
+    """
+    names = ['gain', 'pulse_level', 'sampling_rate', 'duration']
+
+    def parameters(point: Tuple[int, ...]) -> BlockParameters:
+        values = {name: axes[name][i] for name, i in zip(names, point)}
+        return BlockParameters(**values, averaging=averaging, probe_frequency=probe_frequency)
+
+    def evaluate(point: Tuple[int, ...]) -> float:
+        bp = parameters(point)
+        vector = capture_block(inst, bp)
+        if on_block is not None:
+            on_block(bp, vector)
+        score = score_block(vector, strobe_begin, strobe_width)
+        logger.info(f'{bp}: score {score:.1f} dB')
+        return score
+
+    result = coarse_to_fine_search(evaluate, [len(axes[name]) for name in names], **search_args)
+    return parameters(result.best), result
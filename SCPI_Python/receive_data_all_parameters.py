@@ -8,7 +8,12 @@ import numpy as np
 import pyvisa as visa
 import logging
 
-from common_functions import *
+from a1570.common_functions import *
+from a1570.session_recording import open_session
+from a1570.device_capabilities import check_values, get_capabilities
+from a1570.scpi_commands import COMMANDS
+from a1570.sweep_archive import BlockParameters, SweepArchive
+from a1570.parameter_search import capture_block, search_parameters
 
 # set up logging
 logger = logging.getLogger()
@@ -17,17 +22,6 @@ logger.level = logging.INFO
 stream_handler = logging.StreamHandler(sys.stdout)
 logger.addHandler(stream_handler)
 
-
-# Define a data class for block parameters
-@dataclass
-class BlockParameters:
-    gain: int # dB
-    pulse_level: int # V
-    sampling_rate: int # MHz
-    duration: float # number of periods 0.5, 1 ... 8
-    averaging: int = 4 # 2^averaging
-    probe_frequency: float = 3 # MHz
-
 def save_to_json_file(parameters:BlockParameters, data, filename:str):
     import json
     with open(filename, 'w') as f:
@@ -44,14 +38,21 @@ logger.info('Start receiving data from A1570...')
 
 
 directory = 'data_blocks'
+# additionally save every block as JSON file (the archive in the same directory holds all blocks)
+save_json = False
+# 'grid' captures all parameter combinations, 'adaptive' searches the best combination
+# by the echo SNR inside the strobe window and captures only a fraction of the grid
+search_mode = 'grid'
+# strobe window used to score the blocks in adaptive mode
+strobe_begin = 140 # 0-8191 samples
+strobe_width = 250 # 0-8191 samples
 if not os.path.exists(directory):
     os.makedirs(directory)
     
 # ip of the device and port
 ip: str = '192.168.0.11'
 port: int = 5025
-rm = visa.ResourceManager()
-inst = rm.open_resource(f'tcpip::{ip}::{str(port)}::SOCKET')
+inst = open_session(f'tcpip::{ip}::{str(port)}::SOCKET')
 inst.encoding = 'iso-8859-1'
 inst.timeout = 5000 # miliseconds
 inst.read_termination = '\r\n'
@@ -78,6 +79,10 @@ while True:
 idn: str = inst.query('*IDN?')
 logger.info(idn)
 
+# blocks are indexed by parameters, capture time and serial number in data_blocks/index.sqlite
+_, _, serial, _ = parse_idn(idn)
+archive = SweepArchive(directory)
+
 # set trigger to internal
 inst.write('TRIGgering:MODE INTERNAL')
 # read back trigger mode (optional)
@@ -121,6 +126,15 @@ pulse_levels = [200, 400, 600]
 sampling_rates = [25, 50, 100] 
 durations = list(np.arange(0.5, 8.5, 0.5)) #0.5 - 8.0
 
+# check all sweep values against the parameter ranges of the firmware before the sweep starts
+# (ranges are learned once per firmware version and cached in capability_cache)
+capabilities = get_capabilities(inst, idn)
+check_values(capabilities, 'gain', gains_array)
+check_values(capabilities, 'pulse_level', pulse_levels)
+check_values(capabilities, 'sampling_frequency', [rate * 1E6 for rate in sampling_rates])
+check_values(capabilities, 'transmitter_duration', durations)
+check_values(capabilities, 'average_count', [averaging])
+
 # set averaging
 inst.write(f'AVER:COUN {averaging}')
 time.sleep(0.5)
@@ -135,56 +149,34 @@ time.sleep(0.5)
 answ = inst.query('TRANsmitter:FREQuency?')
 logger.info(f'Probe frequency: {answ}')
 
-# iterate over all parameters
-for gain in gains_array:
-    for pulse_level in pulse_levels:
-        for sampling_rate in sampling_rates:
-            for duration in durations:
-                bp = BlockParameters(gain, pulse_level, sampling_rate, duration, averaging, probe_frequency)
-
-                # set parameters
-                inst.write(f'GAIN {gain} DB')
-                answ = inst.query(f'GAIN?')
-                logger.info(f'Gain: {answ}')
-                inst.write(f'TRANsmitter:PULS {pulse_level}')
-                answ = inst.query(f'TRANsmitter:PULS?')
-                logger.info(f'Pulse level: {answ}')
-                inst.write(f'FREQuency {sampling_rate} MHZ')
-                answ = inst.query(f'FREQuency?')
-                logger.info(f'Sampling rate: {answ}')
-                inst.write(f'TRANsmitter:DURation {duration}')
-                answ = inst.query(f'TRANsmitter:DURation?')
-                logger.info(f'Duration: {answ}')
-
-                # start measurement
-                inst.write(f'STAR')
-                time.sleep(0.5)
-
-                # read data
-                arr = inst.query_binary_values(f'FETC?', 
-                                                    datatype='h',
-                                                    is_big_endian=False,
-                                                    expect_termination=True,
-                                                    header_fmt='ieee',
-                                                )
-
-                # stop measurement
-                inst.write(f'STOP')
-
-                #bytes 16, 17 is vector index
-                vector_index = arr[8]
-                logger.info(f'Vector index: {vector_index}')
-
-                # cut header of 28 bytes, reverse bytes per word, plot data as 16 bit signed integer
-                arr_vector = arr[14:]
-                
-                save_to_json_file(bp, arr_vector, f'{directory}/block_{gain}_{pulse_level}_{sampling_rate}_{duration}.json')
-
-                # [params,vector] = load_from_json_file(f'{directory}/block_{gain}_{pulse_level}_{sampling_rate}_{duration}.json')
-
-
-# close connection
+def store_block(bp: BlockParameters, arr_vector) -> None:
+    archive.append(bp, arr_vector, serial)
+    if save_json:
+        save_to_json_file(bp, list(map(int, arr_vector)), f'{directory}/block_{bp.gain}_{bp.pulse_level}_{bp.sampling_rate}_{bp.duration}.json')
+
+    # [params,vector] = load_from_json_file(f'{directory}/block_{gain}_{pulse_level}_{sampling_rate}_{duration}.json')
+
+if search_mode == 'grid':
+    # iterate over all parameters
+    for gain in gains_array:
+        for pulse_level in pulse_levels:
+            for sampling_rate in sampling_rates:
+                for duration in durations:
+                    bp = BlockParameters(gain, pulse_level, sampling_rate, duration, averaging, probe_frequency)
+                    store_block(bp, capture_block(inst, bp))
+else:
+    # capture a coarse grid and refine only around the settings with the best echo SNR
+    axes = {'gain': gains_array, 'pulse_level': pulse_levels, 'sampling_rate': sampling_rates, 'duration': durations}
+    best, result = search_parameters(inst, axes, strobe_begin, strobe_width, averaging, probe_frequency,
+                                     on_block=store_block)
+    logger.info(f'Best settings: {best}, SNR {result.best_score:.1f} dB')
+    logger.info(f'{result.acquisitions} of {result.grid_size} blocks captured, '
+                f'{result.saved} acquisitions saved compared with the full grid')
+
+
+# close connection and archive
 inst.close()
+archive.close()
 
 # remove stream handler
 logger.removeHandler(stream_handler)
\ No newline at end of file
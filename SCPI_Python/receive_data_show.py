@@ -6,10 +6,11 @@ Features:
 - Configures internal triggering 
 - Fetches raw A-scan vectors
 - Displays signal using matplotlib
+- Shows a rolling B-scan of the following vectors (optional)
 
 Usage:
 1. Configure device IP address
-2. Run script to capture and display single A-scan
+2. Run script to capture and display single A-scan and a live B-scan
 3. Close plot window to end program
 """
 
@@ -17,10 +18,13 @@ Usage:
 import sys
 import time
 import matplotlib.pyplot as plt
+import numpy as np
 import pyvisa as visa
 import logging
 
-from common_functions import *
+from a1570.common_functions import *
+from a1570.session_recording import open_session
+from a1570.bscan_buffer import BScanBuffer, BScanPlot
 
 # Configure logging to show info level messages
 logger = logging.getLogger()
@@ -28,6 +32,12 @@ logger.level = logging.INFO
 stream_handler = logging.StreamHandler(sys.stdout)
 logger.addHandler(stream_handler)
 
+# number of vectors shown as live B-scan after the single A-scan (0 to skip)
+bscan_frames: int = 120
+# rows kept in the B-scan, samples combined into one B-scan pixel along depth
+bscan_rows: int = 100
+bscan_depth_decimation: int = 4
+
 logger.info('Start receiving data from A1570...')
 
 ### Device Configuration ###
@@ -36,8 +46,7 @@ ip: str = '192.168.0.2'  # Device IP address
 port: int = 5025         # Default SCPI port
 
 # Initialize VISA connection
-rm = visa.ResourceManager()
-inst = rm.open_resource(f'tcpip::{ip}::{str(port)}::SOCKET')
+inst = open_session(f'tcpip::{ip}::{str(port)}::SOCKET')
 inst.encoding = 'iso-8859-1'
 inst.timeout = 5000      # Timeout in milliseconds
 inst.read_termination = '\r\n'
@@ -84,21 +93,38 @@ arr = inst.query_binary_values(f'FETC?',
                                     is_big_endian=False,
                                     expect_termination=False,
                                     header_fmt='ieee',
+                                    container=np.array,
                                 )
 
+# live B-scan: every new vector is one row, the plot image is updated in place
+if bscan_frames > 0:
+    bscan = BScanBuffer(bscan_rows, len(arr) - ASCAN_HEADER_WORDS, depth_decimation=bscan_depth_decimation)
+    bscan_plot = BScanPlot(bscan)
+    tracker = FrameTracker()
+    plt.ion()
+    while tracker.received < bscan_frames and plt.fignum_exists(bscan_plot.ax.figure.number):
+        header, vector = get_frame_from_SCPI(inst)
+        if tracker.update(header['vector_index']):
+            bscan.append(vector)
+            bscan_plot.update()
+        plt.pause(0.001)
+    plt.ioff()
+    logger.info(f'B-scan frames: {tracker}')
+
 # stop measurement
 inst.write(f'STOP')
 
 # close connection
 inst.close()
 
-#bytes 16, 17 is vector index
-vector_index = arr[8]
-logger.info(f'Vector index: {vector_index}')
+# decode the 14 word header, bytes 16, 17 is vector index
+header = decode_header(arr)
+logger.info(f'Vector index: {header["vector_index"]}')
 
-# cut header of 28 bytes, reverse bytes per word, plot data as 16 bit signed integer
-arr_vector = arr[14:]
+# cut header of 28 bytes, plot data as 16 bit signed integer
+arr_vector = arr[ASCAN_HEADER_WORDS:]
 
+plt.figure()
 plt.plot(arr_vector)
 plt.show()
 
@@ -0,0 +1,321 @@
+"""
+Self-healing session to the A1570 EMAT device.
+
+A dropped TCP connection or a VisaIOError ends every script. ReconnectingSession is
+used like a pyvisa resource and keeps the state needed to recover:
+
+- attributes like timeout and terminations
+- the last value of every setting written (probe type, gain, dead zones, noise, eddy
+  array, probe delay, ...), including the batches of write_commands(); relative values
+  (MIN, MAX, DEF, UP, DOWN) are read back and kept as absolute values
+- the active measurement mode (STARt:... until STOP)
+
+When a call fails, the input buffer is cleared and a short *IDN? probe tells an
+ordinary timeout (e.g. the read_raw() used to clear buffers) from a dead connection.
+Late answers of the failed call are read until the IDN arrives, so later answers are
+not shifted. A dead connection is reopened with exponential backoff; settings,
+calibration and the measurement mode are re-applied in one batched transfer and the
+failed call is repeated once. Every outage is
+recorded with its duration and the number of results lost, derived from the result
+counter or from the trigger interval.
+
+Example:
+    >>> inst = ReconnectingSession('tcpip::192.168.0.1::5025::SOCKET')
+    >>> inst.write('GAIN 15')
+    >>> answ = inst.query('FETCh:RESult:MEASure?')
+    >>> inst.outages
+"""
+
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+from a1570.calibration_cache import CalibrationData, calibration_commands
+from a1570.common_functions import parse_idn, write_commands
+from a1570.scpi_commands import COMMANDS, NUMERIC_KEYWORDS, short_form
+from a1570.session_recording import open_session
+
+logger = logging.getLogger(__name__)
+
+# commands which are not settings and must not be re-applied
+EVENT_PREFIXES = ('*', 'STAR', 'STOP', 'SYST:ERR', 'FETC')
+# commands of the measurement modes, STOP ends all of them
+START_PREFIX = 'STAR'
+STOP_PREFIX = 'STOP'
+# calibration runs need the user and are never repeated automatically
+CALIBRATION_PREFIX = 'STAR:CAL'
+RESULT_QUERY_PREFIX = 'FETC:RES'
+TRIGGER_INTERVAL_HEADER = 'TRIG:INT'
+UNIT_SCALES = {'S': 1, 'MS': 1E-3, 'US': 1E-6, 'NS': 1E-9}
+
+@dataclass
+class Outage:
+    start: float # unix time the failure was detected
+    end: float = 0.0 # unix time the session was restored
+    attempts: int = 0 # connection attempts
+    lost_results: Optional[int] = None # None if it could not be determined
+    error: str = ''
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+def command_header(command: str) -> str:
+    """Return the short form of a command header, e.g. 'SOURce:GAIN:LEVel 5' -> 'GAIN'.
+
+    Headers written in different forms usually map to the same key. If they do not,
+    both commands are kept in the order they were written, so the last one still wins.
+    """
+    header = short_form(command.strip().split(' ', 1)[0]).upper()
+    for prefix in ('SOUR:', 'SENS:'):
+        if header.startswith(prefix):
+            header = header[len(prefix):]
+    return header[:-len(':LEV')] if header.endswith(':LEV') else header
+
+# commands of COMMANDS by the key of command_header(), to restore read back values
+SETTING_COMMANDS = {command_header(command.header): command for command in COMMANDS.values()}
+
+def parse_seconds(command: str) -> Optional[float]:
+    """Return the value of a time setting like 'TRIG:INT 250000 US' in seconds."""
+    fields = command.split()
+    if len(fields) < 2:
+        return None
+    try:
+        value = float(fields[1])
+    except ValueError:
+        return None
+    unit = fields[2].upper() if len(fields) > 2 else 'S'
+    return value * UNIT_SCALES.get(unit, 1)
+
+class ReconnectingSession:
+    """Proxy of a pyvisa resource that reconnects and restores the device state.
+
+    Args:
+        resource_name: VISA resource name
+        probe_timeout: Timeout of the probe query in milliseconds
+        backoff_initial: First delay between connection attempts in seconds
+        backoff_max: Maximum delay between connection attempts in seconds
+        max_outage: Give up and raise after this many seconds without connection
+        on_reconnect: Called with the new resource after the state was restored
+    """
+    def __init__(self, resource_name: str, probe_timeout: int = 500, backoff_initial: float = 0.5,
+                 backoff_max: float = 30, max_outage: float = 600,
+                 on_reconnect: Optional[Callable[[object], None]] = None):
+        d = self.__dict__
+        d['resource_name'] = resource_name
+        d['probe_timeout'] = probe_timeout
+        d['backoff_initial'] = backoff_initial
+        d['backoff_max'] = backoff_max
+        d['max_outage'] = max_outage
+        d['on_reconnect'] = on_reconnect
+        d['idn'] = None # IDN of the device, from the first *IDN? query or probe
+        d['outages'] = []
+        d['_attributes'] = OrderedDict()
+        d['_settings'] = OrderedDict()
+        d['_mode'] = None
+        d['_last_counter'] = None
+        d['_last_result_time'] = None
+        d['_pending_outage'] = None
+        d['_inst'] = self._open()
+
+    # attributes like timeout and terminations are stored and passed to the resource
+    def __getattr__(self, name):
+        return getattr(self._inst, name)
+
+    def __setattr__(self, name, value):
+        self._attributes[name] = value
+        setattr(self._inst, name, value)
+
+    @property
+    def downtime(self) -> float:
+        """Total time without connection in seconds."""
+        return sum(o.duration for o in self.outages)
+
+    @property
+    def lost_results(self) -> int:
+        """Results known to be lost in all outages."""
+        return sum(o.lost_results or 0 for o in self.outages)
+
+    def _open(self):
+        inst = open_session(self.resource_name)
+        try:
+            # detect a dead peer on idle connections too (pyvisa-py TCPIP sockets)
+            from pyvisa import constants
+            inst.set_visa_attribute(constants.VI_ATTR_TCPIP_KEEPALIVE, True)
+        except Exception:
+            pass
+        for name, value in self._attributes.items():
+            setattr(inst, name, value)
+        return inst
+
+    def _track(self, command: str) -> None:
+        header = command_header(command)
+        if header.startswith(CALIBRATION_PREFIX):
+            return
+        if header.startswith(STOP_PREFIX):
+            self.__dict__['_mode'] = None
+        elif header.startswith(START_PREFIX):
+            self.__dict__['_mode'] = command
+        elif not header.startswith(EVENT_PREFIXES) and not header.endswith('?'):
+            # the last value of a setting wins, move it to the end to keep the order of dependencies
+            self._settings.pop(header, None)
+            fields = command.split()
+            if len(fields) > 1 and fields[1].upper() in NUMERIC_KEYWORDS:
+                # a relative value must not be applied twice, keep the value it resulted in
+                command = self._read_back(header)
+                if command is None:
+                    return
+            self._settings[header] = command
+
+    def _read_back(self, header: str) -> Optional[str]:
+        """Return the command setting the current value of a setting, None if unknown."""
+        setting = SETTING_COMMANDS.get(header)
+        if setting is None or setting.kind not in ('int', 'float'):
+            logger.info(f'{header} was set to a relative value and is not restored after a reconnect')
+            return None
+        return setting.restore(self._call('query', setting.query)).decode('iso-8859-1')
+
+    def _track_result(self, answ: str) -> None:
+        try:
+            counter = json.loads(answ)['counter']
+        except (ValueError, KeyError, TypeError):
+            return
+        outage = self._pending_outage
+        if outage is not None:
+            if self._last_counter is not None and counter > self._last_counter:
+                # the device kept counting, the gap is exact
+                outage.lost_results = counter - self._last_counter - 1
+            self.__dict__['_pending_outage'] = None
+        self.__dict__['_last_counter'] = counter
+        self.__dict__['_last_result_time'] = time.time()
+
+    def _is_idn(self, answ: str) -> bool:
+        """Check that an answer is the IDN of the device and not a late answer of another query."""
+        if self.idn is not None:
+            return answ == self.idn
+        # results are JSON objects, an IDN has four plain fields
+        return not answ.startswith('{') and all(parse_idn(answ))
+
+    def _is_alive(self) -> bool:
+        inst = self._inst
+        timeout = self._attributes.get('timeout', self.probe_timeout)
+        try:
+            inst.timeout = self.probe_timeout
+            # the answer to a timed-out query may still arrive, it must not be read as the
+            # answer to the probe or every later answer would be one behind
+            inst.clear()
+            deadline = time.monotonic() + self.probe_timeout / 1000
+            answ = inst.query('*IDN?')
+            while not self._is_idn(answ):
+                # late answer arrived after the clear, the IDN follows
+                if time.monotonic() > deadline:
+                    return False
+                answ = inst.read()
+            self.__dict__['idn'] = answ
+            return True
+        except Exception:
+            return False
+        finally:
+            try:
+                inst.timeout = timeout
+            except Exception:
+                pass
+
+    def remember_calibration(self, calibration: CalibrationData) -> None:
+        """Keep a calibration done on the device (e.g. in air) to restore it after a reconnect."""
+        for command in calibration_commands(calibration):
+            self._track(command)
+
+    def restore_commands(self) -> List[str]:
+        """Return the commands that restore settings, calibration and measurement mode."""
+        commands = list(self._settings.values())
+        if self._mode is not None:
+            commands.append(self._mode)
+        return commands
+
+    def _reconnect(self, error: Exception) -> None:
+        outage = Outage(time.time(), error=str(error))
+        logger.warning(f'Connection to {self.resource_name} lost: {error}')
+        try:
+            self._inst.close()
+        except Exception:
+            pass
+        delay = self.backoff_initial
+        while True:
+            outage.attempts += 1
+            try:
+                inst = self._open()
+                # one transfer for all settings, the calibration and the measurement mode
+                write_commands(inst, self.restore_commands())
+                break
+            except Exception as e:
+                if time.time() - outage.start + delay > self.max_outage:
+                    outage.end = time.time()
+                    self.outages.append(outage)
+                    raise ConnectionError(f'{self.resource_name} not reachable for {outage.duration:.0f} s') from e
+                logger.info(f'Reconnect attempt {outage.attempts} failed ({e}), next in {delay:.1f} s')
+                time.sleep(delay)
+                delay = min(delay * 2, self.backoff_max)
+        self.__dict__['_inst'] = inst
+        outage.end = time.time()
+
+        # without a monotonic result counter the lost results are estimated from the trigger interval
+        interval = parse_seconds(self._settings.get(TRIGGER_INTERVAL_HEADER, ''))
+        if self._mode is not None and interval:
+            outage.lost_results = int(outage.duration / interval)
+        self.outages.append(outage)
+        self.__dict__['_pending_outage'] = outage if self._mode is not None else None
+        logger.warning(f'Reconnected to {self.resource_name} after {outage.duration:.1f} s and {outage.attempts} '
+                       f'attempts, restored {len(self._settings)} settings'
+                       + (f' and {self._mode}' if self._mode else ''))
+        if self.on_reconnect is not None:
+            self.on_reconnect(inst)
+
+    def _call(self, name: str, *args, **kwargs):
+        try:
+            return getattr(self._inst, name)(*args, **kwargs)
+        except Exception as e:
+            if self._is_alive():
+                # ordinary error of this call, e.g. an expected timeout
+                raise
+            self._reconnect(e)
+            return getattr(self._inst, name)(*args, **kwargs)
+
+    def write(self, message: str, *args, **kwargs):
+        result = self._call('write', message, *args, **kwargs)
+        self._track(message)
+        return result
+
+    def write_raw(self, message: bytes):
+        result = self._call('write_raw', message)
+        term = self._inst.write_termination.encode(self._inst.encoding)
+        for command in message.split(term):
+            if command:
+                self._track(command.decode(self._inst.encoding))
+        return result
+
+    def query(self, message: str, *args, **kwargs) -> str:
+        answ = self._call('query', message, *args, **kwargs)
+        header = command_header(message)
+        if header.startswith(RESULT_QUERY_PREFIX):
+            self._track_result(answ)
+        elif header == '*IDN?' and self.idn is None:
+            self.__dict__['idn'] = answ
+        return answ
+
+    def read_raw(self, *args, **kwargs) -> bytes:
+        return self._call('read_raw', *args, **kwargs)
+
+    def query_binary_values(self, message: str, *args, **kwargs):
+        return self._call('query_binary_values', message, *args, **kwargs)
+
+    def close(self) -> None:
+        self._inst.close()
+
+    def report(self) -> str:
+        """Describe the outages of the session."""
+        return (f'{len(self.outages)} outages, downtime {self.downtime:.1f} s, '
+                f'{self.lost_results} results lost')
@@ -0,0 +1,153 @@
+"""
+Parallel offline reprocessing of archived sweep blocks.
+
+Blocks of a sweep archive (see sweep_archive.py) are analysed on a process pool:
+echo peak positions, thickness, SNR in the strobe window and saturation. Workers map
+the archive data file themselves, only block ids and offsets are sent to them, so no
+sample data is pickled. All results are written into one summary table (CSV).
+
+Usage:
+    python reprocess_blocks.py data_blocks --strobe-begin 140 --strobe-width 250 --velocity 3200 -o summary.csv
+    python reprocess_blocks.py data_blocks --gain 20 --sampling-rate 50 -j 4
+"""
+
+import argparse
+import csv
+import logging
+import os
+import sys
+import time
+from dataclasses import dataclass
+from multiprocessing import Pool
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from a1570.ascan_processing import is_saturated, peak_positions, strobe_snr, thickness_from_peaks
+from a1570.sweep_archive import PARAMETER_COLUMNS, BlockParameters, SweepArchive
+
+logger = logging.getLogger()
+logger.level = logging.INFO
+stream_handler = logging.StreamHandler(sys.stdout)
+
+@dataclass
+class ProcessingSettings:
+    strobe_begin: int = 140 # samples
+    strobe_width: int = 250 # samples
+    strobe_level: float = 15 # 0-100%
+    velocity: float = 3200 # m/s
+
+SUMMARY_COLUMNS = ['id'] + PARAMETER_COLUMNS + ['peak_1', 'peak_2', 'thickness', 'snr', 'saturated']
+
+# state of a worker process, set once by init_worker()
+_samples: Optional[np.ndarray] = None
+_settings: Optional[ProcessingSettings] = None
+
+def init_worker(data_path: str, settings: ProcessingSettings) -> None:
+    """Map the archive data file once per worker process."""
+    global _samples, _settings
+    _samples = np.memmap(data_path, dtype='<i2', mode='r')
+    _settings = settings
+
+def process_chunk(chunk: np.ndarray) -> List[Tuple]:
+    """Analyse a chunk of blocks in a worker process.
+
+    Args:
+        chunk: Array of shape (N, 5) with id, byte offset, number of samples, sampling rate in MHz
+            and minimum echo distance in samples
+
+    Returns:
+        List[Tuple]: id, peak positions, thickness, SNR and saturation per block
+    """
+    s = _settings
+    results = []
+    for block_id, offset, length, sampling_rate, min_distance in chunk:
+        vector = _samples[offset // 2:offset // 2 + length]
+        peaks = peak_positions(vector, s.strobe_begin, s.strobe_width, s.strobe_level, min_distance=min_distance)
+        thickness = thickness_from_peaks(peaks, sampling_rate, s.velocity)
+        snr = float(strobe_snr(vector, s.strobe_begin, s.strobe_width))
+        saturated = bool(is_saturated(vector))
+        peak_1 = int(peaks[0]) if len(peaks) > 0 else None
+        peak_2 = int(peaks[1]) if len(peaks) > 1 else None
+        results.append((int(block_id), peak_1, peak_2, thickness, snr, saturated))
+    return results
+
+def echo_length(parameters: BlockParameters) -> int:
+    """Return the length of one echo in samples, the transmitted burst plus one period of ringing."""
+    samples_per_period = parameters.sampling_rate / parameters.probe_frequency
+    return int(np.ceil((parameters.duration + 1) * samples_per_period))
+
+def reprocess(archive: SweepArchive, settings: ProcessingSettings, workers: int,
+              chunk_size: int = 64, **conditions) -> List[List]:
+    """Analyse all blocks of an archive matching the conditions on a process pool.
+
+    Args:
+        archive: Sweep archive
+        settings: Strobe window and sound velocity
+        workers: Number of worker processes, 1 runs in this process
+        chunk_size: Number of blocks sent to a worker at once
+        **conditions: Query conditions, see SweepArchive.select()
+
+    Returns:
+        List[List]: Summary rows with SUMMARY_COLUMNS
+    """
+    blocks = archive.select(**conditions)
+    if not blocks:
+        return []
+    locations = np.array([(b.id, b.offset, b.length, b.parameters.sampling_rate, echo_length(b.parameters))
+                          for b in blocks], dtype=np.int64)
+    chunks = [locations[i:i + chunk_size] for i in range(0, len(locations), chunk_size)]
+    archive.flush()
+
+    if workers == 1:
+        init_worker(archive.data_path, settings)
+        results = [process_chunk(chunk) for chunk in chunks]
+    else:
+        with Pool(workers, initializer=init_worker, initargs=(archive.data_path, settings)) as pool:
+            results = pool.map(process_chunk, chunks)
+
+    rows = []
+    for block, result in zip(blocks, (r for chunk_results in results for r in chunk_results)):
+        parameters = [getattr(block.parameters, c) for c in PARAMETER_COLUMNS]
+        rows.append([block.id] + parameters + list(result[1:]))
+    return rows
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('directory', help='sweep archive directory')
+    parser.add_argument('-o', '--output', default='summary.csv', help='summary table (CSV)')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count(), help='number of worker processes')
+    parser.add_argument('--chunk-size', type=int, default=64, help='blocks per task')
+    parser.add_argument('--strobe-begin', type=int, default=ProcessingSettings.strobe_begin)
+    parser.add_argument('--strobe-width', type=int, default=ProcessingSettings.strobe_width)
+    parser.add_argument('--strobe-level', type=float, default=ProcessingSettings.strobe_level)
+    parser.add_argument('--velocity', type=float, default=ProcessingSettings.velocity)
+    parser.add_argument('--gain', type=int, help='only blocks with this gain')
+    parser.add_argument('--sampling-rate', type=int, help='only blocks with this sampling rate (MHz)')
+    args = parser.parse_args()
+
+    logger.addHandler(stream_handler)
+    settings = ProcessingSettings(args.strobe_begin, args.strobe_width, args.strobe_level, args.velocity)
+    conditions = {}
+    if args.gain is not None:
+        conditions['gain'] = args.gain
+    if args.sampling_rate is not None:
+        conditions['sampling_rate'] = args.sampling_rate
+
+    with SweepArchive(args.directory) as archive:
+        start = time.perf_counter()
+        rows = reprocess(archive, settings, args.workers, args.chunk_size, **conditions)
+        elapsed = time.perf_counter() - start
+
+    with open(args.output, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(SUMMARY_COLUMNS)
+        writer.writerows(rows)
+
+    rate = len(rows) / elapsed if elapsed > 0 else 0
+    logger.info(f'Processed {len(rows)} blocks in {elapsed:.2f} s with {args.workers} workers ({rate:.0f} blocks/s)')
+    logger.info(f'Summary written to {args.output}')
+    logger.removeHandler(stream_handler)
+
+if __name__ == '__main__':
+    main()
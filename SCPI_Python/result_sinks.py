@@ -0,0 +1,239 @@
+"""
+Batched, asynchronous sinks for measurement results.
+
+Writing results to a file or the network inside the polling loop would stall the
+acquisition whenever the disk or the network is slow. AsyncSink puts results into a
+bounded queue and a background thread writes them in batches to a ResultSink:
+
+- CsvSink: CSV file with one row per result
+- BinarySink: file of fixed-size binary records (RESULT_RECORD)
+- UdpSink: binary records packed into UDP datagrams
+- UnixSocketSink: binary records sent as Unix-domain datagrams
+
+When the queue is full the overflow policy decides: 'drop_oldest', 'drop_newest' or
+'block'. Flush latency, written, dropped and failed results are counted in SinkStatistics.
+
+Example:
+    >>> sink = AsyncSink(CsvSink('results.csv'))
+    >>> sink.put(parse_measurement_result(answ))
+    >>> sink.close()
+"""
+
+import csv
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from a1570.common_functions import Result
+
+logger = logging.getLogger(__name__)
+
+# host time (s), counter, contact, contact quality, gain (dB), thickness (mm), device timestamp
+RESULT_RECORD = struct.Struct('<dI?Hhf8s')
+CSV_COLUMNS = ['host_time', 'counter', 'contact', 'contact_quality', 'gain', 'thickness', 'timestamp']
+OVERFLOW_POLICIES = ('drop_oldest', 'drop_newest', 'block')
+
+# result with the host time it was received
+Record = Tuple[float, Result]
+
+def pack_records(records: List[Record]) -> bytes:
+    """Pack results into consecutive RESULT_RECORD structures."""
+    return b''.join(
+        RESULT_RECORD.pack(host_time, r.counter, r.contact, r.contact_quality, r.gain, r.thickness,
+                           str(r.timestamp).encode('ascii')[:8])
+        for host_time, r in records)
+
+def unpack_records(data: bytes) -> List[Record]:
+    """Unpack RESULT_RECORD structures into results with host time."""
+    records = []
+    for host_time, counter, contact, quality, gain, thickness, timestamp in RESULT_RECORD.iter_unpack(data):
+        result = Result('measurement_result', contact, quality, counter, gain, thickness,
+                        timestamp.rstrip(b'\0').decode('ascii'))
+        records.append((host_time, result))
+    return records
+
+def read_binary_results(path: str) -> List[Record]:
+    """Read a file written by BinarySink."""
+    with open(path, 'rb') as f:
+        return unpack_records(f.read())
+
+class ResultSink(ABC):
+    """Destination of result batches, write_batch() is called from one thread only."""
+    @abstractmethod
+    def write_batch(self, records: List[Record]) -> None:
+        ...
+
+    def close(self) -> None:
+        pass
+
+class CsvSink(ResultSink):
+    def __init__(self, path: str):
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, 'a', newline='')
+        self._writer = csv.writer(self._file)
+        if new_file:
+            self._writer.writerow(CSV_COLUMNS)
+
+    def write_batch(self, records: List[Record]) -> None:
+        self._writer.writerows([host_time, r.counter, r.contact, r.contact_quality, r.gain, r.thickness, r.timestamp]
+                               for host_time, r in records)
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+class BinarySink(ResultSink):
+    def __init__(self, path: str):
+        self._file = open(path, 'ab')
+
+    def write_batch(self, records: List[Record]) -> None:
+        self._file.write(pack_records(records))
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+class DatagramSink(ResultSink):
+    """Sends binary records in datagrams of at most max_datagram bytes."""
+    def __init__(self, sock: socket.socket, address, max_datagram: int = 1400):
+        self._socket = sock
+        self._address = address
+        self._records_per_datagram = max(1, max_datagram // RESULT_RECORD.size)
+
+    def write_batch(self, records: List[Record]) -> None:
+        n = self._records_per_datagram
+        for i in range(0, len(records), n):
+            self._socket.sendto(pack_records(records[i:i + n]), self._address)
+
+    def close(self) -> None:
+        self._socket.close()
+
+class UdpSink(DatagramSink):
+    def __init__(self, host: str, port: int, max_datagram: int = 1400):
+        super().__init__(socket.socket(socket.AF_INET, socket.SOCK_DGRAM), (host, port), max_datagram)
+
+class UnixSocketSink(DatagramSink):
+    """Sends to a Unix-domain datagram socket bound by the receiver (not available on Windows)."""
+    def __init__(self, path: str, max_datagram: int = 4096):
+        super().__init__(socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM), path, max_datagram)
+
+@dataclass
+class SinkStatistics:
+    written: int = 0 # results written by the sink
+    dropped: int = 0 # results dropped because the queue was full
+    failed: int = 0 # results lost because the sink raised an error
+    batches: int = 0
+    flush_time: float = 0.0 # s, total time in write_batch()
+    max_flush_time: float = 0.0 # s
+
+    @property
+    def mean_flush_time(self) -> float:
+        return self.flush_time / self.batches if self.batches else 0.0
+
+    def __str__(self) -> str:
+        return (f'{self.written} written, {self.dropped} dropped, {self.failed} failed, {self.batches} batches, '
+                f'flush mean {self.mean_flush_time * 1000:.2f} ms, max {self.max_flush_time * 1000:.2f} ms')
+
+class AsyncSink:
+    """Bounded queue in front of a sink, flushed in batches by a background thread.
+
+    Args:
+        sink: Destination of the results
+        max_queue: Maximum number of queued results
+        batch_size: Maximum number of results written at once
+        flush_interval: Maximum time in seconds a result waits for a batch to fill
+        overflow: 'drop_oldest', 'drop_newest' or 'block' when the queue is full
+    """
+    def __init__(self, sink: ResultSink, max_queue: int = 1000, batch_size: int = 100,
+                 flush_interval: float = 0.5, overflow: str = 'drop_oldest'):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f'Unknown overflow policy {overflow}, expected one of {OVERFLOW_POLICIES}')
+        self.sink = sink
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.statistics = SinkStatistics()
+        self._queue: deque = deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='AsyncSink', daemon=True)
+        self._thread.start()
+
+    def put(self, result: Result, host_time: Optional[float] = None) -> bool:
+        """Queue a result without waiting for the sink.
+
+        Args:
+            result: Measurement result
+            host_time: Host time of the result, by default result.host_time if it was
+                correlated (see clock_correlation) or time.time()
+
+        Returns:
+            bool: False if the result was dropped
+        """
+        if host_time is None:
+            host_time = time.time() if result.host_time is None else result.host_time
+        record = (host_time, result)
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('Sink is closed')
+            if len(self._queue) >= self.max_queue:
+                if self.overflow == 'drop_newest':
+                    self.statistics.dropped += 1
+                    return False
+                if self.overflow == 'drop_oldest':
+                    self._queue.popleft()
+                    self.statistics.dropped += 1
+                else:
+                    self._condition.wait_for(lambda: len(self._queue) < self.max_queue or self._closed)
+            self._queue.append(record)
+            if len(self._queue) >= self.batch_size:
+                self._condition.notify_all()
+        return True
+
+    def close(self) -> None:
+        """Write the queued results and close the sink."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        self.sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: len(self._queue) >= self.batch_size or self._closed,
+                                         self.flush_interval)
+                if not self._queue:
+                    if self._closed:
+                        return
+                    continue
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                # wake up producers waiting with the 'block' policy
+                self._condition.notify_all()
+
+            start = time.perf_counter()
+            try:
+                self.sink.write_batch(batch)
+            except Exception as e:
+                self.statistics.failed += len(batch)
+                logger.error(f'Failed to write {len(batch)} results: {e}')
+            else:
+                self.statistics.written += len(batch)
+            elapsed = time.perf_counter() - start
+            self.statistics.batches += 1
+            self.statistics.flush_time += elapsed
+            self.statistics.max_flush_time = max(self.statistics.max_flush_time, elapsed)
@@ -0,0 +1,79 @@
+"""
+Benchmark of region-of-interest acquisition on the A1570 EMAT device.
+
+Measures fetch latency and vectors per second with the full vector length of 8192
+samples and with the shortest data length covering the strobe window.
+
+Usage:
+1. Configure device IP address and strobe window
+2. Run script, the trigger interval is set to its minimum for the benchmark
+"""
+
+import sys
+import time
+import pyvisa as visa
+import logging
+
+from a1570.common_functions import *
+from a1570.session_recording import open_session
+
+# Configure logging to show info level messages
+logger = logging.getLogger()
+logger.level = logging.INFO
+stream_handler = logging.StreamHandler(sys.stdout)
+logger.addHandler(stream_handler)
+
+### Device Configuration ###
+ip: str = '192.168.0.1'  # Device IP address
+port: int = 5025         # Default SCPI port
+
+# strobe window of the measurement, e.g. S7694 probe on the 5mm aluminum coin
+strobe_begin = 140 # 0-8191 samples
+strobe_width = 250 # 0-8191 samples
+fetch_count = 50 # vectors per measurement
+
+inst = open_session(f'tcpip::{ip}::{str(port)}::SOCKET')
+inst.encoding = 'iso-8859-1'
+inst.timeout = 5000      # Timeout in milliseconds
+inst.read_termination = '\r\n'
+inst.write_termination = '\r\n'
+
+# Clear error queue before starting measurement
+while True:
+    err_num, err_msg = read_error_queue(inst)
+    if (err_num == 0):
+        break
+
+idn: str = inst.query('*IDN?')
+logger.info(idn)
+
+# trigger as fast as possible, so the transfer limits the vector rate
+# (the interval is restored afterwards, a pulse magnet probe must not stay at the minimum)
+trigger_interval = inst.query('TRIGgering:INTerval?')
+inst.write('TRIGgering:MODE INTERNAL')
+inst.write('TRIGgering:INTerval MINimum')
+try:
+    inst.write('TRAN:ENAB ON')
+    inst.write('STAR')
+    time.sleep(0.5)
+
+    results = []
+    for data_length in (DATA_LENGTH_MAX, roi_data_length(strobe_begin, strobe_width)):
+        data_length = set_data_length(inst, data_length)
+        latency, rate = measure_fetch_rate(inst, fetch_count)
+        results.append((data_length, latency, rate))
+        logger.info(f'data length {data_length}: fetch {latency:.1f} ms, {rate:.1f} vectors/s')
+
+    (full_length, full_latency, full_rate), (roi_length, roi_latency, roi_rate) = results
+    logger.info(f'ROI transfers {roi_length / full_length:.1%} of the samples, '
+                f'latency {full_latency / roi_latency:.1f}x lower, {roi_rate / full_rate:.1f}x more vectors/s')
+finally:
+    # stop measurement, restore full vector length and trigger interval
+    inst.write('STOP')
+    set_data_length(inst, DATA_LENGTH_MAX)
+    inst.write(f'TRIGgering:INTerval {trigger_interval} S')
+    time.sleep(0.5)
+check_error_queue_and_assert(inst)
+
+inst.close()
+logger.removeHandler(stream_handler)
@@ -0,0 +1,250 @@
+"""
+Precompiled SCPI command tree of the A1570 EMAT device.
+
+Commands are declared once in their long form, e.g. '[SOURce:]TRIGgering:INTerval',
+and compiled into shortest-form byte templates ('TRIG:INT'). Values are converted
+on the client into the unit the command is sent in, so 'TRIG:INT 250000 US' and
+'TRIG:INT 0.25 S' both go on the wire as b'TRIG:INT 0.25 S'. Values without unit and
+query answers are in the base unit of the quantity (BASE_UNITS). Misspelled command
+names fail with a KeyError on the client instead of an error in the device queue.
+
+Encoded commands are bytes without termination and can be passed directly to
+write_commands() from common_functions to send several of them in one transfer.
+
+Example:
+    >>> COMMANDS['trigger_interval'].encode(250000, 'US')
+    b'TRIG:INT 0.25 S'
+    >>> COMMANDS['sampling_frequency'].encode(50, 'MHZ')
+    b'FREQ 50 MHZ'
+    >>> COMMANDS['gain'].encode('MAX')
+    b'GAIN MAX'
+"""
+
+import re
+import time
+from typing import Dict, Optional, Tuple, Union
+
+# scale of the accepted units relative to the base unit of a quantity
+UNITS: Dict[str, Dict[str, float]] = {
+    'time': {'S': 1, 'MS': 1E-3, 'US': 1E-6, 'NS': 1E-9},
+    'frequency': {'HZ': 1, 'KHZ': 1E3, 'MHZ': 1E6},
+    'voltage': {'V': 1, 'MV': 1E-3},
+    'gain': {'DB': 1},
+}
+
+# unit suffix sent to the device for each quantity
+BASE_UNITS: Dict[str, str] = {
+    'time': 'S',
+    'frequency': 'HZ',
+    'voltage': 'V',
+    'gain': 'DB',
+}
+
+# keywords accepted instead of a numeric value
+NUMERIC_KEYWORDS: Dict[str, bytes] = {
+    'MIN': b'MIN', 'MINIMUM': b'MIN',
+    'MAX': b'MAX', 'MAXIMUM': b'MAX',
+    'DEF': b'DEF', 'DEFAULT': b'DEF',
+    'UP': b'UP',
+    'DOWN': b'DOWN',
+}
+
+def short_form(long_form: str) -> str:
+    """Return the shortest form of a SCPI command header.
+
+    Optional nodes in brackets are dropped and every node is reduced to its
+    upper-case characters, e.g. '[SOURce:]GAIN[:LEVel]' -> 'GAIN'. Nodes without
+    upper-case characters have no short form and are kept.
+
+    Args:
+        long_form: Command header in SCPI long form notation
+
+    Returns:
+        str: Shortest accepted form of the header
+    """
+    header = re.sub(r'\[[^\]]*\]', '', long_form)
+    nodes = [node if node == node.lower() else re.sub(r'[a-z]', '', node) for node in header.split(':')]
+    return ':'.join(nodes)
+
+class Command:
+    """One node of the SCPI command tree.
+
+    Args:
+        long_form: Command header in long form, optional nodes in brackets
+        kind: Value type, one of 'int', 'float', 'bool', 'token', 'string', 'raw',
+            'event' (command without value) or 'query' (query only)
+        quantity: Physical quantity of the value, key of UNITS, or None if unitless
+        unit: Unit the value is sent in, default the base unit of the quantity;
+            '' sends the number in the base unit without suffix
+        choices: Allowed tokens for kind 'token', None accepts any token
+    """
+    __slots__ = ('long_form', 'header', 'kind', 'quantity', 'base_unit', 'choices',
+                 'query', 'query_bytes', '_prefix', '_suffix', '_scales', '_base_scale')
+
+    def __init__(self, long_form: str, kind: str, quantity: Optional[str] = None,
+                 unit: Optional[str] = None, choices: Optional[Tuple[str, ...]] = None):
+        self.long_form = long_form
+        self.header = short_form(long_form)
+        self.kind = kind
+        self.quantity = quantity
+        self.base_unit = BASE_UNITS[quantity] if quantity else ''
+        self.choices = choices
+        self.query = f'{self.header}?'
+        self.query_bytes = self.query.encode('ascii')
+        self._prefix = f'{self.header} '.encode('ascii')
+        if unit is None:
+            unit = self.base_unit
+        self._suffix = f' {unit}'.encode('ascii') if unit else b''
+        # scale of each accepted unit to the unit on the wire
+        wire_scale = UNITS[quantity][unit] if unit else 1
+        self._scales = {u: scale / wire_scale for u, scale in UNITS[quantity].items()} if quantity else {}
+        self._base_scale = 1 / wire_scale
+
+    def encode(self, value: Union[int, float, str, bool, None] = None, unit: Optional[str] = None) -> bytes:
+        """Encode the command with a value into bytes without termination.
+
+        Args:
+            value: Value of the command, or a keyword like MIN, MAX, DEF, UP, DOWN
+            unit: Unit of a numeric value, e.g. 'US' or 'MHZ', by default the base unit;
+                the value is converted to the unit the command is sent in
+
+        Returns:
+            bytes: Encoded command in shortest form
+
+        Raises:
+            ValueError: If the value or unit does not fit the command
+        """
+        kind = self.kind
+        if kind == 'event':
+            return self._prefix[:-1]
+        if kind == 'query':
+            raise ValueError(f'{self.long_form} is query only')
+        if kind == 'int' or kind == 'float':
+            if value.__class__ is str:
+                keyword = NUMERIC_KEYWORDS.get(value.upper())
+                if keyword is None:
+                    raise ValueError(f'Invalid keyword {value!r} for {self.long_form}')
+                return self._prefix + keyword
+            if unit is not None:
+                scale = self._scales.get(unit.upper())
+                if scale is None:
+                    raise ValueError(f'Invalid unit {unit!r} for {self.long_form}')
+                value = value * scale
+            elif self._base_scale != 1:
+                value = value * self._base_scale
+            if kind == 'int':
+                integer = round(value)
+                if abs(value - integer) > 1E-9 * max(abs(integer), 1):
+                    raise ValueError(f'{self.long_form} expects an integer, received {value}')
+                return self._prefix + b'%d' % integer + self._suffix
+            return self._prefix + b'%.12g' % value + self._suffix
+        if kind == 'bool':
+            if value.__class__ is str:
+                value = value.upper()
+                if value not in ('ON', 'OFF'):
+                    raise ValueError(f'{self.long_form} expects ON or OFF, received {value!r}')
+                return self._prefix + value.encode('ascii')
+            return self._prefix + (b'ON' if value else b'OFF')
+        if kind == 'token':
+            value = value.upper()
+            if self.choices is not None and value not in self.choices:
+                raise ValueError(f'{self.long_form} expects one of {self.choices}, received {value!r}')
+            return self._prefix + value.encode('ascii')
+        if kind == 'string':
+            return self._prefix + b'"' + value.encode('iso-8859-1') + b'"'
+        # raw payload, e.g. JSON or already quoted data
+        return self._prefix + value.encode('iso-8859-1')
+
+    def restore(self, answer: str) -> bytes:
+        """Encode the command setting the value of a query answer, e.g. to restore a saved setting."""
+        answer = answer.strip()
+        kind = self.kind
+        if kind == 'int' or kind == 'float':
+            return self.encode(float(answer))
+        if kind == 'bool':
+            return self.encode(answer.upper() in ('1', 'ON'))
+        if kind == 'string':
+            return self.encode(answer.strip('"'))
+        return self.encode(answer)
+
+    def format(self, value: Union[int, float, str, bool, None] = None, unit: Optional[str] = None) -> str:
+        """Encode the command into a string for inst.write()."""
+        return self.encode(value, unit).decode('iso-8859-1')
+
+ON_OFF = ('ON', 'OFF')
+
+# command tree used by the examples and test_scpi_interface_a1570.py
+COMMANDS: Dict[str, Command] = {
+    # common commands
+    'idn': Command('*IDN', 'query'),
+    'error': Command('SYSTem:ERRor', 'query'),
+    # source subsystem
+    'gain': Command('[SOURce:]GAIN[:LEVel]', 'int', 'gain'),
+    'start': Command('[SOURce:]STARt', 'event'),
+    'stop': Command('[SOURce:]STOP', 'event'),
+    'trigger_mode': Command('[SOURce:]TRIGgering:MODE', 'token'),
+    'trigger_interval': Command('[SOURce:]TRIGgering:INTerval', 'float', 'time'),
+    # sent in the unit of the examples: 'FREQuency 50 MHZ', 'TRANsmitter:PULS 200'
+    'sampling_frequency': Command('[SOURce:]FREQuency', 'float', 'frequency', 'MHZ'),
+    'pulse_level': Command('[SOURce:]TRANsmitter:PULSe[:LEVel]', 'int', 'voltage', ''),
+    'transmitter_frequency': Command('[SOURce:]TRANsmitter:FREQuency', 'float', 'frequency'),
+    'transmitter_period': Command('[SOURce:]TRANsmitter:PERiod', 'float', 'time'),
+    'transmitter_duration': Command('[SOURce:]TRANsmitter:DURation', 'float'),
+    'transmitter_enable': Command('[SOURce:]TRANsmitter:ENABle', 'bool'),
+    'transmitter_mode': Command('[SOURce:]TRANsmitter:MODE', 'token', choices=ON_OFF),
+    'data_length': Command('[SOURce:]DATA:LENGth', 'int'),
+    'sound_velocity': Command('[SOURce:]VELocity[:SOUNd]', 'int'),
+    # sense subsystem
+    'average_count': Command('[SENSe:]AVERage:COUNt', 'int'),
+    'average_period': Command('[SENSe:]AVERage:PERiod', 'float', 'time'),
+    'average_period_random': Command('[SENSe:]AVERage:PERiod:RANDom', 'float', 'time'),
+    'filter_hpass_number': Command('[SENSe:]FILTer:HPASs:NUMBer', 'int'),
+    'magnet_enable': Command('[SENSe:]MAGNet:ENABle', 'bool'),
+    'magnet_voltage': Command('[SENSe:]MAGNet:VOLTage', 'int', 'voltage'),
+    'magnet_delay': Command('[SENSe:]MAGNet:DELay', 'float', 'time'),
+    'probe_type': Command('SENSe:PROBe:TYPE', 'string'),
+    'probe_delay': Command('SENSe:PROBe:DELay:PROCessing', 'float'),
+    'dead_zones': Command('SENSe:DEZones', 'raw'),
+    'calibration_noise': Command('SENSe:CALibration:NOISe', 'raw'),
+    'calibration_eddy_array': Command('SENSe:CALibration:EDARray', 'raw'),
+    'strobe_level': Command('SENSe:STROBE:LEVel', 'int'),
+    'strobe_begin': Command('SENSe:STROBE:BEGin', 'int'),
+    'strobe_width': Command('SENSe:STROBE:WIDTh', 'int'),
+    'software_average_count': Command('SENSe:SOAVerage:COUNt', 'int'),
+    'software_average_enable': Command('SENSe:SOAVerage:ENABle', 'bool'),
+    'send_vector': Command('SNDVector', 'bool'),
+    'zonder_mode': Command('ZONDer:MODE', 'token'),
+    # measurement control
+    'start_measurement': Command('STARt:MEASure', 'event'),
+    'stop_measurement': Command('STOP:MEASure', 'event'),
+    'start_calibration_air': Command('STARt:CALibration:AIR', 'event'),
+    'start_calibration_object': Command('STARt:CALibration:OBJect', 'event'),
+    'start_max_strobe': Command('STARt:MAXStrobe', 'event'),
+    'start_peak_to_peak': Command('STARt:P2Peak', 'event'),
+    # data and status
+    'fetch_array': Command('FETCh:ARRay', 'query'),
+    'fetch_result': Command('FETCh:RESult:MEASure', 'query'),
+    'battery': Command('STATus:BATTery', 'query'),
+    'channel_status': Command('STATus:CHSTatus', 'query'),
+    'probe_temperature': Command('STATus:PROBe:TEMPerature', 'query'),
+}
+
+def benchmark_encoding(n: int = 100000) -> float:
+    """Measure the encoding cost of a typical command.
+
+    Args:
+        n: Number of encodings
+
+    Returns:
+        float: Time per encoding in microseconds
+    """
+    cmd = COMMANDS['trigger_interval']
+    start = time.perf_counter()
+    for _ in range(n):
+        cmd.encode(250000, 'US')
+    return (time.perf_counter() - start) / n * 1E6
+
+if __name__ == '__main__':
+    for name, cmd in COMMANDS.items():
+        print(f'{name:26} {cmd.long_form:40} {cmd.header}')
+    print(f'encoding: {benchmark_encoding():.2f} us per command')
@@ -0,0 +1,265 @@
+"""
+Record and replay SCPI sessions of the A1570 EMAT device.
+
+RecordingResource wraps a pyvisa resource and writes every command, text answer,
+binary block and VISA error with its time into a compact session file. ReplayResource
+reads the file back through the same API (write, query, query_binary_values, read_raw,
+...), either with the original timing or as fast as possible, so scripts and the test
+suite run offline and processing can be benchmarked on captured data.
+
+The replayed session must issue the same calls in the same order as the recorded one,
+otherwise ReplayError is raised.
+
+All examples open the device with open_session(), which honours these environment variables:
+    A1570_RECORD=session.rec         record the session into a file
+    A1570_REPLAY=session.rec         replay a recorded session instead of using a device
+    A1570_REPLAY_TIMING=original     replay with the recorded timing (default 'fast')
+
+Usage:
+    python session_recording.py session.rec    # summary and fast replay rate of a recording
+"""
+
+import logging
+import os
+import struct
+import sys
+import time
+from collections import Counter
+from typing import Iterator, NamedTuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FILE_MAGIC = b'SCPIREC1'
+# time since start of the session (s), kind, length of the command, length of the payload
+RECORD_HEADER = struct.Struct('<dBHI')
+
+WRITE = 1 # command
+WRITE_RAW = 2 # payload: message
+QUERY = 3 # command, payload: answer
+READ_RAW = 4 # payload: message
+BINARY = 5 # command, payload: datatype, endianness and values
+ERROR = 6 # command: name of the failed call, payload: VISA error code
+KIND_NAMES = {WRITE: 'write', WRITE_RAW: 'write_raw', QUERY: 'query', READ_RAW: 'read_raw',
+              BINARY: 'query_binary_values', ERROR: 'error'}
+ERROR_CODE = struct.Struct('<i')
+
+class ReplayError(Exception):
+    """The replayed session differs from the recorded one."""
+
+class SessionRecord(NamedTuple):
+    time: float # s since start of the session
+    kind: int
+    command: str
+    payload: bytes
+
+def iter_records(path: str) -> Iterator[SessionRecord]:
+    """Read all records of a session file."""
+    with open(path, 'rb') as f:
+        if f.read(len(FILE_MAGIC)) != FILE_MAGIC:
+            raise ValueError(f'{path} is not a SCPI session recording')
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            t, kind, command_length, payload_length = RECORD_HEADER.unpack(header)
+            command = f.read(command_length).decode('iso-8859-1')
+            yield SessionRecord(t, kind, command, f.read(payload_length))
+
+class RecordingResource:
+    """Proxy of a pyvisa resource recording the session into a file.
+
+    Args:
+        inst: VISA instrument instance
+        path: Session file
+    """
+    def __init__(self, inst, path: str):
+        object.__setattr__(self, '_inst', inst)
+        object.__setattr__(self, '_file', open(path, 'wb'))
+        object.__setattr__(self, '_start', time.perf_counter())
+        self._file.write(FILE_MAGIC)
+
+    # attributes like timeout and terminations are passed to the resource
+    def __getattr__(self, name):
+        return getattr(self._inst, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._inst, name, value)
+
+    def _record(self, kind: int, command: str = '', payload: bytes = b'') -> None:
+        encoded = command.encode('iso-8859-1')
+        self._file.write(RECORD_HEADER.pack(time.perf_counter() - self._start, kind, len(encoded), len(payload)))
+        self._file.write(encoded)
+        self._file.write(payload)
+
+    def _call(self, name: str, *args, **kwargs):
+        from pyvisa.errors import VisaIOError
+        try:
+            return getattr(self._inst, name)(*args, **kwargs)
+        except VisaIOError as e:
+            self._record(ERROR, name, ERROR_CODE.pack(e.error_code))
+            raise
+
+    def write(self, message: str, *args, **kwargs):
+        result = self._call('write', message, *args, **kwargs)
+        self._record(WRITE, message)
+        return result
+
+    def write_raw(self, message: bytes):
+        result = self._call('write_raw', message)
+        self._record(WRITE_RAW, payload=message)
+        return result
+
+    def query(self, message: str, *args, **kwargs) -> str:
+        answ = self._call('query', message, *args, **kwargs)
+        self._record(QUERY, message, answ.encode(self._inst.encoding))
+        return answ
+
+    def read_raw(self, *args, **kwargs) -> bytes:
+        message = self._call('read_raw', *args, **kwargs)
+        self._record(READ_RAW, payload=message)
+        return message
+
+    def query_binary_values(self, message: str, datatype: str = 'f', is_big_endian: bool = False,
+                            container=list, **kwargs):
+        values = self._call('query_binary_values', message, datatype=datatype,
+                            is_big_endian=is_big_endian, container=container, **kwargs)
+        byte_order = '>' if is_big_endian else '<'
+        data = np.asarray(values, dtype=np.dtype(byte_order + datatype)).tobytes()
+        self._record(BINARY, message, (byte_order + datatype).encode('ascii') + data)
+        return values
+
+    def close(self) -> None:
+        self._file.close()
+        self._inst.close()
+
+class ReplayResource:
+    """Stand-in for a pyvisa resource answering from a session recording.
+
+    Args:
+        path: Session file
+        timing: 'fast' to answer immediately, 'original' to keep the recorded timing
+    """
+    def __init__(self, path: str, timing: str = 'fast'):
+        if timing not in ('fast', 'original'):
+            raise ValueError(f'Unknown replay timing {timing}')
+        self.path = path
+        self.timing = timing
+        self.encoding = 'iso-8859-1'
+        self.timeout = 5000
+        self.read_termination = '\r\n'
+        self.write_termination = '\r\n'
+        self._records = iter_records(path)
+        self._start = time.perf_counter()
+        self.calls = 0
+
+    def _next(self, kind: int, command: str = '') -> SessionRecord:
+        record = next(self._records, None)
+        if record is None:
+            raise ReplayError(f'{KIND_NAMES[kind]}({command!r}) after the end of {self.path}')
+        if record.kind == ERROR and record.command == KIND_NAMES[kind]:
+            from pyvisa.errors import VisaIOError
+            self._wait(record.time)
+            raise VisaIOError(ERROR_CODE.unpack(record.payload)[0])
+        if record.kind != kind or record.command != command:
+            raise ReplayError(f'Call {self.calls}: expected {KIND_NAMES[record.kind]}({record.command!r}), '
+                              f'got {KIND_NAMES[kind]}({command!r})')
+        self._wait(record.time)
+        self.calls += 1
+        return record
+
+    def _wait(self, t: float) -> None:
+        if self.timing == 'original':
+            delay = t - (time.perf_counter() - self._start)
+            if delay > 0:
+                time.sleep(delay)
+
+    def write(self, message: str, *args, **kwargs) -> int:
+        self._next(WRITE, message)
+        return len(message)
+
+    def write_raw(self, message: bytes) -> int:
+        record = self._next(WRITE_RAW)
+        if record.payload != message:
+            raise ReplayError(f'Call {self.calls}: expected write_raw({record.payload!r}), got {message!r}')
+        return len(message)
+
+    def query(self, message: str, *args, **kwargs) -> str:
+        return self._next(QUERY, message).payload.decode(self.encoding)
+
+    def read_raw(self, *args, **kwargs) -> bytes:
+        return self._next(READ_RAW).payload
+
+    def query_binary_values(self, message: str, datatype: str = 'f', is_big_endian: bool = False,
+                            container=list, **kwargs):
+        payload = self._next(BINARY, message).payload
+        values = np.frombuffer(payload[2:], dtype=np.dtype(payload[:2].decode('ascii')))
+        return container(values)
+
+    def close(self) -> None:
+        self._records.close()
+
+def open_session(resource_name: str):
+    """Open a device, a recording session or a replay as set by the environment.
+
+    Args:
+        resource_name: VISA resource name of the device
+
+    Returns:
+        VISA instrument instance, RecordingResource or ReplayResource
+    """
+    replay_path = os.environ.get('A1570_REPLAY')
+    if replay_path:
+        logger.info(f'Replaying session {replay_path} instead of {resource_name}')
+        return ReplayResource(replay_path, os.environ.get('A1570_REPLAY_TIMING', 'fast'))
+
+    import pyvisa as visa
+    inst = visa.ResourceManager().open_resource(resource_name)
+    record_path = os.environ.get('A1570_RECORD')
+    if record_path:
+        logger.info(f'Recording session of {resource_name} into {record_path}')
+        return RecordingResource(inst, record_path)
+    return inst
+
+def replay_all(path: str) -> int:
+    """Replay every call of a recording as fast as possible and return the number of calls."""
+    replay = ReplayResource(path)
+    for record in iter_records(path):
+        if record.kind == WRITE:
+            replay.write(record.command)
+        elif record.kind == WRITE_RAW:
+            replay.write_raw(record.payload)
+        elif record.kind == QUERY:
+            replay.query(record.command)
+        elif record.kind == READ_RAW:
+            replay.read_raw()
+        elif record.kind == BINARY:
+            replay.query_binary_values(record.command, container=np.array)
+        else:
+            # the call itself raises the recorded error
+            try:
+                getattr(replay, record.command)(*(() if record.command == 'read_raw' else ('',)))
+            except Exception:
+                pass
+    replay.close()
+    return replay.calls
+
+def main() -> None:
+    """Print a summary of a recording and its fast replay rate."""
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout, format='%(message)s')
+    path = sys.argv[1]
+    records = list(iter_records(path))
+    kinds = Counter(KIND_NAMES[r.kind] for r in records)
+    size = os.path.getsize(path)
+    duration = records[-1].time if records else 0
+    logger.info(f'{path}: {len(records)} records, {size / 1024:.1f} kB, {duration:.1f} s recorded')
+    for kind, count in kinds.most_common():
+        logger.info(f'  {kind}: {count}')
+    start = time.perf_counter()
+    calls = replay_all(path)
+    elapsed = time.perf_counter() - start
+    logger.info(f'Fast replay: {calls} calls in {elapsed * 1000:.1f} ms ({calls / max(elapsed, 1E-9):.0f} calls/s)')
+
+if __name__ == '__main__':
+    main()
@@ -5,19 +5,9 @@ import sys
 import time
 import matplotlib.pyplot as plt
 import numpy as np
-import pyvisa as visa
 import logging
 
-# Define a data class for block parameters
-@dataclass
-class BlockParameters:
-    gain: int # dB
-    pulse_level: int # V
-    sampling_rate: int # MHz
-    duration: float # number of periods 0.5, 1 ... 8
-    averaging: int = 4 # 2^averaging
-    probe_frequency: float = 3 # MHz
-
+from a1570.sweep_archive import BlockParameters, SweepArchive
 
 def load_from_json_file(filename:str):#->tuple[BlockParameters, b]:
     import json
@@ -28,6 +18,20 @@ def load_from_json_file(filename:str):#->tuple[BlockParameters, b]:
 
 directory = 'data_blocks'
 
+# blocks saved by receive_data_all_parameters.py are indexed in the archive of the directory
+if os.path.exists(f'{directory}/index.sqlite'):
+    archive = SweepArchive(directory)
+    fig = plt.figure()
+    # newest blocks first, filter with conditions like gain=('>=', 20), sampling_rate=50
+    for block, data in archive.query(order_by='-capture_time'):
+        print(block.parameters)
+        fig.clear()
+        plt.plot(data)
+        plt.title(f'block {block.id}')
+        plt.pause(0.1)
+    archive.close()
+    sys.exit()
+
 #sort files by date descending
 files = sorted(os.listdir(directory), key=lambda x: os.path.getmtime(f'{directory}/{x}'), reverse=True)
 
@@ -0,0 +1,80 @@
+"""
+Import time of the console entry points.
+
+Short, cron-driven jobs pay the interpreter startup and the imports of an entry point
+on every run. Every entry point module is imported in a fresh interpreter with
+`python -X importtime` and the cumulative import time is compared with the target.
+The slowest imported packages are listed to find imports that should be made lazy.
+
+Usage:
+    python startup_time.py            # all entry points
+    python startup_time.py --top 10   # list 10 slowest imports per entry point
+"""
+
+import argparse
+import logging
+import os
+import subprocess
+import sys
+import time
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# module of every console entry point, see pyproject.toml
+ENTRY_POINTS = {
+    'a1570': 'a1570.a1570_cli',
+    'a1570-daemon': 'a1570.acquisition_daemon',
+    'a1570-reprocess': 'a1570.reprocess_blocks',
+    'a1570-session': 'a1570.session_recording',
+    'a1570-codec-benchmark': 'a1570.ascan_codec',
+    'a1570-filter-benchmark': 'a1570.ascan_filters',
+}
+STARTUP_TARGET = 0.3 # s, import time of a headless entry point
+
+def measure_import(module: str) -> Tuple[float, float, List[Tuple[float, str]]]:
+    """Import a module in a fresh interpreter and measure it.
+
+    Args:
+        module: Module name in the a1570 package
+
+    Returns:
+        Tuple[float, float, List[Tuple[float, str]]]: Interpreter run time in s, import time
+        of the module in s and cumulative import time in s of every imported package
+    """
+    # run from the SCPI_Python folder, the package is found through a1570.py
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([os.path.dirname(os.path.abspath(__file__)),
+                                                        os.environ.get('PYTHONPATH', '')]))
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                             env=env, capture_output=True, text=True, check=True)
+    wall_time = time.perf_counter() - start
+
+    imports = []
+    for line in process.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        imports.append((int(cumulative) / 1E6, name.rstrip()))
+    module_time = next((t for t, name in imports if name.strip() == module), 0.0)
+    return wall_time, module_time, imports
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--top', type=int, default=5, help='number of slowest top-level imports to list')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout, format='%(message)s')
+
+    for entry_point, module in ENTRY_POINTS.items():
+        wall_time, module_time, imports = measure_import(module)
+        state = 'ok' if module_time <= STARTUP_TARGET else f'above target of {STARTUP_TARGET * 1000:.0f} ms'
+        logger.info(f'{entry_point} ({module}): import {module_time * 1000:.0f} ms, '
+                    f'interpreter {wall_time * 1000:.0f} ms, {state}')
+        # the entry point module is indented by one space, the packages it imports by three
+        top_level = [(t, name.strip()) for t, name in imports if name.startswith('   ') and not name.startswith('    ')]
+        for t, name in sorted(top_level, reverse=True)[:args.top]:
+            logger.info(f'    {name}: {t * 1000:.0f} ms')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+"""
+Indexed archive of sweep data blocks.
+
+Blocks are appended as raw int16 samples to one binary data file. A SQLite index
+(standard library) maps the acquisition parameters, capture time and device serial
+number of every block to its byte offset in the data file. Queries run on the index
+and return memory-mapped NumPy views, so no sample is read before it is used.
+
+Example:
+    >>> archive = SweepArchive('data_blocks')
+    >>> for block, vector in archive.query(gain=('>=', 20), sampling_rate=50):
+    ...     print(block.parameters, vector.max())
+
+Usage:
+    python sweep_archive.py <directory>    import JSON blocks of the directory into its archive
+"""
+
+import json
+import os
+import sqlite3
+import time
+from dataclasses import dataclass, fields
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# Define a data class for block parameters
+@dataclass
+class BlockParameters:
+    gain: int # dB
+    pulse_level: int # V
+    sampling_rate: int # MHz
+    duration: float # number of periods 0.5, 1 ... 8
+    averaging: int = 4 # 2^averaging
+    probe_frequency: float = 3 # MHz
+
+@dataclass
+class ArchivedBlock:
+    id: int
+    parameters: BlockParameters
+    capture_time: float # unix time
+    serial: str # device serial number
+    offset: int # byte offset in the data file
+    length: int # number of samples
+
+PARAMETER_COLUMNS = [f.name for f in fields(BlockParameters)]
+QUERY_COLUMNS = PARAMETER_COLUMNS + ['capture_time', 'serial', 'id']
+QUERY_OPERATORS = ('=', '!=', '<', '<=', '>', '>=')
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blocks (
+    id INTEGER PRIMARY KEY,
+    gain INTEGER NOT NULL,
+    pulse_level INTEGER NOT NULL,
+    sampling_rate INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    averaging INTEGER NOT NULL,
+    probe_frequency REAL NOT NULL,
+    capture_time REAL NOT NULL,
+    serial TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS blocks_acquisition ON blocks (sampling_rate, gain, pulse_level, duration);
+CREATE INDEX IF NOT EXISTS blocks_gain ON blocks (gain);
+CREATE INDEX IF NOT EXISTS blocks_capture_time ON blocks (capture_time);
+CREATE INDEX IF NOT EXISTS blocks_serial ON blocks (serial, capture_time);
+CREATE TABLE IF NOT EXISTS imported_files (
+    source TEXT NOT NULL UNIQUE,
+    block_id INTEGER NOT NULL REFERENCES blocks (id)
+);
+"""
+
+class SweepArchive:
+    """Binary data file of int16 blocks with a SQLite index.
+
+    Args:
+        directory: Folder holding 'index.sqlite' and 'blocks.bin', created if missing
+        commit_every: Number of appended blocks after which the index is committed
+    """
+    def __init__(self, directory: str, commit_every: int = 100):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.data_path = os.path.join(directory, 'blocks.bin')
+        self.index_path = os.path.join(directory, 'index.sqlite')
+        self.commit_every = commit_every
+        self.db = sqlite3.connect(self.index_path)
+        self.db.executescript(INDEX_SCHEMA)
+        self.data_file = open(self.data_path, 'ab')
+        self._pending = 0
+        self._memmap: Optional[np.memmap] = None
+
+    def append(self, parameters: BlockParameters, vector, serial: str = '',
+               capture_time: Optional[float] = None, source: Optional[str] = None) -> int:
+        """Append a block to the data file and the index.
+
+        Args:
+            parameters: Acquisition parameters of the block
+            vector: A-scan samples, converted to int16
+            serial: Serial number of the device
+            capture_time: Unix time of the capture, default now
+            source: File the block is imported from, see is_imported()
+
+        Returns:
+            int: Id of the block in the index
+        """
+        data = np.ascontiguousarray(vector, dtype='<i2')
+        offset = self.data_file.tell()
+        self.data_file.write(data.tobytes())
+        capture_time = time.time() if capture_time is None else capture_time
+        # numpy scalars (e.g. from np.arange) are stored as plain Python numbers
+        values = [getattr(parameters, c) for c in PARAMETER_COLUMNS]
+        values = [v.item() if isinstance(v, np.generic) else v for v in values]
+        cursor = self.db.execute(
+            f'INSERT INTO blocks ({", ".join(PARAMETER_COLUMNS)}, capture_time, serial, offset, length) '
+            f'VALUES ({", ".join("?" * (len(PARAMETER_COLUMNS) + 4))})',
+            values + [capture_time, serial, offset, data.size])
+        if source is not None:
+            self.db.execute('INSERT INTO imported_files (source, block_id) VALUES (?, ?)', (source, cursor.lastrowid))
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self.flush()
+        return cursor.lastrowid
+
+    def is_imported(self, source: str) -> bool:
+        """Check if a block of the source file was appended already."""
+        return self.db.execute('SELECT 1 FROM imported_files WHERE source = ?', (source,)).fetchone() is not None
+
+    def flush(self) -> None:
+        """Write buffered data and commit the index, so readers see all appended blocks."""
+        self.data_file.flush()
+        self.db.commit()
+        self._pending = 0
+
+    def close(self) -> None:
+        """Flush and close the archive."""
+        self.flush()
+        self.data_file.close()
+        self.db.close()
+        self._memmap = None
+
+    def __enter__(self) -> 'SweepArchive':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def select(self, order_by: str = 'id', limit: Optional[int] = None, **conditions) -> List[ArchivedBlock]:
+        """Find blocks by their acquisition parameters without touching the data file.
+
+        Args:
+            order_by: Column to sort by, prefix with '-' for descending order
+            limit: Maximum number of blocks
+            **conditions: Column name with a value for equality, or an (operator, value)
+                tuple, e.g. gain=('>=', 20), sampling_rate=50
+
+        Returns:
+            List[ArchivedBlock]: Matching blocks
+        """
+        sql, args = self._sql(f'id, {", ".join(PARAMETER_COLUMNS)}, capture_time, serial, offset, length',
+                              order_by, limit, conditions)
+        n = len(PARAMETER_COLUMNS)
+        return [ArchivedBlock(row[0], BlockParameters(*row[1:n + 1]), *row[n + 1:])
+                for row in self.db.execute(sql, args)]
+
+    def offsets(self, order_by: str = 'id', limit: Optional[int] = None, **conditions) -> np.ndarray:
+        """Find blocks like select(), but return only their location in the data file.
+
+        This is the fast path for large result sets, no Python object is created per block.
+
+        Returns:
+            np.ndarray: Array of shape (N, 3) with id, byte offset and number of samples
+        """
+        sql, args = self._sql('id, offset, length', order_by, limit, conditions)
+        rows = self.db.execute(sql, args).fetchall()
+        return np.array(rows, dtype=np.int64).reshape(-1, 3)
+
+    def _sql(self, columns: str, order_by: str, limit: Optional[int], conditions: dict) -> Tuple[str, list]:
+        """Build a SELECT statement with its arguments from query conditions."""
+        where = []
+        args = []
+        for column, condition in conditions.items():
+            if column not in QUERY_COLUMNS:
+                raise ValueError(f'Unknown column {column}, expected one of {QUERY_COLUMNS}')
+            op, value = condition if isinstance(condition, tuple) else ('=', condition)
+            if op not in QUERY_OPERATORS:
+                raise ValueError(f'Unknown operator {op}, expected one of {QUERY_OPERATORS}')
+            where.append(f'{column} {op} ?')
+            args.append(value)
+        descending = order_by.startswith('-')
+        order_column = order_by.lstrip('-')
+        if order_column not in QUERY_COLUMNS:
+            raise ValueError(f'Unknown column {order_column}, expected one of {QUERY_COLUMNS}')
+
+        sql = (f'SELECT {columns} FROM blocks'
+               + (f' WHERE {" AND ".join(where)}' if where else '')
+               + f' ORDER BY {order_column}{" DESC" if descending else ""}'
+               + (' LIMIT ?' if limit is not None else ''))
+        if limit is not None:
+            args.append(limit)
+        return sql, args
+
+    def vector(self, block: ArchivedBlock) -> np.ndarray:
+        """Return the samples of a block as a read-only memory-mapped view."""
+        start = block.offset // 2
+        return self.samples()[start:start + block.length]
+
+    def samples(self) -> np.ndarray:
+        """Return the whole data file as a read-only memory-mapped int16 array."""
+        self.data_file.flush()
+        size = os.path.getsize(self.data_path) // 2
+        if self._memmap is None or len(self._memmap) < size:
+            # data file grew since the last mapping
+            self._memmap = np.memmap(self.data_path, dtype='<i2', mode='r', shape=(size,)) if size else np.empty(0, '<i2')
+        return self._memmap
+
+    def query(self, order_by: str = 'id', limit: Optional[int] = None,
+              **conditions) -> Iterator[Tuple[ArchivedBlock, np.ndarray]]:
+        """Find blocks and yield them with memory-mapped views of their samples.
+
+        See select() for the arguments.
+        """
+        blocks = self.select(order_by, limit, **conditions)
+        samples = self.samples()
+        for block in blocks:
+            start = block.offset // 2
+            yield block, samples[start:start + block.length]
+
+    def __len__(self) -> int:
+        return self.db.execute('SELECT COUNT(*) FROM blocks').fetchone()[0]
+
+def import_json_blocks(directory: str, archive: SweepArchive, serial: str = '') -> int:
+    """Import blocks saved as JSON files by receive_data_all_parameters.py.
+
+    Files are recorded by their path relative to the archive, files imported before are
+    skipped, so the import can be repeated after new files were saved.
+
+    Args:
+        directory: Folder with the JSON blocks
+        archive: Archive to append to
+        serial: Serial number of the device that captured the blocks
+
+    Returns:
+        int: Number of imported blocks
+    """
+    count = 0
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.json'):
+            continue
+        path = os.path.join(directory, filename)
+        source = os.path.relpath(path, archive.directory)
+        if archive.is_imported(source):
+            continue
+        with open(path, 'r') as f:
+            data = json.load(f)
+        archive.append(BlockParameters(**data['parameters']), data['data'], serial, os.path.getmtime(path), source)
+        count += 1
+    archive.flush()
+    return count
+
+if __name__ == '__main__':
+    import sys
+    directory = sys.argv[1] if len(sys.argv) > 1 else 'data_blocks'
+    with SweepArchive(directory) as archive:
+        count = import_json_blocks(directory, archive)
+        print(f'Imported {count} blocks, archive holds {len(archive)} blocks')
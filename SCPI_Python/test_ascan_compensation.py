@@ -0,0 +1,49 @@
+import json
+import unittest
+from dataclasses import replace
+
+import numpy as np
+
+from a1570.ascan_compensation import AScanCompensator, eddy_correction
+from a1570.calibration_cache import CalibrationData
+
+EDDY_ARRAY = json.dumps({'eddy': [10, 20, 30], 'eddy_start': 50})
+
+class TestAScanCompensator(unittest.TestCase):
+    """Offline checks of the eddy compensation and dead-zone masking, no device needed."""
+
+    def setUp(self):
+        self.calibration = CalibrationData("'0:40;10:20;20:10;40:10'", 1.5, eddy_array=EDDY_ARRAY)
+
+    def test_eddy_array_is_subtracted_at_eddy_start(self):
+        correction = eddy_correction(EDDY_ARRAY, 100)
+        np.testing.assert_array_equal(correction[50:53], [10, 20, 30])
+        self.assertEqual(np.count_nonzero(correction), 3)
+        # cut at the end of short vectors
+        np.testing.assert_array_equal(eddy_correction(EDDY_ARRAY, 52)[50:], [10, 20])
+
+        compensator = AScanCompensator(self.calibration)
+        out = compensator.process(np.full((2, 100), 100, dtype=np.int16), 40)
+        np.testing.assert_array_equal(out[:, 50:53], [[90, 80, 70]] * 2)
+        np.testing.assert_array_equal(out[:, 53:], 100)
+
+    def test_dead_zone_is_masked_per_frame(self):
+        compensator = AScanCompensator(replace(self.calibration, eddy_array=None))
+        vectors = np.ones((3, 64), dtype=np.int16)
+        out = compensator.process(vectors, np.array([0, 10, 5]))
+        # dead zones 40, 20 and 30 samples
+        for frame, dead_zone in zip(out, (40, 20, 30)):
+            self.assertTrue((frame[:dead_zone] == 0).all())
+            self.assertTrue((frame[dead_zone:] == 1).all())
+
+    def test_tables_are_only_rebuilt_when_the_calibration_changes(self):
+        compensator = AScanCompensator(self.calibration)
+        compensator.process(np.zeros(100), 10)
+        tables = compensator._tables(100)
+        self.assertFalse(compensator.update(replace(self.calibration, probe_delay=2.0)))
+        self.assertIs(compensator._tables(100)[0], tables[0])
+        self.assertTrue(compensator.update(replace(self.calibration, eddy_array=None)))
+        self.assertEqual(np.count_nonzero(compensator._tables(100)[0]), 0)
+
+if __name__ == '__main__':
+    unittest.main()
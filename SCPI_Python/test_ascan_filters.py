@@ -0,0 +1,46 @@
+import unittest
+
+import numpy as np
+
+from a1570.ascan_codec import synthetic_frames
+from a1570.ascan_filters import BandpassEnvelope, reference_bandpass_envelope
+
+class TestBandpassEnvelope(unittest.TestCase):
+    """Offline checks of the float32 filter stage against a float64 reference, no device needed."""
+
+    def assert_matches_reference(self, frames, sampling_rate, probe_frequency=3E6):
+        stage = BandpassEnvelope(sampling_rate, probe_frequency)
+        reference_filtered, reference_envelope = reference_bandpass_envelope(frames, sampling_rate, probe_frequency)
+        tolerance = 1E-4 * np.abs(reference_envelope).max()
+        # twice, the second call runs on the reused buffers
+        for _ in range(2):
+            filtered, envelope = stage.process(frames)
+            np.testing.assert_allclose(filtered, reference_filtered, atol=tolerance)
+            np.testing.assert_allclose(envelope, reference_envelope, atol=tolerance)
+
+    def test_full_length(self):
+        frames = synthetic_frames(8, 8192)
+        for sampling_rate in (25E6, 50E6, 100E6):
+            with self.subTest(sampling_rate=sampling_rate):
+                self.assert_matches_reference(frames, sampling_rate)
+
+    def test_short_vectors(self):
+        self.assert_matches_reference(synthetic_frames(4, 1000), 100E6)
+
+    def test_single_vector(self):
+        frame = synthetic_frames(1, 2048)[0]
+        filtered, envelope = BandpassEnvelope(100E6, 3E6).process(frame)
+        reference_filtered, reference_envelope = reference_bandpass_envelope(frame, 100E6, 3E6)
+        self.assertEqual(filtered.shape, frame.shape)
+        np.testing.assert_allclose(filtered, reference_filtered[0], atol=1E-4 * reference_envelope.max())
+
+    def test_tail_is_filtered(self):
+        # a burst at the end of a long vector must not be cleared with the negative frequencies
+        t = np.arange(8192) / 100E6
+        burst = (1000 * np.exp(-((t - 75E-6) / 1E-6) ** 2) * np.sin(2 * np.pi * 3E6 * t)).astype(np.int16)
+        filtered, envelope = BandpassEnvelope(100E6, 3E6).process(burst[np.newaxis])
+        self.assertGreater(np.abs(filtered[0, 7000:]).max(), 500)
+        self.assertGreater(envelope[0, 7500], 500)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+
+import numpy as np
+
+from a1570.bscan_buffer import BScanBuffer
+
+class TestBScanBuffer(unittest.TestCase):
+    """Offline checks of the rolling B-scan buffer, no device needed."""
+
+    def test_ring_wrap_keeps_the_latest_rows_in_order(self):
+        bscan = BScanBuffer(capacity=4, samples=8)
+        for i in range(10):
+            bscan.append(np.full(8, i))
+        view = bscan.view
+        self.assertEqual(view.shape, (4, 8))
+        np.testing.assert_array_equal(view[:, 0], [6, 7, 8, 9])
+        # one contiguous view into the ring, no copy
+        self.assertTrue(view.flags['C_CONTIGUOUS'])
+        self.assertTrue(np.shares_memory(view, bscan._data))
+        self.assertEqual(bscan.appended, 10)
+
+    def test_time_and_depth_decimation(self):
+        bscan = BScanBuffer(capacity=4, samples=8, time_decimation=2, depth_decimation=4)
+        self.assertFalse(bscan.append(np.array([1, -9, 2, 3, 4, 5, 6, 7])))
+        self.assertTrue(bscan.append(np.array([8, 0, 0, 0, 0, 0, 0, 0])))
+        np.testing.assert_array_equal(bscan.view, [[9, 7]])
+
+        mean = BScanBuffer(capacity=4, samples=8, time_decimation=2, depth_decimation=4, reduction='mean')
+        mean.append(np.array([4, 4, 4, 4, -8, -8, -8, -8]))
+        mean.append(np.array([0, 0, 0, 0, 8, 8, 8, 8]))
+        np.testing.assert_array_equal(mean.view, [[2, 0]])
+
+    def test_short_vectors_are_padded_and_values_clipped(self):
+        bscan = BScanBuffer(capacity=2, samples=4)
+        bscan.append(np.array([-32768, 100], dtype=np.int16))
+        np.testing.assert_array_equal(bscan.view, [[32767, 100, 0, 0]])
+
+    def test_clear(self):
+        bscan = BScanBuffer(capacity=2, samples=4)
+        for _ in range(3):
+            bscan.append(np.ones(4))
+        bscan.clear()
+        self.assertEqual((bscan.rows, bscan.appended, len(bscan.view)), (0, 0, 0))
+
+if __name__ == '__main__':
+    unittest.main()
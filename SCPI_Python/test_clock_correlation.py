@@ -0,0 +1,36 @@
+import unittest
+
+from a1570.clock_correlation import ClockCorrelator
+from a1570.fake_results import device_result
+
+def time_of_day(seconds: int) -> str:
+    seconds %= 24 * 3600
+    return f'{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}'
+
+def poll(correlator: ClockCorrelator, counter: int, host_time: float, drift_ppm: float) -> bool:
+    """Observe a result produced at host_time by a device clock with the given drift."""
+    timestamp = time_of_day(int(12 * 3600 + 0.4 + (host_time - 1E9) * (1 + drift_ppm * 1E-6)))
+    result = device_result(counter=counter, timestamp=timestamp)
+    return correlator.observe(result, host_time - 0.005, host_time + 0.003)
+
+class TestClockCorrelator(unittest.TestCase):
+    """Offline checks of the host/device clock correlation, no device needed."""
+
+    def test_drift_from_the_device_timestamps(self):
+        for drift_ppm in (200.0, -150.0):
+            correlator = ClockCorrelator(offset_window=60)
+            self.assertIsNone(correlator.drift_ppm)
+            for counter in range(2 * 3600):
+                poll(correlator, counter, 1E9 + counter, drift_ppm)
+            self.assertLessEqual(abs(correlator.drift_ppm - drift_ppm), correlator.drift_error_ppm)
+            self.assertLess(correlator.drift_error_ppm, abs(drift_ppm))
+
+    def test_no_drift_within_the_first_window(self):
+        correlator = ClockCorrelator(offset_window=60)
+        for counter in range(50):
+            poll(correlator, counter, 1E9 + counter, 0.0)
+        self.assertIsNone(correlator.drift_ppm)
+        self.assertIsNotNone(correlator.device_clock_offset[0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+
+import numpy as np
+
+from a1570.common_functions import set_strobe_parameters
+from a1570.dead_zones import DeadZoneModel
+
+DEAD_ZONES = "'0:345;5:269;10:200;15:150;20:120;25:100;30:90;35:85;40:80'"
+
+class FakeInstrument:
+    """Answers the gain and records the written commands."""
+    def __init__(self, gain: int):
+        self.gain = gain
+        self.written = []
+
+    def write(self, message: str):
+        self.written.append(message)
+
+    def query(self, message: str) -> str:
+        if message == 'GAIN:LEVel?':
+            return str(self.gain)
+        # read back the value written last
+        return self.written[-1].split()[-1]
+
+class TestDeadZoneModel(unittest.TestCase):
+    """Offline checks of the gain-indexed dead zones, no device needed."""
+
+    def setUp(self):
+        self.model = DeadZoneModel.from_string(DEAD_ZONES)
+
+    def test_interpolation_between_steps(self):
+        self.assertAlmostEqual(float(self.model(5)), 269)
+        self.assertAlmostEqual(float(self.model(7)), 269 + (200 - 269) * 2 / 5)
+        self.assertAlmostEqual(float(self.model(17.5)), 135)
+
+    def test_gains_outside_the_range_are_clipped(self):
+        self.assertAlmostEqual(float(self.model(-3)), 345)
+        self.assertAlmostEqual(float(self.model(55)), 80)
+
+    def test_vectorized_samples(self):
+        gains = np.array([0, 2.5, 12, 40, 60])
+        expected = [int(np.ceil(self.model(g))) for g in gains]
+        np.testing.assert_array_equal(self.model.samples(gains), expected)
+        np.testing.assert_array_equal(self.model.check_strobe_begin(200, gains), [False, False, True, True, True])
+
+    def test_strobe_begin_is_checked_before_it_is_sent(self):
+        inst = FakeInstrument(gain=15)
+        with self.assertRaises(ValueError):
+            set_strobe_parameters(inst, 15, 140, 250, self.model)
+        self.assertEqual(inst.written, [])
+        set_strobe_parameters(inst, 15, 150, 250, self.model)
+        self.assertEqual(inst.written[1], 'SENSe:STROBE:BEG 150')
+
+if __name__ == '__main__':
+    unittest.main()
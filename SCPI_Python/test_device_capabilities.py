@@ -0,0 +1,83 @@
+import json
+import tempfile
+import unittest
+
+from a1570.device_capabilities import (PARAMETERS, CapabilityStore, DeviceCapabilities, ParameterRange,
+                                       learn_parameter_range)
+from a1570.scpi_commands import COMMANDS
+
+IDN = 'ACS-Solutions GmbH,A1570,123456789,ESP 1.25 MCU 6.01.244'
+
+class FakeParameter:
+    """Device side of one numeric parameter with the MIN, MAX, DEF and UP keywords."""
+    def __init__(self, values, default, value):
+        self.values = values
+        self.default = default
+        self.value = value
+        self.writes = 0
+
+    def write(self, message: str):
+        self.writes += 1
+        keyword = message.split()[1]
+        if keyword == 'MIN':
+            self.value = self.values[0]
+        elif keyword == 'MAX':
+            self.value = self.values[-1]
+        elif keyword == 'DEF':
+            self.value = self.default
+        elif keyword == 'UP':
+            self.value = next((v for v in self.values if v > self.value), self.value)
+        else:
+            self.value = float(keyword) * (1E6 if message.endswith('MHZ') else 1)
+
+    def query(self, message: str) -> str:
+        return f'{self.value:g}'
+
+class TestDeviceCapabilities(unittest.TestCase):
+    """Offline checks of the learned parameter ranges, no device needed."""
+
+    def test_enumerated_values_are_learned(self):
+        device = FakeParameter([25E6, 50E6, 100E6], 50E6, 100E6)
+        r = learn_parameter_range(device, COMMANDS['sampling_frequency'])
+        self.assertEqual(r.values, [25E6, 50E6, 100E6])
+        # the original value is restored
+        self.assertEqual(device.value, 100E6)
+
+        capabilities = DeviceCapabilities('ESP 1.25', {'sampling_frequency': r})
+        capabilities.validate('sampling_frequency', 50E6)
+        with self.assertRaises(ValueError):
+            capabilities.validate('sampling_frequency', 75E6)
+        self.assertEqual(capabilities.clamp('sampling_frequency', 80E6), 100E6)
+        self.assertEqual(capabilities.clamp('sampling_frequency', 1E9), 100E6)
+
+    def test_fine_grid_keeps_the_step(self):
+        device = FakeParameter(list(range(0, 81)), 15, 20)
+        r = learn_parameter_range(device, COMMANDS['gain'], max_values=8)
+        self.assertIsNone(r.values)
+        self.assertEqual((r.minimum, r.maximum, r.step), (0, 80, 1))
+        self.assertEqual(device.value, 20)
+
+        capabilities = DeviceCapabilities('ESP 1.25', {'gain': r})
+        capabilities.validate('gain', 42)
+        with self.assertRaises(ValueError):
+            capabilities.validate('gain', 42.5)
+        self.assertEqual(capabilities.clamp('gain', 90), 80)
+
+    def test_files_without_value_sets_are_learned_again(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = CapabilityStore(directory)
+            ranges = {name: ParameterRange(0, 10, 5, 1) for name in PARAMETERS}
+            store.save(IDN, ranges)
+            self.assertIsNotNone(store.load(IDN))
+
+            filename = store.path('A1570', 'ESP 1.25 MCU 6.01.244')
+            with open(filename, 'r') as f:
+                stored = json.load(f)
+            for r in stored.values():
+                del r['values']
+            with open(filename, 'w') as f:
+                json.dump(stored, f)
+            self.assertIsNone(store.load(IDN))
+
+if __name__ == '__main__':
+    unittest.main()
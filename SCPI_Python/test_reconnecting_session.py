@@ -0,0 +1,148 @@
+import json
+import unittest
+from unittest import mock
+
+from a1570.calibration_cache import CalibrationData
+from a1570.reconnecting_session import ReconnectingSession
+
+IDN = 'ACS-Solutions GmbH,A1570,123456789,ESP 1.25 MCU 6.01.244'
+
+class FakeDevice:
+    """State of the device that outlives the connections."""
+    def __init__(self):
+        self.gain = 10
+        self.counter = 0
+        self.connections = []
+
+class FakeResource:
+    """Connection to the fake device with an output buffer like a socket."""
+    def __init__(self, device: FakeDevice):
+        self.device = device
+        self.timeout = 5000
+        self.encoding = 'iso-8859-1'
+        self.read_termination = '\r\n'
+        self.write_termination = '\r\n'
+        self.broken = False
+        self.written = []
+        self.buffer = []
+        self.late = [] # answers arriving after the next clear()
+        self.timeout_queries = () # queries whose answer comes too late
+
+    def _check(self):
+        if self.broken:
+            raise ConnectionResetError('connection reset by peer')
+
+    def write(self, message: str):
+        self._check()
+        self.written.append(message)
+        header, _, value = message.partition(' ')
+        if header == 'GAIN':
+            self.device.gain = self.device.gain + 1 if value == 'UP' else int(value.split()[0])
+        elif header == '*IDN?':
+            self.buffer.append(IDN)
+        elif header == 'GAIN?':
+            self.buffer.append(str(self.device.gain))
+        elif header == 'FETCh:RESult:MEASure?':
+            self.buffer.append(json.dumps({'command': 'measurement_result', 'contact': True,
+                                           'counter': self.device.counter, 'thickness': 10000}))
+
+    def write_raw(self, message: bytes):
+        self._check()
+        for command in message.decode(self.encoding).split(self.write_termination):
+            if command:
+                self.write(command)
+
+    def read(self) -> str:
+        self._check()
+        if not self.buffer:
+            raise TimeoutError('no answer')
+        return self.buffer.pop(0)
+
+    def query(self, message: str) -> str:
+        self.write(message)
+        if message in self.timeout_queries:
+            self.late.append(self.buffer.pop())
+            raise TimeoutError('no answer')
+        return self.read()
+
+    def clear(self):
+        self._check()
+        self.buffer = self.late
+        self.late = []
+
+    def close(self):
+        pass
+
+class TestReconnectingSession(unittest.TestCase):
+    """Offline checks of the reconnect and restore logic, no device needed."""
+
+    def setUp(self):
+        self.device = FakeDevice()
+
+        def open_session(resource_name):
+            resource = FakeResource(self.device)
+            self.device.connections.append(resource)
+            return resource
+
+        patcher = mock.patch('a1570.reconnecting_session.open_session', side_effect=open_session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.session = ReconnectingSession('tcpip::fake::5025::SOCKET', backoff_initial=0.01)
+        self.session.timeout = 2000
+
+    def test_reconnect_restores_state_and_repeats_the_call(self):
+        self.session.write('GAIN 15')
+        self.session.write('STARt:MAXStrobe')
+        self.device.connections[0].broken = True
+        self.assertEqual(self.session.query('GAIN?'), '15')
+
+        self.assertEqual(len(self.device.connections), 2)
+        restored = self.device.connections[1]
+        self.assertEqual(restored.timeout, 2000)
+        self.assertEqual(restored.written, ['GAIN 15', 'STARt:MAXStrobe', 'GAIN?'])
+        self.assertEqual(len(self.session.outages), 1)
+        self.assertEqual(self.session.outages[0].attempts, 1)
+
+    def test_relative_value_is_read_back(self):
+        self.session.write('GAIN 15')
+        self.session.write('GAIN UP')
+        self.assertEqual(self.device.gain, 16)
+        self.assertEqual(self.session.restore_commands(), ['GAIN 16 DB'])
+
+    def test_restore_commands_order(self):
+        self.session.write('TRIGgering:INTerval 0.25 S')
+        self.session.write('GAIN 15')
+        self.session.write('STARt:P2Peak')
+        self.session.remember_calibration(CalibrationData('0:345;5:269', 1.5))
+        # a changed setting moves behind the settings it may depend on
+        self.session.write('TRIGgering:INTerval 0.5 S')
+        self.assertEqual(self.session.restore_commands(), [
+            'GAIN 15', "SENSe:DEZones '0:345;5:269'", 'SENSe:PROBe:DELay:PROCessing 1.5',
+            'TRIGgering:INTerval 0.5 S', 'STARt:P2Peak'])
+        self.session.write('STOP')
+        self.assertNotIn('STARt:P2Peak', self.session.restore_commands())
+
+    def test_lost_results_from_the_counter(self):
+        self.session.write('STARt:MAXStrobe')
+        self.device.counter = 5
+        self.session.query('FETCh:RESult:MEASure?')
+        self.device.connections[0].broken = True
+        self.device.counter = 9
+        answ = self.session.query('FETCh:RESult:MEASure?')
+        self.assertEqual(json.loads(answ)['counter'], 9)
+        self.assertEqual(self.session.outages[0].lost_results, 3)
+        self.assertEqual(self.session.lost_results, 3)
+
+    def test_late_answer_is_not_taken_for_the_probe(self):
+        self.assertEqual(self.session.query('*IDN?'), IDN)
+        self.session.write('GAIN 15')
+        self.device.connections[0].timeout_queries = ('FETCh:RESult:MEASure?',)
+        with self.assertRaises(TimeoutError):
+            self.session.query('FETCh:RESult:MEASure?')
+        # the late JSON answer has more commas than an IDN, it must not shift the answers
+        self.assertEqual(self.session.query('GAIN?'), '15')
+        self.assertEqual(len(self.device.connections), 1)
+        self.assertEqual(self.session.outages, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+
+from a1570.scpi_commands import COMMANDS, short_form
+
+class TestScpiCommands(unittest.TestCase):
+    """Offline checks of the encoded commands, no device needed."""
+
+    def test_wire_form_of_the_examples(self):
+        # the forms sent by receive_data_all_parameters.py and receive_data_show.py
+        self.assertEqual(COMMANDS['pulse_level'].encode(200), b'TRAN:PULS 200')
+        self.assertEqual(COMMANDS['sampling_frequency'].encode(50, 'MHZ'), b'FREQ 50 MHZ')
+        self.assertEqual(COMMANDS['transmitter_frequency'].encode(3, 'MHZ'), b'TRAN:FREQ 3000000 HZ')
+        self.assertEqual(COMMANDS['trigger_interval'].encode(250000, 'US'), b'TRIG:INT 0.25 S')
+        self.assertEqual(COMMANDS['gain'].encode(15), b'GAIN 15 DB')
+
+    def test_values_without_unit_are_in_the_base_unit(self):
+        self.assertEqual(COMMANDS['sampling_frequency'].encode(25E6), b'FREQ 25 MHZ')
+        self.assertEqual(COMMANDS['pulse_level'].encode(400, 'V'), b'TRAN:PULS 400')
+        with self.assertRaises(ValueError):
+            COMMANDS['pulse_level'].encode(0.5, 'V')
+
+    def test_restore_query_answer(self):
+        self.assertEqual(COMMANDS['sampling_frequency'].restore('100000000'), b'FREQ 100 MHZ')
+        self.assertEqual(COMMANDS['pulse_level'].restore('600'), b'TRAN:PULS 600')
+        self.assertEqual(COMMANDS['transmitter_enable'].restore('1'), b'TRAN:ENAB ON')
+        self.assertEqual(COMMANDS['trigger_mode'].restore('INTERNAL'), b'TRIG:MODE INTERNAL')
+
+    def test_short_form(self):
+        self.assertEqual(short_form('[SOURce:]GAIN[:LEVel]'), 'GAIN')
+        self.assertEqual(short_form('SENSe:STROBE:LEVel'), 'SENS:STROBE:LEV')
+        self.assertEqual(short_form('SYSTem:version'), 'SYST:version')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,4 @@
+import os
 import sys
 import time
 import unittest
@@ -6,10 +7,38 @@ import numpy as np
 import pyvisa as visa
 import logging
 
-from common_functions import *
+from a1570.common_functions import *
+from a1570.scpi_commands import COMMANDS
+from a1570.session_recording import open_session
 logger = logging.getLogger()
 logger.level = logging.INFO
 
+# VISA resource of the device under test, set by parallel_suite_runner.py for each shard
+resource_name: str = os.environ.get('A1570_RESOURCE', 'tcpip::192.168.0.11::5025::SOCKET')
+
+# settings changed by the tests, saved once per session and restored afterwards
+# (names of scpi_commands.COMMANDS)
+session_state = [
+    'gain',
+    'trigger_mode',
+    'trigger_interval',
+    'sampling_frequency',
+    'pulse_level',
+    'transmitter_frequency',
+    'transmitter_period',
+    'transmitter_duration',
+    'transmitter_enable',
+    'transmitter_mode',
+    'data_length',
+    'average_count',
+    'average_period',
+    'average_period_random',
+    'filter_hpass_number',
+    'magnet_delay',
+    'magnet_enable',
+    'magnet_voltage',
+]
+
 class test_scpi_interface_a1570(unittest.TestCase):
     trasmitter_frequencies = np.array([20, 20000]) * 1000
     trasmitter_frequencies_step = 1000 * 1000
@@ -21,34 +50,42 @@ class test_scpi_interface_a1570(unittest.TestCase):
         }        
     
     stream_handler = logging.StreamHandler(sys.stdout)
-    
-    def setUp(self) -> None:
-        
-        logger.addHandler(self.stream_handler)
-        logger.info('Start test_scpi_interface_a1570...')
-
-        self.ip: str = '192.168.0.11'
-        self.port: int = 5025
-        self.rm = visa.ResourceManager()
-        self.inst = self.rm.open_resource(f'tcpip::{self.ip}::{str(self.port)}::SOCKET')
-        self.inst.encoding = 'iso-8859-1'
-        self.inst.timeout = 5000 # miliseconds
-        self.inst.read_termination = '\r\n'
-        self.inst.write_termination = '\r\n'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        # one connection is shared by all tests of the session
+        cls.session_start = time.perf_counter()
+        logger.addHandler(cls.stream_handler)
+        logger.info(f'Start test_scpi_interface_a1570 on {resource_name}...')
+
+        # A1570_RECORD / A1570_REPLAY record the session or run it offline, see session_recording.py
+        cls.inst = open_session(resource_name)
+        cls.inst.encoding = 'iso-8859-1'
+        cls.inst.timeout = 5000 # miliseconds
+        cls.inst.read_termination = '\r\n'
+        cls.inst.write_termination = '\r\n'
         
-        self.idn: str = self.inst.query('*IDN?')
-        logger.info(self.idn)
+        cls.idn: str = cls.inst.query('*IDN?')
+        logger.info(cls.idn)
 
+        # save device state, it is restored when the session ends
+        cls.saved_state = [(COMMANDS[name], cls.inst.query(COMMANDS[name].query)) for name in session_state]
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        # restore device state in one transfer
+        write_commands(cls.inst, [cmd.restore(answ) for cmd, answ in cls.saved_state])
+        cls.inst.close()
+        logger.info(f'Session on {resource_name} finished in {time.perf_counter() - cls.session_start:.1f} s')
+        logger.removeHandler(cls.stream_handler)
+
+    def setUp(self) -> None:
         # readout error queue before test
         while True:
             err_num, err_msg = read_error_queue(self.inst)
             if (err_num == 0):
                 break
 
-    def tearDown(self) -> None:
-        self.inst.close()
-        logger.removeHandler(self.stream_handler)
-
     def test_connection(self):
         idn = self.inst.query('*IDN?')
         assert idn.startswith('ACS-Solutions GmbH,A1570')
@@ -0,0 +1,30 @@
+import json
+import os
+import tempfile
+import unittest
+
+from a1570.sweep_archive import SweepArchive, import_json_blocks
+
+class TestSweepArchive(unittest.TestCase):
+    """Offline checks of the sweep archive, no device needed."""
+
+    def test_json_import_is_repeatable(self):
+        with tempfile.TemporaryDirectory() as directory:
+            def save_block(gain: int) -> None:
+                with open(os.path.join(directory, f'block_{gain}_200_50_1.0.json'), 'w') as f:
+                    json.dump({'parameters': {'gain': gain, 'pulse_level': 200, 'sampling_rate': 50,
+                                              'duration': 1.0}, 'data': [gain, 2, 3]}, f)
+
+            save_block(10)
+            save_block(20)
+            with SweepArchive(directory) as archive:
+                self.assertEqual(import_json_blocks(directory, archive), 2)
+            with SweepArchive(directory) as archive:
+                self.assertEqual(import_json_blocks(directory, archive), 0)
+                save_block(30)
+                self.assertEqual(import_json_blocks(directory, archive), 1)
+                self.assertEqual(len(archive), 3)
+                self.assertEqual([int(v[0]) for _, v in archive.query(order_by='gain')], [10, 20, 30])
+
+if __name__ == '__main__':
+    unittest.main()
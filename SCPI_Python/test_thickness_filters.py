@@ -0,0 +1,43 @@
+import unittest
+
+from a1570.common_functions import INVALID_THICKNESS_UM, has_thickness
+from a1570.fake_results import device_result
+from a1570.thickness_filters import HampelFilter, KalmanFilter, ThicknessFilterBank, quality_weight
+
+class TestThicknessFilters(unittest.TestCase):
+    """Offline checks of the streaming thickness filters, no device needed."""
+
+    def test_invalid_thickness_is_no_reading(self):
+        for thickness_um in INVALID_THICKNESS_UM:
+            result = device_result(thickness_um)
+            self.assertFalse(has_thickness(result))
+            self.assertEqual(quality_weight(result), 0.0)
+        self.assertTrue(has_thickness(device_result(10000)))
+
+    def test_invalid_thickness_does_not_reach_the_estimate(self):
+        for thickness_filter in (KalmanFilter(), HampelFilter()):
+            with self.subTest(filter=type(thickness_filter).__name__):
+                for counter in range(5):
+                    thickness_filter.update(device_result(10000 + counter, counter=counter))
+                for counter in range(5, 10):
+                    filtered = thickness_filter.update(device_result(65535, counter=counter))
+                    self.assertAlmostEqual(filtered.thickness, 10.0, delta=0.01)
+                    self.assertFalse(filtered.outlier)
+
+    def test_outlier_rejected(self):
+        thickness_filter = KalmanFilter()
+        for counter in range(10):
+            thickness_filter.update(device_result(10000, counter=counter))
+        filtered = thickness_filter.update(device_result(13000, counter=10))
+        self.assertTrue(filtered.outlier)
+        self.assertAlmostEqual(filtered.thickness, 10.0, delta=0.01)
+
+    def test_state_per_device(self):
+        filters = ThicknessFilterBank(KalmanFilter)
+        filters.update('a', device_result(10000))
+        filters.update('b', device_result(5000))
+        self.assertAlmostEqual(filters.update('a', device_result(10000)).thickness, 10.0, delta=0.01)
+        self.assertAlmostEqual(filters.update('b', device_result(5000)).thickness, 5.0, delta=0.01)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+
+import numpy as np
+
+from a1570.fake_results import device_result
+from a1570.thickness_map import EncoderTrack, ThicknessGrid, ThicknessMapper
+
+class TestThicknessMapper(unittest.TestCase):
+    """Offline checks of the thickness mapping, no device needed."""
+
+    def setUp(self):
+        self.grid = ThicknessGrid((0, 100), (0, 10), cell_size=10)
+
+    def test_invalid_thickness_is_not_binned(self):
+        mapper = ThicknessMapper(EncoderTrack(), self.grid, batch_size=1)
+        mapper.add_position([0.0, 10.0], [0.0, 100.0], [5.0, 5.0])
+        mapper.add_result(device_result(10000), host_time=1.0)
+        mapper.add_result(device_result(65535), host_time=2.0)
+        mapper.add_result(device_result(-1), host_time=3.0)
+        mapper.add_result(device_result(10000, contact=False), host_time=4.0)
+        mapper.flush(final=True)
+        self.assertEqual(mapper.binned, 1)
+        self.assertEqual(mapper.invalid, 3)
+        self.assertAlmostEqual(float(np.nanmax(self.grid.min)), 10.0, places=3)
+
+    def test_dropped_results_are_counted(self):
+        mapper = ThicknessMapper(EncoderTrack(), self.grid, max_pending=4, batch_size=100)
+        for counter in range(10):
+            mapper.add_result(device_result(10000, counter=counter), host_time=float(counter))
+        self.assertEqual(mapper.dropped, 6)
+        mapper.add_position([0.0, 10.0], [0.0, 100.0], [5.0, 5.0])
+        self.assertEqual(mapper.flush(final=True), 4)
+        self.assertEqual(mapper.binned + mapper.dropped, 10)
+
+if __name__ == '__main__':
+    unittest.main()
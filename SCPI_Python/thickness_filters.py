@@ -0,0 +1,178 @@
+"""
+Streaming outlier-robust thickness filters.
+
+A single bad reading with contact is passed on as a valid thickness by the examples.
+These filters smooth the result stream per result in constant time and report a
+filtered thickness with a confidence estimate:
+
+- HampelFilter replaces readings far from the median of a short window (measured in
+  median absolute deviations) by the median.
+- KalmanFilter tracks the thickness as a random walk and rejects readings outside an
+  innovation gate. A run of rejected readings is taken as a real step and restarts it.
+- contact_quality weights every reading: a poor contact counts as a noisier reading and
+  results without contact or thickness only age the estimate.
+- ThicknessFilterBank keeps one filter per device.
+
+The confidence is the probability that the filtered thickness is within the tolerance
+of the true thickness, from the estimated standard deviation.
+
+Example:
+    >>> filters = ThicknessFilterBank(KalmanFilter)
+    >>> filtered = filters.update('gauge_1', parse_measurement_result(answ))
+    >>> print(f'{filtered.thickness:.2f} mm ({filtered.confidence:.0%})')
+"""
+
+import bisect
+import math
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, List, Optional
+
+from a1570.common_functions import Result, has_thickness
+
+# contact_quality of a perfect contact
+QUALITY_MAX = 100
+# standard deviation of a normal distribution per median absolute deviation
+MAD_SCALE = 1.4826
+
+@dataclass
+class FilteredThickness:
+    thickness: Optional[float] # mm, None until the filter saw a valid reading
+    std: float # mm, estimated standard deviation of thickness
+    confidence: float # 0-1, probability that thickness is within the tolerance
+    outlier: bool = False # the reading was rejected
+
+def quality_weight(result: Result) -> float:
+    """Weight of a result from 0 (no measurement) to 1 (perfect contact)."""
+    if not has_thickness(result):
+        return 0.0
+    return min(max(result.contact_quality / QUALITY_MAX, 0.0), 1.0)
+
+def confidence(std: float, tolerance: float) -> float:
+    """Probability that a normal error of standard deviation std is within +-tolerance."""
+    if std <= 0:
+        return 1.0
+    return math.erf(tolerance / (std * math.sqrt(2)))
+
+class HampelFilter:
+    """Median window filter replacing outliers by the median.
+
+    Args:
+        window: Number of readings in the window
+        threshold: Readings farther than threshold * scale from the median are outliers,
+            scale is the standard deviation estimated from the median absolute deviation
+        min_scale: Lower limit of the scale in mm, e.g. the resolution of the readings
+        min_weight: Readings with a lower quality weight are ignored
+        tolerance: Tolerance of the confidence in mm
+    """
+    def __init__(self, window: int = 7, threshold: float = 3.0, min_scale: float = 0.01,
+                 min_weight: float = 0.1, tolerance: float = 0.1):
+        self.threshold = threshold
+        self.min_scale = min_scale
+        self.min_weight = min_weight
+        self.tolerance = tolerance
+        self._window: Deque[float] = deque(maxlen=window)
+        self._sorted: List[float] = []
+        self.last: FilteredThickness = FilteredThickness(None, math.inf, 0.0)
+        self.outliers = 0
+
+    def _median(self, values: List[float]) -> float:
+        n = len(values)
+        return values[n // 2] if n % 2 else (values[n // 2 - 1] + values[n // 2]) / 2
+
+    def update(self, result: Result) -> FilteredThickness:
+        """Add a result and return the filtered thickness."""
+        weight = quality_weight(result)
+        if weight < self.min_weight:
+            return self.last
+        value = float(result.thickness)
+        if len(self._window) == self._window.maxlen:
+            del self._sorted[bisect.bisect_left(self._sorted, self._window[0])]
+        self._window.append(value)
+        bisect.insort(self._sorted, value)
+
+        median = self._median(self._sorted)
+        scale = max(MAD_SCALE * self._median(sorted(abs(v - median) for v in self._sorted)), self.min_scale)
+        # a poor contact is a noisier reading, it has to be closer to the median to be kept
+        outlier = len(self._sorted) >= 3 and abs(value - median) > self.threshold * scale * math.sqrt(weight)
+        if outlier:
+            self.outliers += 1
+            thickness, std = median, 1.2533 * scale / math.sqrt(len(self._sorted))
+        else:
+            thickness, std = value, scale / math.sqrt(weight)
+        self.last = FilteredThickness(thickness, std, confidence(std, self.tolerance), outlier)
+        return self.last
+
+class KalmanFilter:
+    """Scalar Kalman filter of the thickness with an innovation gate.
+
+    Args:
+        measurement_std: Standard deviation of a reading with perfect contact in mm
+        process_std: Change of the thickness between two results in mm (standard deviation)
+        gate: Readings farther than gate standard deviations of the innovation are outliers
+        max_rejections: Consecutive outliers after which the filter restarts at the reading
+        min_weight: Readings with a lower quality weight are ignored
+        tolerance: Tolerance of the confidence in mm
+    """
+    def __init__(self, measurement_std: float = 0.05, process_std: float = 0.005, gate: float = 4.0,
+                 max_rejections: int = 3, min_weight: float = 0.1, tolerance: float = 0.1):
+        self.measurement_variance = measurement_std ** 2
+        self.process_variance = process_std ** 2
+        self.gate = gate
+        self.max_rejections = max_rejections
+        self.min_weight = min_weight
+        self.tolerance = tolerance
+        self.thickness: Optional[float] = None
+        self.variance = math.inf
+        self.rejections = 0
+        self.outliers = 0
+
+    def update(self, result: Result) -> FilteredThickness:
+        """Add a result and return the filtered thickness."""
+        # predict: the thickness may have changed since the last result
+        self.variance += self.process_variance
+        weight = quality_weight(result)
+        outlier = False
+        if weight >= self.min_weight:
+            value = float(result.thickness)
+            measurement_variance = self.measurement_variance / weight
+            if self.thickness is None or self.rejections >= self.max_rejections:
+                # first reading or a real step of the thickness
+                self.thickness, self.variance = value, measurement_variance
+                self.rejections = 0
+            else:
+                innovation = value - self.thickness
+                innovation_variance = self.variance + measurement_variance
+                if innovation * innovation > self.gate * self.gate * innovation_variance:
+                    outlier = True
+                    self.rejections += 1
+                    self.outliers += 1
+                else:
+                    gain = self.variance / innovation_variance
+                    self.thickness += gain * innovation
+                    self.variance *= 1 - gain
+                    self.rejections = 0
+        std = math.sqrt(self.variance)
+        return FilteredThickness(self.thickness, std, confidence(std, self.tolerance) if self.thickness is not None
+                                 else 0.0, outlier)
+
+class ThicknessFilterBank:
+    """One thickness filter per device.
+
+    Args:
+        factory: Creates the filter of a new device, e.g. KalmanFilter or a lambda with parameters
+    """
+    def __init__(self, factory: Callable[[], object] = KalmanFilter):
+        self.factory = factory
+        self.filters: Dict[str, object] = {}
+
+    def update(self, device: str, result: Result) -> FilteredThickness:
+        """Filter a result of a device."""
+        thickness_filter = self.filters.get(device)
+        if thickness_filter is None:
+            thickness_filter = self.filters[device] = self.factory()
+        return thickness_filter.update(result)
+
+    def reset(self, device: str) -> None:
+        """Forget the state of a device, e.g. after the probe was moved to another object."""
+        self.filters.pop(device, None)
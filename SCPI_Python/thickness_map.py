@@ -0,0 +1,300 @@
+"""
+Position-tagged thickness mapping (C-scan).
+
+Results of a scan are fused with position samples of an encoder by host time and binned
+into a 2D thickness grid:
+
+- EncoderTrack keeps the latest position samples (time, x, y) in a fixed-size buffer and
+  interpolates the position at the host time of a result.
+- SimulatedEncoder replaces the encoder for tests with a serpentine raster over a plate
+  or around the circumference of a pipe.
+- ThicknessGrid accumulates min, mean and count per cell with vectorized NumPy updates.
+  The y axis can be periodic, e.g. the circumference of a pipe.
+- ThicknessMapper queues results until the encoder covers their time and bins them in
+  batches.
+
+The host time of a result is result.host_time (see clock_correlation) if it was set.
+Memory is bounded by the grid size, the encoder buffer and the result queue, so a scan
+can run for any time.
+
+Example:
+    >>> grid = ThicknessGrid((0, 500), (0, 300), cell_size=5)
+    >>> mapper = ThicknessMapper(EncoderTrack(), grid)
+    >>> mapper.add_position(time.time(), x, y)      # from the encoder readout
+    >>> mapper.add_result(result)                   # from FETCh:RESult:MEASure?
+    >>> grid.mean                                   # (ny, nx) thickness map in mm
+
+Usage:
+    python thickness_map.py    # simulated plate scan with a corrosion pit
+"""
+
+import logging
+import math
+import sys
+import time
+from collections import deque
+from typing import Deque, Optional, Tuple
+
+import numpy as np
+
+from a1570.common_functions import Result, has_thickness
+
+logger = logging.getLogger(__name__)
+
+class EncoderTrack:
+    """Latest position samples of an encoder in a fixed-size buffer.
+
+    Args:
+        capacity: Number of samples kept, older samples are dropped
+    """
+    def __init__(self, capacity: int = 4096):
+        self.capacity = capacity
+        self._data = np.empty((3, capacity)) # rows: time, x, y
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def span(self) -> Tuple[float, float]:
+        """Host time of the oldest and of the latest sample."""
+        if self._size == 0:
+            return math.inf, -math.inf
+        return self._data[0, 0], self._data[0, self._size - 1]
+
+    def add(self, t, x, y) -> None:
+        """Add one or more position samples in ascending time.
+
+        Args:
+            t: Host time (time.time()) of the samples
+            x: Position along the scan axis in mm
+            y: Position across the scan axis in mm (or along the circumference of a pipe)
+        """
+        samples = np.array([t, x, y], dtype=float).reshape(3, -1)
+        count = samples.shape[1]
+        if count >= self.capacity:
+            self._data[:] = samples[:, -self.capacity:]
+            self._size = self.capacity
+            return
+        if self._size + count > self.capacity:
+            # drop the oldest half at once, keeps the buffer contiguous for np.interp
+            keep = min(self._size, self.capacity // 2, self.capacity - count)
+            self._data[:, :keep] = self._data[:, self._size - keep:self._size]
+            self._size = keep
+        self._data[:, self._size:self._size + count] = samples
+        self._size += count
+
+    def interpolate(self, times: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the positions x, y at the given host times (clamped to the buffered span)."""
+        t, x, y = self._data[:, :self._size]
+        return np.interp(times, t, x), np.interp(times, t, y)
+
+class SimulatedEncoder:
+    """Encoder stand-in moving along a serpentine raster.
+
+    The probe moves along x with the given speed and steps by pitch in y at the end of
+    every line. With a y period (pipe circumference) y wraps around instead of ending.
+
+    Args:
+        length: Length of a line along x in mm
+        pitch: Step in y between two lines in mm
+        speed: Speed along x in mm/s
+        start_time: Host time of the start of the scan
+        y_period: Circumference in mm if y is periodic
+    """
+    def __init__(self, length: float, pitch: float, speed: float, start_time: float = 0.0,
+                 y_period: Optional[float] = None):
+        self.length = length
+        self.pitch = pitch
+        self.speed = speed
+        self.start_time = start_time
+        self.y_period = y_period
+
+    def position(self, t) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the positions x, y at the host times t."""
+        distance = np.maximum(np.asarray(t, dtype=float) - self.start_time, 0) * self.speed
+        line, along = np.divmod(distance, self.length)
+        x = np.where(line % 2 == 0, along, self.length - along)
+        y = line * self.pitch
+        if self.y_period is not None:
+            y = y % self.y_period
+        return x, y
+
+class ThicknessGrid:
+    """2D grid of thickness statistics.
+
+    Args:
+        x_range: (min, max) of the grid along x in mm
+        y_range: (min, max) of the grid along y in mm
+        cell_size: Edge length of a cell in mm
+        y_periodic: Wrap y into y_range, e.g. for the circumference of a pipe
+    """
+    def __init__(self, x_range: Tuple[float, float], y_range: Tuple[float, float], cell_size: float,
+                 y_periodic: bool = False):
+        self.x_min, x_max = x_range
+        self.y_min, y_max = y_range
+        self.cell_size = cell_size
+        self.y_periodic = y_periodic
+        self.shape = (math.ceil((y_max - self.y_min) / cell_size), math.ceil((x_max - self.x_min) / cell_size))
+        self._min = np.full(self.shape, np.inf, dtype=np.float32)
+        self._sum = np.zeros(self.shape)
+        self._count = np.zeros(self.shape, dtype=np.int64)
+        self.outside = 0 # values outside the grid
+
+    def add(self, x: np.ndarray, y: np.ndarray, thickness: np.ndarray) -> int:
+        """Add thickness values at positions x, y and return the number binned.
+
+        Args:
+            x: Positions along x in mm
+            y: Positions along y in mm
+            thickness: Thickness values in mm
+        """
+        ny, nx = self.shape
+        ix = np.floor((np.asarray(x) - self.x_min) / self.cell_size).astype(np.intp)
+        iy = np.floor((np.asarray(y) - self.y_min) / self.cell_size).astype(np.intp)
+        if self.y_periodic:
+            iy %= ny
+        inside = (ix >= 0) & (ix < nx) & (iy >= 0) & (iy < ny)
+        thickness = np.asarray(thickness)
+        if not inside.all():
+            self.outside += int(inside.size - np.count_nonzero(inside))
+            ix, iy, thickness = ix[inside], iy[inside], thickness[inside]
+        cells = (iy, ix)
+        np.minimum.at(self._min, cells, thickness)
+        np.add.at(self._sum, cells, thickness)
+        np.add.at(self._count, cells, 1)
+        return len(thickness)
+
+    @property
+    def count(self) -> np.ndarray:
+        """Number of values per cell."""
+        return self._count
+
+    @property
+    def min(self) -> np.ndarray:
+        """Minimum thickness per cell in mm, NaN for empty cells."""
+        return np.where(self._count > 0, self._min, np.nan)
+
+    @property
+    def mean(self) -> np.ndarray:
+        """Mean thickness per cell in mm, NaN for empty cells."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self._sum / self._count
+
+    @property
+    def extent(self) -> Tuple[float, float, float, float]:
+        """Extent (left, right, bottom, top) of the grid in mm, e.g. for matplotlib imshow()."""
+        ny, nx = self.shape
+        return (self.x_min, self.x_min + nx * self.cell_size, self.y_min, self.y_min + ny * self.cell_size)
+
+    def clear(self) -> None:
+        self._min.fill(np.inf)
+        self._sum.fill(0)
+        self._count.fill(0)
+        self.outside = 0
+
+class ThicknessMapper:
+    """Fuse results with encoder positions by host time and bin them into a grid.
+
+    Results wait in a bounded queue until the encoder track covers their time, then they
+    are binned in one batch. Results older than the track are counted as unmatched, results
+    pushed out of the full queue as dropped.
+
+    Args:
+        track: Encoder position samples
+        grid: Thickness grid
+        max_pending: Maximum number of results waiting for positions, the oldest are dropped
+        batch_size: Bin results once this many are ready
+    """
+    def __init__(self, track: EncoderTrack, grid: ThicknessGrid, max_pending: int = 10000, batch_size: int = 64):
+        self.track = track
+        self.grid = grid
+        self.batch_size = batch_size
+        self._pending: Deque[Tuple[float, float]] = deque(maxlen=max_pending) # (host time, thickness)
+        self.binned = 0
+        self.invalid = 0 # results without contact or thickness
+        self.unmatched = 0 # results without position samples around their time
+        self.dropped = 0 # results pushed out of the full queue
+
+    def add_position(self, t, x, y) -> None:
+        """Add encoder position samples, see EncoderTrack.add()."""
+        self.track.add(t, x, y)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def add_result(self, result: Result, host_time: Optional[float] = None) -> None:
+        """Queue a new result.
+
+        Args:
+            result: Measurement result
+            host_time: Host time of the result, by default result.host_time or time.time()
+        """
+        if not has_thickness(result):
+            self.invalid += 1
+            return
+        if host_time is None:
+            host_time = time.time() if result.host_time is None else result.host_time
+        if len(self._pending) == self._pending.maxlen:
+            self.dropped += 1
+        self._pending.append((host_time, result.thickness))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self, final: bool = False) -> int:
+        """Bin all results covered by the encoder track and return their number.
+
+        Args:
+            final: Bin the remaining results at the last known position as well
+        """
+        if not self._pending or len(self.track) == 0:
+            return 0
+        pending = np.array(self._pending)
+        first, last = self.track.span
+        ready = pending[:, 0] <= last if not final else np.ones(len(pending), dtype=bool)
+        ready_count = int(np.count_nonzero(ready))
+        if ready_count == 0:
+            return 0
+        # results are queued in time order, the ready ones are at the front
+        for _ in range(ready_count):
+            self._pending.popleft()
+        times, thickness = pending[:ready_count, 0], pending[:ready_count, 1]
+        matched = times >= first
+        self.unmatched += int(ready_count - np.count_nonzero(matched))
+        x, y = self.track.interpolate(times[matched])
+        binned = self.grid.add(x, y, thickness[matched])
+        self.binned += binned
+        return binned
+
+def main() -> None:
+    """Simulate a plate scan with a corrosion pit and report the binning rate."""
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout, format='%(message)s')
+    encoder = SimulatedEncoder(length=500, pitch=5, speed=100)
+    grid = ThicknessGrid((0, 500), (0, 300), cell_size=5)
+    mapper = ThicknessMapper(EncoderTrack(), grid)
+    rng = np.random.default_rng(0)
+
+    # 60 lines of 5 s: results every 4 ms, encoder samples every 10 ms
+    duration, result_period, encoder_period = 300.0, 0.004, 0.010
+    chunk = 10.0
+    start = time.perf_counter()
+    for t0 in np.arange(0, duration, chunk):
+        encoder_times = np.arange(t0, t0 + chunk, encoder_period)
+        mapper.add_position(encoder_times, *encoder.position(encoder_times))
+        result_times = np.arange(t0, t0 + chunk, result_period)
+        x, y = encoder.position(result_times)
+        thickness = 10 - 3 * np.exp(-((x - 250) ** 2 + (y - 150) ** 2) / 400) + rng.normal(0, 0.05, len(x))
+        for t, d in zip(result_times, thickness):
+            mapper.add_result(Result('measurement_result', True, 100, 0, 20, d, ''), host_time=t)
+    mapper.flush(final=True)
+    elapsed = time.perf_counter() - start
+
+    covered = np.count_nonzero(grid.count)
+    logger.info(f'{mapper.binned} results binned in {elapsed:.2f} s ({mapper.binned / elapsed:.0f} results/s), '
+                f'{covered}/{grid.count.size} cells covered, {mapper.unmatched} unmatched, {mapper.dropped} dropped, '
+                f'{grid.outside} outside')
+    iy, ix = np.unravel_index(np.nanargmin(grid.min), grid.shape)
+    logger.info(f'Minimum thickness {np.nanmin(grid.min):.2f} mm at x = {grid.x_min + (ix + 0.5) * grid.cell_size} mm, '
+                f'y = {grid.y_min + (iy + 0.5) * grid.cell_size} mm, mean {np.nanmean(grid.mean):.2f} mm')
+
+if __name__ == '__main__':
+    main()
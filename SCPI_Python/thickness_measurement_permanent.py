@@ -5,6 +5,7 @@ Features:
 - SCPI communication setup
 - Manual or automatic calibration
 - Continuous thickness measurement in automatic mode
+- Outlier-robust filtering of the thickness readings
 - Error queue monitoring
 
 Usage:
@@ -15,11 +16,13 @@ Usage:
 
 import sys
 import time
-import matplotlib.pyplot as plt
 import pyvisa as visa
 import logging
 
-from common_functions import *
+from a1570.common_functions import *
+from a1570.session_recording import open_session
+from a1570.calibration_cache import CalibrationStore, apply_calibration, read_calibration
+from a1570.thickness_filters import KalmanFilter
 
 ### Logger Setup ###
 # Configure logging to show info level messages
@@ -33,6 +36,10 @@ logger.addHandler(stream_handler)
 # True = Interactive calibration during runtime
 # False = Use predefined calibration values
 is_manual_calibration = True
+# Calibration cache:
+# True = Reuse the last calibration of this device, probe type and firmware
+# False = Always calibrate or use predefined calibration values
+use_calibration_cache = True
 
 logger.info('Initialize SCPI for A1570...')
 
@@ -42,8 +49,7 @@ ip: str = '192.168.0.11'  # Device IP address
 port: int = 5025          # Default SCPI port
 
 # Initialize VISA connection
-rm = visa.ResourceManager()
-inst = rm.open_resource(f'tcpip::{ip}::{str(port)}::SOCKET')
+inst = open_session(f'tcpip::{ip}::{str(port)}::SOCKET')
 inst.encoding = 'iso-8859-1'
 inst.timeout = 5000        # Response timeout in milliseconds
 inst.read_termination = '\r\n'
@@ -91,11 +97,19 @@ inst.write(f'SENSe:PROBe:TYPE "{pt}"')
 answ = inst.query('SENSe:PROBe:TYPE?')
 assert pt == answ, f'Failed on setting the probe type to {pt}. Received {answ}'
 
+# look up a stored calibration of this probe, it is applied in one batched transfer
+# and replaces both calibration steps below
+calibration_store = CalibrationStore('calibration_cache')
+calibration = calibration_store.load(idn, pt) if use_calibration_cache else None
+if calibration is not None:
+    logger.info(f"applying stored calibration {calibration_store.path_for_idn(idn, pt)}")
+    apply_calibration(inst, calibration)
+
 
 ### step 1: calibrate probe in air
 
 ### option 1: calibrate probe in air to compute dead zones internally
-if is_manual_calibration:
+if calibration is None and is_manual_calibration:
     # wait till user confirms that the probe calibration should be started
     input("Calibration step 1. Take the probe in hand and press Enter to continue...")
 
@@ -106,7 +120,7 @@ if is_manual_calibration:
     time.sleep(6)
 
 ### option 2: set dead zones from top without calibration
-else:
+elif calibration is None:
     # set dead zones [gain:dead_zone]
     dz = '0:345;5:269;10:226;15:226;20:185;25:236;30:292;35:295;40:295'
     logger.info(f"setting dead zones = '{dz}'")
@@ -126,7 +140,7 @@ logger.info(','.join([str(dz[1]) for dz in dead_zones]))
 
 ### option 1: calibrate probe on calibration object to compute the probe delay
 # ! put the probe to a calibration block prior starting this step
-if is_manual_calibration:
+if calibration is None and is_manual_calibration:
     # wait till user confirms that the calibration is done
     input("Calibration step 2. Put the probe on calibration object and press Enter to continue...")
 
@@ -137,7 +151,7 @@ if is_manual_calibration:
     time.sleep(5)
 
 ### option 2: set probe delay from top without calibration
-else:
+elif calibration is None:
     # set probe delay [us]
     pd = 0.6
     inst.write(f'SENSe:PROBe:DELay:PROCessing {pd}')
@@ -148,8 +162,13 @@ else:
 answ = inst.query('PROB:DEL?')
 logger.info(f"Probe delay = {answ}")
 
-# wait till user confirms that the calibration is done
-input("Calibration done. Press Enter to continue to start thickness measurements...")
+# store calibration for the next start
+if calibration is None and is_manual_calibration:
+    calibration_store.save(idn, pt, read_calibration(inst, include_eddy_and_noise=False))
+
+# wait till user confirms that the calibration is done (skipped with a cached calibration)
+if calibration is None:
+    input("Calibration done. Press Enter to continue to start thickness measurements...")
 
 ### step 3: measure thickness
 # set sound velocity [m/s]
@@ -162,6 +181,8 @@ logger.info(f"Sound velocity = {answ}")
 last_counter = -1
 # sleeping time between result polls
 sleeping_time = 2 # seconds
+# single bad readings are rejected, contact_quality weights every reading
+thickness_filter = KalmanFilter()
 inst.write('STAR:MEAS')
 time.sleep(2)
 # poll for some time
@@ -172,12 +193,14 @@ for i in range(1000):
     # process thickness if the counter changed
     if last_counter != result_obj.counter:
         last_counter = result_obj.counter
-        if( not result_obj.contact or
-            result_obj.thickness==65535 or result_obj.thickness==-1):
+        if not has_thickness(result_obj):
             logger.info(f"no thickness found")
         else:
             logger.info(f"thickness = {result_obj.thickness}mm")
-
+        filtered = thickness_filter.update(result_obj)
+        if filtered.thickness is not None:
+            logger.info(f"filtered thickness = {filtered.thickness:.3f}mm ({filtered.confidence:.0%} within "
+                        f"{thickness_filter.tolerance}mm{', outlier rejected' if filtered.outlier else ''})")
 
     time.sleep(sleeping_time)
 
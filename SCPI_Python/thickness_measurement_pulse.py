@@ -1,10 +1,16 @@
 import sys
 import time
-import matplotlib.pyplot as plt
 import pyvisa as visa
 import logging
 
-from common_functions import *
+from a1570.common_functions import *
+from a1570.session_recording import open_session
+from a1570.calibration_cache import CalibrationStore, apply_calibration, read_calibration
+from a1570.device_arbiter import PRIORITY_RESULT, DeviceArbiter
+from a1570.health_telemetry import HealthSampler, default_channels
+from a1570.result_sinks import AsyncSink, CsvSink
+from a1570.clock_correlation import ClockCorrelator
+from a1570.thickness_filters import KalmanFilter
 
 ### initializing
 # set up logging
@@ -16,14 +22,17 @@ logger.addHandler(stream_handler)
 
 # switch to True if you want to calibrate manually or False to set calibration values from top without calibration
 is_manual_calibration = True
+# switch to True to reuse the last calibration of this device, probe type and firmware from the calibration cache
+use_calibration_cache = True
+# file to store every new result in, written in the background, e.g. 'results.csv' (None to only log results)
+results_file = None
 
 logger.info('Initialize SCPI for A1570...')
 
 # ip of the device and port
 ip: str = '192.168.0.1'
 port: int = 5025
-rm = visa.ResourceManager()
-inst = rm.open_resource(f'tcpip::{ip}::{str(port)}::SOCKET')
+inst = open_session(f'tcpip::{ip}::{str(port)}::SOCKET')
 inst.encoding = 'iso-8859-1'
 inst.timeout = 5000 # miliseconds
 inst.read_termination = '\r\n'
@@ -70,11 +79,19 @@ inst.write(f'SENSe:PROBe:TYPE "{pt}"')
 answ = inst.query('SENSe:PROBe:TYPE?')
 assert pt == answ, f'Failed on setting the probe type to {pt}. Received {answ}'
 
+# look up a stored calibration of this probe, it is applied in one batched transfer
+# and replaces both calibration steps below
+calibration_store = CalibrationStore('calibration_cache')
+calibration = calibration_store.load(idn, pt) if use_calibration_cache else None
+if calibration is not None:
+    logger.info(f"applying stored calibration {calibration_store.path_for_idn(idn, pt)}")
+    apply_calibration(inst, calibration)
+
 
 ### step 1: calibrate probe in air
 
 ## option 1: calibrate probe in air to compute dead zones, eddy array and noise parameters internally
-if is_manual_calibration:
+if calibration is None and is_manual_calibration:
     # wait till user confirms that the probe calibration should be started
     input("Calibration step 1. Take the probe in hand and press Enter to continue...")
 
@@ -85,7 +102,7 @@ if is_manual_calibration:
     time.sleep(6)
 
 ## option 2: set parameters from top without calibration
-else:
+elif calibration is None:
     # set dead zones [gain:dead_zone]
     dz = '0:345;5:269;10:226;15:226;20:185;25:236;30:292;35:295;40:295'
     logger.info(f"setting dead zones = '{dz}'")
@@ -139,7 +156,7 @@ logger.info(','.join([str(dz[1]) for dz in dead_zones]))
 
 ## option 1: calibrate probe on calibration object to compute the probe delay
 # ! put the probe to a calibration block prior starting this step
-if is_manual_calibration:
+if calibration is None and is_manual_calibration:
     # wait till user confirms that the calibration is done
     input("Calibration step 2. Put the probe on calibration object and press Enter to continue...")
     # start calibration
@@ -149,7 +166,7 @@ if is_manual_calibration:
     time.sleep(5)
 
 ## option 2: set probe delay manually
-else:
+elif calibration is None:
     # set probe delay [us]
     pd = 0.21
     inst.write(f'SENSe:PROBe:DELay:PROCessing {pd}')
@@ -160,8 +177,13 @@ else:
 answ = inst.query('PROB:DEL?')
 logger.info(f"Probe delay = {answ}")
 
-# wait till user confirms that the calibration is done
-input("Calibration done. Press Enter to continue to start thickness measurements...")
+# store calibration for the next start
+if calibration is None and is_manual_calibration:
+    calibration_store.save(idn, pt, read_calibration(inst, include_eddy_and_noise=True))
+
+# wait till user confirms that the calibration is done (skipped with a cached calibration)
+if calibration is None:
+    input("Calibration done. Press Enter to continue to start thickness measurements...")
 
 ### step 3: measure thickness
 ## set sound velocity [m/s]
@@ -187,7 +209,6 @@ assert 'ON' == answ, f'Failed on setting the software averaging enable to ON. Re
 
 
 # poll result for some time
-last_counter = -1
 # sleeping time between result polls
 sleeping_time = 2 # seconds
 
@@ -200,42 +221,58 @@ logger.info(f'Trigger interval: {answ} seconds')
 
 inst.write('STAR:MEAS')
 time.sleep(2)
+
+# share the connection with the health telemetry sampler, it polls probe temperature,
+# battery and channel status in the background and logs warnings when a threshold is crossed
+arbiter = DeviceArbiter(inst)
+health = HealthSampler(arbiter, default_channels(temperature_interval=60))
+health.start()
+result_sink = AsyncSink(CsvSink(results_file)) if results_file else None
+# the result timestamp has one second resolution, the host time of each result is estimated
+# from the poll timing and the counter. With software averaging the counter does not follow
+# the trigger interval, so the period is learned from the results instead of assumed
+clock = ClockCorrelator()
+# single bad readings are rejected, contact_quality weights every reading
+thickness_filter = KalmanFilter()
 for i in range(10):
-    answ = inst.query('FETCh:RESult:MEASure?')
+    send_time = time.time()
+    answ = arbiter.query('FETCh:RESult:MEASure?', PRIORITY_RESULT)
     result_obj = parse_measurement_result(answ)
     # if new thickness is available, device will increment counter in result class 
     # process thickness if the counter changed
-    if last_counter != result_obj.counter:
-        last_counter = result_obj.counter
-        if( not result_obj.contact or
-            result_obj.thickness==65535 or result_obj.thickness==-1):
+    if clock.observe(result_obj, send_time, time.time()):
+        if not has_thickness(result_obj):
             logger.info(f"no thickness found")
         else:
             logger.info(f"thickness = {result_obj.thickness}mm")
-
-    # request temperature of the EMAT probe
-    # it is not necessary to check the temperature every time
-    # it can be done once per minute or so
-    answ = inst.query('STATus:PROBe:TEMPerature?')
-    # temperature is in Celsius degrees
-    temperature = float(answ)
-    # very low temperature may indicate that the pulse magnet probe is not connected to the device
-    if temperature < -60:
-        logger.warning(f"Probe temperature = {temperature}°C. Check probe connection.")
-    else:
-        # check if the temperature is too high
-        temperatureWarning = 50 # warning threshold, when the measurement is slowed down
-        temperatureError = 75 # error threshold, when the measurement is stopped automatically by the device
-        # log the temperature
-        if temperature > temperatureError:
-            logger.warning(f"Probe temperature = {temperature}°C. No measurements possible until the probe cooled down.")
-        elif temperature > temperatureWarning:
-            logger.warning(f"Probe temperature = {temperature}°C. Measurements will be slowed down.")
-        else:
-            logger.info(f"Probe temperature = {temperature}°C.")            
+        filtered = thickness_filter.update(result_obj)
+        if filtered.thickness is not None:
+            logger.info(f"filtered thickness = {filtered.thickness:.3f}mm ({filtered.confidence:.0%} within "
+                        f"{thickness_filter.tolerance}mm{', outlier rejected' if filtered.outlier else ''})")
+        if result_obj.host_time_error is not None:
+            host_time = result_obj.host_time
+            stamp = time.strftime('%H:%M:%S', time.localtime(host_time)) + f'{host_time % 1:.3f}'[1:]
+            logger.info(f"measured at {stamp} ± {result_obj.host_time_error * 1000:.0f} ms (device {result_obj.timestamp})")
+        if result_sink is not None:
+            result_sink.put(result_obj)
+
+    # temperature of the EMAT probe from the last background reading, no query needed
+    temperature = health.latest('probe_temperature')
+    logger.info(f"Probe temperature = {temperature.value}°C ({temperature.age:.0f} s ago, {temperature.level})")
 
     time.sleep(sleeping_time)
 
+health.stop()
+arbiter.close()
+if result_sink is not None:
+    result_sink.close()
+    logger.info(f"results: {result_sink.statistics}")
+logger.info(f"device arbiter: {arbiter.statistics()}")
+logger.info(f"result period {clock.period} s, device clock offset {clock.device_clock_offset[0]} s")
+# the drift is known after the second offset window, i.e. in longer runs
+if clock.drift_ppm is not None:
+    logger.info(f"device clock drift {clock.drift_ppm:.1f} ± {clock.drift_error_ppm:.1f} ppm")
+
 # stop measurement
 inst.write('STOP:MEAS')
 
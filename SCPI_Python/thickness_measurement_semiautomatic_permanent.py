@@ -14,7 +14,9 @@ import numpy as np
 import pyvisa as visa
 import logging
 
-from common_functions import *
+from a1570.common_functions import *
+from a1570.session_recording import open_session
+from a1570.dead_zones import DeadZoneModel
 
 ### Device Communication Setup ###
 # set up logging
@@ -29,13 +31,15 @@ logger.info('Initialize SCPI for A1570...')
 # Device network configuration
 ip: str = '192.168.0.1'  # Default device IP
 port: int = 5025         # Default SCPI port
-rm = visa.ResourceManager()
-inst = rm.open_resource(f'tcpip::{ip}::{str(port)}::SOCKET')
+inst = open_session(f'tcpip::{ip}::{str(port)}::SOCKET')
 inst.encoding = 'iso-8859-1'
 inst.timeout = 5000      # milliseconds - time to wait for device response
 inst.read_termination = '\r\n'
 inst.write_termination = '\r\n'
 
+# Region of interest mode: fetch only the samples covering the strobe window
+use_roi = True
+
 # Clear error queue before starting
 while True:
     err_num, err_msg = read_error_queue(inst)
@@ -119,40 +123,62 @@ def measurement_strobe_permanent():
     strobe_begin = 140 # 0-8191 samples
     strobe_width = 250 # 0-8191 samples
     
-    set_strobe_parameters(inst, strobe_level, strobe_begin, strobe_width)
-
-    ## select algorithm to start:
-    # peak to peak algorithm
-    # inst.write('STAR:P2Peak')            
-    # maximum in strobe algorithm
-    inst.write('STAR:MAXStrobe')
+    # the strobe window must begin after the dead zone of the probe at the gain set above
+    dead_zones = DeadZoneModel.from_string(inst.query('SENSe:DEZones?'))
+    set_strobe_parameters(inst, strobe_level, strobe_begin, strobe_width, dead_zones)
 
-    last_counter = -1
-    # loop for some time
-    for i in range(10):
+    # transfer only the samples up to the end of the strobe window (region of interest)
+    # this reduces the fetch time of every vector, plots show the shorter vector
+    if use_roi:
+        data_length = set_data_length(inst, roi_data_length(strobe_begin, strobe_width))
+        logger.info(f"ROI data length = {data_length} samples")
 
-        answ = inst.query('FETCh:RESult:MEASure?')
+    try:
+        ## select algorithm to start:
+        # peak to peak algorithm
+        # inst.write('STAR:P2Peak')            
+        # maximum in strobe algorithm
+        inst.write('STAR:MAXStrobe')
+
+        last_counter = -1
+        # counts missed and repeated vectors by the vector index in the header
+        frame_tracker = FrameTracker()
+        fetch_time = 0 # seconds spent fetching vectors
+        # loop for some time
+        for i in range(10):
+
+            answ = inst.query('FETCh:RESult:MEASure?')
         
-        result_obj = parse_measurement_result(answ)
-        # if new thickness is available, device will increment counter in result class 
-        # process thickness if the counter changed
-        if last_counter != result_obj.counter:
-            last_counter = result_obj.counter
-            if( not result_obj.contact or
-                result_obj.thickness==65535 or result_obj.thickness==-1):
-                logger.info(f"no thickness found")
-            else:
-                logger.info(f"thickness = {result_obj.thickness}mm")
-
-
-        arr_vector = get_vector_from_SCPI(inst)
-        plt.plot(arr_vector)
-        plt.show()
-
-        time.sleep(sleeping_time)        
-
-    # stop measurement
-    inst.write('STOP')
+            result_obj = parse_measurement_result(answ)
+            # if new thickness is available, device will increment counter in result class 
+            # process thickness if the counter changed
+            if last_counter != result_obj.counter:
+                last_counter = result_obj.counter
+                if not has_thickness(result_obj):
+                    logger.info(f"no thickness found")
+                else:
+                    logger.info(f"thickness = {result_obj.thickness}mm")
+
+
+            fetch_start = time.perf_counter()
+            header, arr_vector = get_frame_from_SCPI(inst)
+            fetch_time += time.perf_counter() - fetch_start
+            # plot only vectors not seen before
+            if frame_tracker.update(header['vector_index']):
+                plt.plot(arr_vector)
+                plt.show()
+
+            time.sleep(sleeping_time)        
+
+        logger.info(f"vectors: {frame_tracker}")
+        logger.info(f"mean fetch latency = {fetch_time / frame_tracker.fetched * 1000:.1f} ms for {len(arr_vector)} samples")
+    finally:
+        # stop measurement
+        inst.write('STOP')
+
+        # restore full vector length, also if the measurement failed
+        if use_roi:
+            set_data_length(inst, DATA_LENGTH_MAX)
 
 
 if __name__ == '__main__':
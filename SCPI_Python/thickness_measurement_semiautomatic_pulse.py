@@ -7,14 +7,19 @@ This script demonstrates:
 - Peak detection using either peak-to-peak or maximum in strobe algorithms
 """
 
+import queue
 import sys
+import threading
 import time
 import matplotlib.pyplot as plt
 import numpy as np
 import pyvisa as visa
 import logging
 
-from common_functions import *
+from a1570.common_functions import *
+from a1570.session_recording import open_session
+from a1570.dead_zones import DeadZoneModel
+from a1570.device_arbiter import PRIORITY_RESULT, PRIORITY_TELEMETRY, PRIORITY_VECTOR, DeviceArbiter
 
 ### Device Communication Setup ###
 # set up logging
@@ -29,13 +34,15 @@ logger.info('Initialize SCPI for A1570...')
 # Device network configuration
 ip: str = '192.168.0.1'  # Default device IP
 port: int = 5025         # Default SCPI port
-rm = visa.ResourceManager()
-inst:visa.Resource = rm.open_resource(f'tcpip::{ip}::{str(port)}::SOCKET')
+inst:visa.Resource = open_session(f'tcpip::{ip}::{str(port)}::SOCKET')
 inst.encoding = 'iso-8859-1'
 inst.timeout = 5000      # milliseconds - time to wait for device response
 inst.read_termination = '\r\n'
 inst.write_termination = '\r\n'
 
+# Region of interest mode: fetch only the samples covering the strobe window
+use_roi = True
+
 # Clear error queue before starting
 while True:
     err_num, err_msg = read_error_queue(inst)
@@ -121,60 +128,107 @@ def measurement_strobe_pulse():
     strobe_begin = 300 # 0-8191 samples
     strobe_width = 400 # 0-8191 samples
     
-    set_strobe_parameters(inst, strobe_level, strobe_begin, strobe_width)
-
-    ## select algorithm to start:
-    # peak to peak algorithm
-    # inst.write('STAR:P2Peak')            
-    # maximum in strobe algorithm
-    inst.write('STAR:MAXStrobe')
+    # the strobe window must begin after the dead zone of the probe at the gain set above
+    dead_zones = DeadZoneModel.from_string(inst.query('SENSe:DEZones?'))
+    set_strobe_parameters(inst, strobe_level, strobe_begin, strobe_width, dead_zones)
 
-    last_counter = -1
-    # loop for some time
-    for i in range(10):
+    # transfer only the samples up to the end of the strobe window (region of interest)
+    # this reduces the fetch time of every vector, plots show the shorter vector
+    if use_roi:
+        data_length = set_data_length(inst, roi_data_length(strobe_begin, strobe_width))
+        logger.info(f"ROI data length = {data_length} samples")
 
-        answ = inst.query('FETCh:RESult:MEASure?')
+    try:
+        ## select algorithm to start:
+        # peak to peak algorithm
+        # inst.write('STAR:P2Peak')            
+        # maximum in strobe algorithm
+        inst.write('STAR:MAXStrobe')
+
+        # from now on all threads use the device through the arbiter
+        arbiter = DeviceArbiter(inst)
+        stop_event = threading.Event()
+        new_frames = queue.Queue()
+        # counts missed and repeated vectors by the vector index in the header
+        frame_tracker = FrameTracker()
+        fetch_time = 0 # seconds spent fetching vectors
+
+        def fetch_vectors():
+            # fetch vectors in the background, results are served first by the arbiter
+            nonlocal fetch_time
+            while not stop_event.is_set():
+                fetch_start = time.perf_counter()
+                header, arr_vector = arbiter.fetch_frame(PRIORITY_VECTOR)
+                fetch_time += time.perf_counter() - fetch_start
+                # hand over only vectors not seen before
+                if frame_tracker.update(header['vector_index']):
+                    new_frames.put(arr_vector)
+                time.sleep(sleeping_time)
+
+        vector_thread = threading.Thread(target=fetch_vectors, daemon=True)
+        vector_thread.start()
+
+        try:
+            last_counter = -1
+            # loop for some time
+            for i in range(10):
+
+                answ = arbiter.query('FETCh:RESult:MEASure?', PRIORITY_RESULT)
         
-        result_obj = parse_measurement_result(answ)
-        # if new thickness is available, device will increment counter in result class 
-        # process thickness if the counter changed
-        if last_counter != result_obj.counter:
-            last_counter = result_obj.counter
-            if( not result_obj.contact or
-                result_obj.thickness==65535 or result_obj.thickness==-1):
-                logger.info(f"no thickness found")
-            else:
-                logger.info(f"thickness = {result_obj.thickness}mm")
-
-
-        arr_vector = get_vector_from_SCPI(inst)
-        plt.plot(arr_vector)
-        plt.show()
-        # request temperature of the EMAT probe
-        # it is not necessary to check the temperature every time
-        # it can be done once per minute or so
-        answ = inst.query('STATus:PROBe:TEMPerature?')
-        # temperature is in Celsius degrees
-        temperature = float(answ)
-        # very low temperature may indicate that the pulse magnet probe is not connected to the device
-        if temperature < -60:
-            logger.warning(f"Probe temperature = {temperature}°C. Check probe connection.")
-        else:
-            # check if the temperature is too high
-            temperatureWarning = 50 # warning threshold, when the measurement is slowed down
-            temperatureError = 75 # error threshold, when the measurement is stopped automatically by the device
-            # log the temperature
-            if temperature > temperatureError:
-                logger.warning(f"Probe temperature = {temperature}°C. No measurements possible until the probe cooled down.")
-            elif temperature > temperatureWarning:
-                logger.warning(f"Probe temperature = {temperature}°C. Measurements will be slowed down.")
-            else:
-                logger.info(f"Probe temperature = {temperature}°C.")            
-
-        time.sleep(sleeping_time)        
-
-    # stop measurement
-    inst.write('STOP')
+                result_obj = parse_measurement_result(answ)
+                # if new thickness is available, device will increment counter in result class 
+                # process thickness if the counter changed
+                if last_counter != result_obj.counter:
+                    last_counter = result_obj.counter
+                    if not has_thickness(result_obj):
+                        logger.info(f"no thickness found")
+                    else:
+                        logger.info(f"thickness = {result_obj.thickness}mm")
+
+                # plot the latest new vector, plotting must stay in the main thread
+                arr_vector = None
+                while not new_frames.empty():
+                    arr_vector = new_frames.get()
+                if arr_vector is not None:
+                    plt.plot(arr_vector)
+                    plt.show()
+                # request temperature of the EMAT probe
+                # it is not necessary to check the temperature every time
+                # it can be done once per minute or so
+                answ = arbiter.query('STATus:PROBe:TEMPerature?', PRIORITY_TELEMETRY)
+                # temperature is in Celsius degrees
+                temperature = float(answ)
+                # very low temperature may indicate that the pulse magnet probe is not connected to the device
+                if temperature < -60:
+                    logger.warning(f"Probe temperature = {temperature}°C. Check probe connection.")
+                else:
+                    # check if the temperature is too high
+                    temperatureWarning = 50 # warning threshold, when the measurement is slowed down
+                    temperatureError = 75 # error threshold, when the measurement is stopped automatically by the device
+                    # log the temperature
+                    if temperature > temperatureError:
+                        logger.warning(f"Probe temperature = {temperature}°C. No measurements possible until the probe cooled down.")
+                    elif temperature > temperatureWarning:
+                        logger.warning(f"Probe temperature = {temperature}°C. Measurements will be slowed down.")
+                    else:
+                        logger.info(f"Probe temperature = {temperature}°C.")            
+
+                time.sleep(sleeping_time)        
+        finally:
+            # the background thread must not use the device after the measurement
+            stop_event.set()
+            vector_thread.join()
+            arbiter.close()
+        logger.info(f"device arbiter: {arbiter.statistics()}")
+        logger.info(f"vectors: {frame_tracker}")
+        logger.info(f"mean fetch latency = {fetch_time / max(frame_tracker.fetched, 1) * 1000:.1f} ms")
+    finally:
+        # stop measurement
+        inst.write('STOP')
+
+        # restore full vector length, also if the measurement failed
+        if use_roi:
+            set_data_length(inst, DATA_LENGTH_MAX)
 
 
 if __name__ == '__main__':